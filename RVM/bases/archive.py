@@ -0,0 +1,124 @@
+# an on disk archive for finished trials, keeps them out of the project settings
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+from RVM.bases.base import TrialBase, atomicWrite
+
+log = logging.getLogger()
+
+ARCHIVE_DIR_NAME = "archive"
+INDEX_FILE_NAME = "index.json"
+ARCHIVABLE_STATES = ("Finished", "Stopped", "Failed")
+
+
+class TrialArchive:
+    """Finished trials that were moved out of the project settings.
+
+    The archive is a folder of segment files, each written once with the trials archived at that time, and an index holding the checksum, count and time span of every segment. Only the index is read until the trials are asked for, then all segments are loaded and cached. Archived trials are read-only, there is no way to change a segment once it is written.
+
+    Parameters
+    ----------
+    project_location : str
+        The project directory, the archive lives in the ``archive`` folder in it
+    """
+
+    def __init__(self, project_location):
+        self.dir_path = os.path.join(str(project_location), ARCHIVE_DIR_NAME)
+        self._index = None
+        self._trials = None
+
+    @property
+    def index(self) -> dict:
+        """segment file name -> {"sha256", "count", "first", "last"}"""
+        if self._index is None:
+            try:
+                with open(os.path.join(self.dir_path, INDEX_FILE_NAME), "r") as file:
+                    self._index = json.load(file)
+            except FileNotFoundError:
+                self._index = {}
+        return self._index
+
+    @property
+    def loaded(self) -> bool:
+        return self._trials is not None
+
+    def __len__(self):
+        return sum(segment["count"] for segment in self.index.values())
+
+    def trials(self) -> tuple:
+        """Get every archived trial, the segments are read the first time this is called"""
+        if self._trials is None:
+            trials = []
+            for file_name, segment in self.index.items():
+                trials.extend(self._loadSegment(file_name, segment))
+            self._trials = tuple(trials)
+        return self._trials
+
+    def getTrialFromId(self, uid):
+        for trial in self.trials():
+            if trial.uid == uid:
+                return trial
+        return None
+
+    def add(self, trials: list[TrialBase]):
+        """Write the trials to a new segment
+
+        Parameters
+        ----------
+        trials : list[TrialBase]
+            The trials to archive, they should be removed from the project settings after this returns
+        """
+        if len(trials) == 0:
+            return
+        if not os.path.exists(self.dir_path):
+            os.makedirs(self.dir_path)
+        file_name = (
+            f"trials_{datetime.datetime.now().strftime('%Y-%m-%d_%H%M%S_%f')}.json"
+        )
+        data = ("[" + ",\n".join(trial.json() for trial in trials) + "]").encode(
+            "utf-8"
+        )
+        with open(os.path.join(self.dir_path, file_name), "wb") as file:
+            file.write(data)
+        times = [self._trialTime(trial) for trial in trials]
+        self.index[file_name] = {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "count": len(trials),
+            "first": min(times).isoformat(),
+            "last": max(times).isoformat(),
+        }
+        # the segment is written before the index, so a crash leaves at most an unused segment
+        atomicWrite(
+            os.path.join(self.dir_path, INDEX_FILE_NAME),
+            json.dumps(self.index, indent=4).encode("utf-8"),
+        )
+        if self._trials is not None:
+            self._trials = self._trials + tuple(trials)
+        log.info(f"Archived {len(trials)} trials to {file_name}")
+
+    def _loadSegment(self, file_name, segment) -> list[TrialBase]:
+        try:
+            with open(os.path.join(self.dir_path, file_name), "rb") as file:
+                data = file.read()
+        except OSError as e:
+            log.warning(f"Could not read archive segment {file_name}: {e}")
+            return []
+        if hashlib.sha256(data).hexdigest() == segment["sha256"]:
+            return [TrialBase.fromTrusted(trial) for trial in json.loads(data)]
+        log.warning(f"Archive segment {file_name} was modified, validating it")
+        return [TrialBase(**trial) for trial in json.loads(data)]
+
+    @staticmethod
+    def _trialTime(trial: TrialBase) -> datetime.datetime:
+        return trial.end_time or trial.start_time
+
+    @staticmethod
+    def isArchivable(trial: TrialBase, before: datetime.datetime) -> bool:
+        """Whether the trial is done and ended before the given time"""
+        if trial.state not in ARCHIVABLE_STATES:
+            return False
+        time = TrialArchive._trialTime(trial)
+        return time is not None and time < before
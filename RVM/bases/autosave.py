@@ -0,0 +1,147 @@
+# saves the project settings in the background when they change
+import logging
+import os
+import sys
+import threading
+import time
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.bases.base import currentRevision
+
+log = logging.getLogger()
+
+
+class autoSaverSignals(QObject):
+    """Defines the signals available from the auto saver
+
+    Supported signals are:
+    saved: `int` the revision that was saved
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    saved = pyqtSignal(int)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class autoSaver(QObject):
+    """Saves the project settings in a background thread whenever they changed.
+
+    Changes are noticed through the model revisions (see ``TrackedBase``), so nothing has to tell the saver about them. Changes are coalesced: after a change the saver waits until there have been no further changes for ``debounce`` seconds, or until the first unsaved change is ``interval`` seconds old if the changes never settle. ``requestSave`` skips the wait, use it for changes that matter (e.g. a trial ending). Either way the settings are written at most once every ``interval`` seconds, counting saves made elsewhere (see ``markSaved``), so a crash loses at most about two intervals of changes.
+
+    The thread runs at background priority so saving never competes with writing video.
+
+    Parameters
+    ----------
+    getProjectSettings : callable
+        Returns the current ProjectSettings, the main window swaps these when a project is opened
+    interval : float
+        The fewest seconds between saves, and the longest to wait for changes to settle
+    debounce : float
+        The seconds without changes to wait for before saving
+    """
+
+    def __init__(self, getProjectSettings, interval: float = 10, debounce: float = 1):
+        super(autoSaver, self).__init__()
+        self.signals = autoSaverSignals()
+        self.getProjectSettings = getProjectSettings
+        self.interval = interval
+        self.debounce = debounce
+        self.savedRevision = currentRevision()
+        self.lastSaveTime = None
+        self.lastWrite = None  # time.monotonic() of the last save, by anyone
+        self.kill = False
+        self.wake = threading.Event()
+
+    @pyqtSlot()
+    def run(self) -> None:
+        """loop until closed, saving when there are unsaved changes"""
+        log.debug("Starting auto saver")
+        self.lowerPriority()
+        firstChange = None  # when we first saw an unsaved change
+        lastRevision = self.savedRevision
+        requested = False
+        while not self.kill:
+            # a request waits for the next allowed save if it came too soon after the last
+            requested = self.wake.wait(self.debounce) or requested
+            self.wake.clear()
+            if self.kill:
+                break
+            revision = currentRevision()
+            if revision <= self.savedRevision:
+                firstChange = None
+                requested = False
+                continue
+            now = time.monotonic()
+            if firstChange is None:
+                firstChange = now
+            quiet = revision == lastRevision
+            lastRevision = revision
+            if not (requested or quiet or now - firstChange >= self.interval):
+                continue
+            if self.lastWrite is not None and now - self.lastWrite < self.interval:
+                continue
+            if self.save(revision):
+                firstChange = None
+                requested = False
+        self.signals.finished.emit()
+
+    def save(self, revision: int) -> bool:
+        """save the project settings, returns whether it worked"""
+        projectSettings = self.getProjectSettings()
+        if projectSettings is None:
+            return False
+        # don't create a project where there wasn't one
+        if not os.path.exists(
+            os.path.join(str(projectSettings.project_location), "settings.json")
+        ):
+            self.savedRevision = revision
+            return False
+        try:
+            # archiving changes the trial list, leave that to the gui thread
+            projectSettings.save(archive=False)
+        except RuntimeError as e:
+            # the gui changed a dict while it was serialized, try again next time
+            log.debug(f"Auto save interrupted, retrying: {e}")
+            return False
+        except Exception as e:
+            self.signals.error.emit(f"Auto save failed: {e}", True)
+            return False
+        self.savedRevision = revision
+        self.lastSaveTime = time.time()
+        self.lastWrite = time.monotonic()
+        self.signals.saved.emit(revision)
+        return True
+
+    def requestSave(self):
+        """save as soon as possible instead of waiting for changes to settle"""
+        self.wake.set()
+
+    def markSaved(self, revision: int = None):
+        """tell the saver the project was saved elsewhere (e.g. an explicit save)"""
+        self.savedRevision = currentRevision() if revision is None else revision
+        self.lastWrite = time.monotonic()
+
+    @staticmethod
+    def lowerPriority():
+        """lower the cpu and io priority of the calling thread, best effort"""
+        try:
+            if sys.platform == "win32":
+                import win32api
+                import win32process
+
+                # THREAD_MODE_BACKGROUND_BEGIN lowers both cpu and io priority
+                win32process.SetThreadPriority(win32api.GetCurrentThread(), 0x00010000)
+            else:
+                # on linux the nice value applies to the thread and sets its io priority too
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except Exception as e:
+            log.debug(f"Could not lower the auto saver priority: {e}")
+
+    def close(self) -> None:
+        """stop the saver, the loop exits after any save in progress"""
+        log.debug("Closing auto saver")
+        self.kill = True
+        self.wake.set()
@@ -1,24 +1,170 @@
 # pydantic base models for the data structures used in the RVM
 import logging
+import os
+import tempfile
+import threading
 from asyncio import protocols
 from datetime import datetime
+from itertools import count
 from pathlib import Path
-from typing import List, Literal, Optional, TypeVar
+from typing import ClassVar, Dict, List, Literal, Optional, Tuple, TypeVar
 from uuid import uuid4
 
 from pandas import DataFrame
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, validator
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, SHAPE_TUPLE
 
 DataFrameType = TypeVar("DataFrameType", DataFrame, dict)
 
 log = logging.getLogger()
 
+# revisions are handed out from one process wide counter so that revisions from
+# different objects can be compared, i.e. "has anything changed since N"
+_revisionCounter = count(1)
+_revisionLock = threading.Lock()
+_latestRevision = 0
+
 
 def uid_gen():
     return str(uuid4())
 
 
-class AnimalBase(BaseModel):
+def atomicWrite(path, data: bytes):
+    """Write a file so that it is either fully written or left as it was
+
+    The data is written and flushed to disk in a temporary file in the same directory, which then replaces the file.
+    """
+    dir_path = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def nextRevision() -> int:
+    """Return a new revision number, larger than any previously returned"""
+    global _latestRevision
+    with _revisionLock:
+        _latestRevision = next(_revisionCounter)
+        return _latestRevision
+
+
+def currentRevision() -> int:
+    """Return the most recent revision handed out to any tracked model"""
+    return _latestRevision
+
+
+class TrackedBase(BaseModel):
+    """A base model that records which fields were set and at which revision.
+
+    Setting a field costs a revision bump and a dict write, there is no
+    comparison of the old and new value. Objects that were just created or loaded
+    are at revision 0, so ``changedSince(0)`` is every field set since then.
+    Changes made in place (e.g. ``trials.append``) are not seen, call
+    ``markChanged`` after them.
+    """
+
+    logName: ClassVar[str] = "MODEL"
+    _revision: int = PrivateAttr(default=0)
+    _changes: dict = PrivateAttr(default_factory=dict)
+
+    @property
+    def revision(self) -> int:
+        """The revision of the last change to this object"""
+        return self._revision
+
+    def markChanged(self, *names: str) -> int:
+        """Record that the given fields changed and return the new revision"""
+        rev = nextRevision()
+        self._revision = rev
+        for name in names:
+            self._changes[name] = rev
+        return rev
+
+    def changedSince(self, revision: int) -> set:
+        """The names of the fields that changed after the given revision"""
+        if self._revision <= revision:
+            return set()
+        return {name for name, rev in self._changes.items() if rev > revision}
+
+    def clearChanges(self):
+        """Forget the changed fields, the revision is kept"""
+        self._changes.clear()
+
+    @classmethod
+    def fromTrusted(cls, data: dict):
+        """Build a model from data RVM wrote itself, WITHOUT validation.
+
+        Only the conversions json can't round trip are done (nested models,
+        datetimes, paths and tuples). Anything else is taken as is, so this must
+        only be used for data that has been checksummed, see ``ProjectSettings.load``.
+        """
+        converters = _trustedConverters.get(cls)
+        if converters is None:
+            converters = _trustedConverters[cls] = _buildTrustedConverters(cls)
+        values = dict(data)
+        for name, convert in converters.items():
+            value = values.get(name)
+            if value is not None:
+                values[name] = convert(value)
+        if len(values) < len(cls.__fields__):
+            for name, field in cls.__fields__.items():
+                if name not in values:
+                    values[name] = field.get_default()
+        # the same as cls.construct but without its per field overhead
+        model = cls.__new__(cls)
+        object.__setattr__(model, "__dict__", values)
+        object.__setattr__(model, "__fields_set__", set(data))
+        model._init_private_attributes()
+        return model
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in self.__private_attributes__:
+            return
+        self.markChanged(name)
+        # let logging format the message, only if it will actually be emitted
+        log.debug(
+            "%s: %s  SET %s TO %s", self.logName, self.__dict__.get("uid"), name, value
+        )
+
+
+# per model class: field name -> function converting the json value of that field
+_trustedConverters = {}
+
+
+def _buildTrustedConverters(cls) -> dict:
+    converters = {}
+    for name, field in cls.__fields__.items():
+        if isinstance(field.type_, type) and issubclass(field.type_, TrackedBase):
+            convert = field.type_.fromTrusted
+            if field.shape == SHAPE_LIST:
+                convert = lambda values, sub=convert: [sub(v) for v in values]
+            elif field.shape != SHAPE_SINGLETON:
+                continue
+        elif field.shape == SHAPE_TUPLE:
+            convert = tuple
+        elif field.type_ is datetime:
+            convert = datetime.fromisoformat
+        elif field.type_ is Path:
+            convert = Path
+        else:
+            continue
+        converters[name] = convert
+    return converters
+
+
+class AnimalBase(TrackedBase):
+    logName: ClassVar[str] = "ANIMAL"
     uid: str = ""
     genotype: str = ""
     alive: bool = True
@@ -37,13 +183,9 @@ class AnimalBase(BaseModel):
         if type(self.notes) != str:
             raise ValueError("The animal notes is invalid")
 
-    def __setattr__(self, name, value):
-        if not self.__getattribute__(name) == value:
-            log.debug(f"ANIMAL: {self.uid}  SET {name} TO {value}")
-        return super().__setattr__(name, value)
-
 
-class BoxBase(BaseModel):
+class BoxBase(TrackedBase):
+    logName: ClassVar[str] = "BOX"
     uid: str = ""
     camera: str = ""
     notes: str = ""
@@ -56,13 +198,101 @@ class BoxBase(BaseModel):
         if type(self.notes) != str:
             raise ValueError("The box notes is invalid")
 
-    def __setattr__(self, name, value):
-        if not self.__getattribute__(name) == value:
-            log.debug(f"BOX: {self.uid}  SET {name} TO {value}")
-        return super().__setattr__(name, value)
 
+class AlignmentBase(TrackedBase):
+    logName: ClassVar[str] = "ALIGNMENT"
+    # seconds per MedPC timestamp tick
+    resolution: float = 0.01
+    # video time (seconds) of MedPC time zero, and clock drift in seconds per second
+    offset: float = 0.0
+    drift: float = 0.0
+    fps: float = 0.0
+    # seconds before and after each event in its window
+    pre: float = 0.0
+    post: float = 0.0
+    # event name -> the frame of each event, -1 if it is outside the video
+    frames: Dict[str, List[int]] = {}
+    # event name -> the first and last (exclusive) frame of the window of each event
+    windows: Dict[str, List[List[int]]] = {}
+
+
+class ProxyBase(TrackedBase):
+    logName: ClassVar[str] = "PROXY"
+    location: Path
+    width: int = 0
+    height: int = 0
+    frames: int = 0
+    # the size and modification time (ns) of the video the proxy was made from
+    source_size: int = 0
+    source_mtime: int = 0
+    created: Optional[datetime] = None
+
+    def isCurrent(self, source) -> bool:
+        """Whether the proxy exists and the video it was made from is unchanged"""
+        try:
+            stat = os.stat(source)
+        except (OSError, TypeError):
+            return False
+        return (
+            os.path.isfile(self.location)
+            and stat.st_size == self.source_size
+            and stat.st_mtime_ns == self.source_mtime
+        )
+
+
+class FreezingBase(TrackedBase):
+    logName: ClassVar[str] = "FREEZING"
+    # (x, y, width, height) in video pixels, None for the whole frame
+    roi: Optional[Tuple[int, int, int, int]] = None
+    scale: int = 4
+    # grey levels a pixel must change by to count as moving
+    pixel_threshold: int = 20
+    # the fraction of moving pixels below which the animal is still
+    motion_threshold: float = 0.002
+    # seconds of stillness before it counts as freezing
+    min_duration: float = 1.0
+    fps: float = 0.0
+    frames: int = 0
+    # the per frame motion energy, saved as a .npy file
+    motion_location: Optional[Path] = None
+    # the first and last (exclusive) frame of each freezing bout
+    bouts: List[List[int]] = []
+    # the fraction of the video spent freezing
+    freezing: float = 0.0
+    # event name -> the fraction of each event's window (see AlignmentBase) spent freezing
+    windows: Dict[str, List[float]] = {}
+    created: Optional[datetime] = None
 
-class TrialBase(BaseModel):
+
+class TrackingBase(TrackedBase):
+    logName: ClassVar[str] = "TRACKING"
+    # the positions, a .npy array with frame, x, y and area fields
+    location: Path
+    # the frames spent at each pixel of the downscaled video
+    occupancy_location: Optional[Path] = None
+    # frames were tracked at 1/scale of their size
+    scale: int = 4
+    frames: int = 0
+    dropped: int = 0
+    # processing time per frame
+    mean_ms: float = 0.0
+    max_ms: float = 0.0
+
+
+class GapBase(TrackedBase):
+    logName: ClassVar[str] = "GAP"
+    # the first frame of the recording that fills in for a stalled camera
+    frame: int
+    # frames of filler, and how long the camera delivered nothing
+    frames: int = 0
+    duration: float = 0.0
+    start: datetime
+    # why the camera was considered stalled
+    reason: str = ""
+
+
+class TrialBase(TrackedBase):
+    logName: ClassVar[str] = "TRIAL"
     uid: str = Field(default_factory=uid_gen)
     animal: Optional[AnimalBase]
     box: Optional[BoxBase]
@@ -73,6 +303,15 @@ class TrialBase(BaseModel):
     original_data_location: Optional[Path] = None
     video_location: Optional[Path] = None
     data: Optional[DataFrameType] = None
+    # when the MedPC session the events in ``data`` came from started
+    data_start_time: Optional[datetime] = None
+    alignment: Optional[AlignmentBase] = None
+    # a small copy of the video for fast review
+    proxy: Optional[ProxyBase] = None
+    freezing: Optional[FreezingBase] = None
+    tracking: Optional[TrackingBase] = None
+    # stretches where the camera stalled and the recording was padded
+    gaps: List[GapBase] = []
     notes: str = ""
 
     def validateTrial(self):
@@ -99,29 +338,21 @@ class TrialBase(BaseModel):
         self.state = "Stopped"
         self.end_time = datetime.now()
 
-    def __setattr__(self, name, value):
-        if not self.__getattribute__(name) == value:
-            log.debug(f"TRIAL: {self.uid}  SET {name} TO {value}")
-        return super().__setattr__(name, value)
-
     class Config:
         arbitrary_types_allowed = True
 
 
-class ProtocalBase(BaseModel):
+class ProtocalBase(TrackedBase):
+    logName: ClassVar[str] = "PROTOCOL"
     uid: str = ""
     description: Optional[str] = None
     animals: List[AnimalBase] = []
     boxes: List[BoxBase] = []
     trials: List[TrialBase] = []
 
-    def __setattr__(self, name, value):
-        if not self.__getattribute__(name) == value:
-            log.debug(f"Setting {name} to {value}")
-        return super().__setattr__(name, value)
-
 
-class ProjectSettingsBase(BaseModel):
+class ProjectSettingsBase(TrackedBase):
+    logName: ClassVar[str] = "PROJECT"
     uid: str = Field(default_factory=uid_gen)
     project_name: str = ""
     created: datetime = Field(default_factory=datetime.now)
@@ -129,12 +360,9 @@ class ProjectSettingsBase(BaseModel):
     window_size: tuple[int, int] = (1280, 720)
     window_position: tuple[int, int] = (0, 0)
     video_devices: dict[str, str] = {}
+    # finished trials older than this are moved to the archive, 0 to never archive
+    archive_after_days: int = 30
     protocols: list[ProtocalBase] = []
     animals: list[AnimalBase] = []
     trials: list[TrialBase] = []
     boxes: list[BoxBase] = []
-
-    def __setattr__(self, name, value):
-        if not self.__getattribute__(name) == value:
-            log.debug(f"SET {name} TO {value}")
-        return super().__setattr__(name, value)
@@ -1,32 +1,109 @@
 # the models for the project with helper functions
 import datetime
+import hashlib
 import json
 import logging
 import os
 import subprocess
+import threading
 
-from RVM.bases.base import (AnimalBase, BoxBase, ProjectSettingsBase,
-                            ProtocalBase, TrialBase)
+from pydantic import PrivateAttr, ValidationError
+
+from RVM.bases.archive import TrialArchive
+from RVM.bases.base import (
+    AnimalBase,
+    BoxBase,
+    ProjectSettingsBase,
+    ProtocalBase,
+    TrialBase,
+    atomicWrite,
+)
+from RVM.bases.trialIndex import TrialIndex
 
 log = logging.getLogger()
 
+# bump this whenever the layout of settings.json changes, files written with another
+# version are always loaded with full validation
+SCHEMA_VERSION = 2
+CHECKSUM_FILE_NAME = "settings.checksum"
+# the gui and the auto saver both save, one at a time so the newest settings are written
+# last and settings.json and its checksum always come from the same save
+_saveLock = threading.Lock()
+
 
 class ProjectSettings(ProjectSettingsBase):
     """The settings for the project"""
 
+    _archive: TrialArchive = PrivateAttr(default=None)
+    _trialIndex: TrialIndex = PrivateAttr(default_factory=TrialIndex)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    def save(self, dir_path=None):
+    @property
+    def trialIndex(self) -> TrialIndex:
+        """A columnar index of the trials, brought up to date with ``trials`` on every access"""
+        self._trialIndex.update(self)
+        return self._trialIndex
+
+    @property
+    def archive(self) -> TrialArchive:
+        """The archive of finished trials for the project location"""
+        dir_path = os.path.join(str(self.project_location), "archive")
+        if self._archive is None or self._archive.dir_path != dir_path:
+            self._archive = TrialArchive(self.project_location)
+        return self._archive
+
+    def archiveTrials(self, before: datetime.datetime = None) -> int:
+        """Move finished trials out of the settings and into the archive
+
+        Parameters
+        ----------
+        before : datetime.datetime, optional
+            Archive the finished trials that ended before this, by default ``archive_after_days`` ago
+
+        Returns
+        -------
+        int
+            The number of trials archived
+        """
+        if before is None:
+            if self.archive_after_days <= 0:
+                return 0
+            before = datetime.datetime.now() - datetime.timedelta(
+                days=self.archive_after_days
+            )
+        to_archive = [t for t in self.trials if TrialArchive.isArchivable(t, before)]
+        if len(to_archive) == 0:
+            return 0
+        self.archive.add(to_archive)
+        archived = set(t.uid for t in to_archive)
+        self.trials = [t for t in self.trials if t.uid not in archived]
+        return len(to_archive)
+
+    def archivedTrials(self) -> tuple:
+        """Get the archived trials, this loads the archive if it isn't already"""
+        # a crash between writing the archive and the settings leaves a trial in both
+        current = set(t.uid for t in self.trials)
+        return tuple(t for t in self.archive.trials() if t.uid not in current)
+
+    def save(self, dir_path=None, archive=True):
         """Save the settings to a json file
 
+        The files are written atomically, a crash while saving leaves the previous settings. Saves from different threads run one at a time, each serializes the settings only once it has the save lock.
+
         Parameters
         ----------
         dir_path : str, optional
             The directory to save the file to, by default None. If None, the project location is used, THIS WILL OVERWRITE THE CURRENT PROJECT SETTINGS.
+        archive : bool, optional
+            Whether to move old finished trials to the archive when saving to the project location, by default True
         """
         if dir_path is None:
             dir_path = self.project_location
+            # keep the settings small by moving old finished trials to the archive
+            if archive:
+                self.archiveTrials()
         file_name = "settings.json"
         # check if the directory exists
         if not os.path.exists(dir_path):
@@ -38,32 +115,127 @@ class ProjectSettings(ProjectSettingsBase):
                 dir_path = os.path.join(os.getcwd(), self.project_name)
                 os.mkdir(dir_path)
                 subprocess.Popen(["explorer", dir_path])
-        with open(os.path.join(dir_path, file_name), "w") as file:
-            file.write(self.json(indent=4))
+        with _saveLock:
+            data = self.json(indent=4).encode("utf-8")
+            atomicWrite(os.path.join(dir_path, file_name), data)
+            # record that we wrote this file so the next load can trust it
+            checksum = {
+                "schema_version": SCHEMA_VERSION,
+                "sha256": hashlib.sha256(data).hexdigest(),
+            }
+            atomicWrite(
+                os.path.join(dir_path, CHECKSUM_FILE_NAME),
+                json.dumps(checksum).encode("utf-8"),
+            )
 
-    def load(self, dir_path=None, check=True):
+    def load(self, dir_path=None, check=True, trusted=True):
         """
         Load the settings from a json file
 
+        If the file was written by RVM (the schema version and checksum in the checksum file match) the models are built without validation, the full validation is left to ``findProblems`` which should be run in the background, see ``validateInBackground``.
+
         Parameters
         ----------
         dir_path : str, optional
             The directory to load the file from, by default None. If None, the project location is used. If the project location is not set, the current directory is used.
         check : bool, optional
             Whether to check the settings after loading, by default True
+        trusted : bool, optional
+            Whether to use the fast path for files written by RVM, by default True
+
+        Returns
+        -------
+        bool
+            True if the fast path was used and validation is still pending
         """
         if dir_path is None:
             dir_path = self.project_location
         file_name = "settings.json"
-        with open(os.path.join(dir_path, file_name), "r") as file:
-            self.__init__(**json.load(file))
-
-        self.project_location = dir_path
-        if check:
+        with open(os.path.join(dir_path, file_name), "rb") as file:
+            data = file.read()
+
+        fast = trusted and self.isTrusted(dir_path, data)
+        if fast:
+            self._loadTrusted(json.loads(data))
+        else:
+            self.__init__(**json.loads(data))
+
+        # where it was loaded from is not a change, going through __setattr__ would
+        # bump the revision and have every freshly opened project auto saved
+        self.__dict__["project_location"] = dir_path
+        self.__fields_set__.add("project_location")
+        if check and not fast:
             self.validateSettings()
+        return fast
+
+    @staticmethod
+    def isTrusted(dir_path, data: bytes) -> bool:
+        """Check if the settings data was written by this version of RVM
+
+        Parameters
+        ----------
+        dir_path : str
+            The project directory
+        data : bytes
+            The contents of the settings file
+        """
+        try:
+            with open(os.path.join(dir_path, CHECKSUM_FILE_NAME), "r") as file:
+                checksum = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return (
+            checksum.get("schema_version") == SCHEMA_VERSION
+            and checksum.get("sha256") == hashlib.sha256(data).hexdigest()
+        )
+
+    def _loadTrusted(self, data: dict):
+        """Replace our values with the trusted data without validating it"""
+        loaded = self.fromTrusted(data)
+        object.__setattr__(self, "__dict__", loaded.__dict__)
+        object.__setattr__(self, "__fields_set__", loaded.__fields_set__)
+        self._init_private_attributes()
 
     def validateSettings(self):
         """Validate the settings"""
+        for problem in self._problems():
+            raise problem
+
+    def findProblems(self) -> list[str]:
+        """Run the full validation and return every problem instead of raising the first one
+
+        This also re-runs the pydantic validation, so it catches everything a normal load would have.
+        """
+        problems = []
+        try:
+            ProjectSettingsBase(**json.loads(self.json()))
+        except ValidationError as e:
+            problems.append(str(e))
+        problems.extend(str(problem) for problem in self._problems())
+        return problems
+
+    def validateInBackground(self, callback):
+        """Run ``findProblems`` in a background thread
+
+        Parameters
+        ----------
+        callback : callable
+            Called from the background thread with the list of problems found (empty if there are none)
+        """
+
+        def run():
+            try:
+                problems = self.findProblems()
+            except Exception as e:
+                problems = [f"Could not validate the settings: {e}"]
+            callback(problems)
+
+        thread = threading.Thread(target=run, name="validateSettings", daemon=True)
+        thread.start()
+        return thread
+
+    def _problems(self):
+        """Yield an exception for every problem with the settings"""
         # check if the project location exists
         try:
             if not os.path.exists(self.project_location):
@@ -71,7 +243,7 @@ class ProjectSettings(ProjectSettingsBase):
                     f"The project location {self.project_location} does not exist"
                 )
         except Exception as e:
-            raise FileNotFoundError(
+            yield FileNotFoundError(
                 f"The project location {self.project_location} is not valid"
             )
         # check if the project name is valid
@@ -79,34 +251,43 @@ class ProjectSettings(ProjectSettingsBase):
             if not self.project_name.isidentifier():
                 raise ValueError(f"The project name {self.project_name} is not valid")
         except Exception as e:
-            raise ValueError(f"The project name {self.project_name} is not valid")
+            yield ValueError(f"The project name {self.project_name} is not valid")
         # check if the project created date is valid
         try:
             datetime.datetime.strptime(str(self.created), "%Y-%m-%d %H:%M:%S.%f")
         except ValueError:
-            raise ValueError(f"The project created date {self.created} is not valid")
+            yield ValueError(f"The project created date {self.created} is not valid")
         # check that the window size is valid
         try:
             if self.window_size[0] < 0 or self.window_size[1] < 0:
                 raise ValueError(f"The window size {self.window_size} is not valid")
         except Exception as e:
-            raise ValueError(f"The window size {self.window_size} is not valid")
+            yield ValueError(f"The window size {self.window_size} is not valid")
 
         for animal in self.animals:
             if isinstance(animal, AnimalBase) or isinstance(animal, Animal):
-                animal.validateAnimal()
+                try:
+                    animal.validateAnimal()
+                except ValueError as e:
+                    yield e
             else:
-                raise TypeError(f"Animal {animal} is not an instance of AnimalBase")
+                yield TypeError(f"Animal {animal} is not an instance of AnimalBase")
         for box in self.boxes:
             if isinstance(box, BoxBase) or isinstance(box, Box):
-                box.validateBox()
+                try:
+                    box.validateBox()
+                except ValueError as e:
+                    yield e
             else:
-                raise TypeError(f"Box {box} is not an instance of BoxBase")
+                yield TypeError(f"Box {box} is not an instance of BoxBase")
         for trial in self.trials:
             if isinstance(trial, TrialBase) or isinstance(trial, Trial):
-                trial.validateTrial()
+                try:
+                    trial.validateTrial()
+                except Exception as e:
+                    yield e
             else:
-                raise TypeError(f"Trial {trial} is not an instance of TrialBase")
+                yield TypeError(f"Trial {trial} is not an instance of TrialBase")
 
     def repairSettings(self):
         """A VERY CRUDE REPAIR FOR QUICK PATCH
@@ -167,6 +348,7 @@ class ProjectSettings(ProjectSettingsBase):
         for i, a in enumerate(self.animals):
             if a.uid == animal.uid:
                 self.animals[i] = animal
+                self.markChanged("animals")
                 return True
         return False
 
@@ -176,19 +358,41 @@ class ProjectSettings(ProjectSettingsBase):
                 return box
         return None
 
-    def getTrialFromId(self, uid) -> TrialBase:
+    def getTrialFromId(self, uid, archived=False) -> TrialBase:
+        """Get a trial by its uid
+
+        Parameters
+        ----------
+        uid : str
+            The uid of the trial
+        archived : bool, optional
+            Whether to also look in the archive (loading it if needed), by default False
+        """
         for trial in self.trials:
             if trial.uid == uid:
                 return trial
+        if archived:
+            return self.archive.getTrialFromId(uid)
         return None
 
     def updateTrial(self, trial: TrialBase):
         for i, t in enumerate(self.trials):
             if t.uid == trial.uid:
                 self.trials[i] = trial
+                self.markChanged("trials")
                 return True
         return False
 
+    def changedTrials(self, revision: int) -> list[TrialBase]:
+        """Get the trials that were modified after the given revision
+
+        Parameters
+        ----------
+        revision : int
+            A revision previously returned by ``markChanged`` or ``currentRevision``
+        """
+        return [trial for trial in self.trials if trial.revision > revision]
+
     def getProtocolFromId(self, uid):
         for protocol in self.protocols:
             if protocol.uid == uid:
@@ -0,0 +1,295 @@
+# a columnar index of the trials for fast filtering and summaries
+import datetime
+import logging
+
+import numpy as np
+
+from RVM.bases.base import TrialBase, currentRevision
+
+log = logging.getLogger()
+
+STATES = list(TrialBase.__fields__["state"].type_.__args__)
+STATE_CODES = {state: i for i, state in enumerate(STATES)}
+# 1970-01-01 was a thursday, shift so weeks start on monday
+WEEK_OFFSET = 3 * 86400
+
+
+class TrialIndex:
+    """A columnar copy of the fields of the trials that are used for filtering and statistics.
+
+    Every trial is a row in a set of numpy arrays: start and end times in seconds since the epoch (NaN if not set), the state code (index into ``STATES``) and integer ids of the animal, box and protocol (index into ``animals``, ``boxes`` and ``protocols``). Filters and group by queries are then vectorized numpy operations instead of loops over the trial objects.
+
+    The index is kept in sync with a ``ProjectSettings`` using the model revisions, call ``update`` before querying (``ProjectSettings.trialIndex`` does this).
+    """
+
+    def __init__(self):
+        self.revision = -1
+        self._project_revision = -1
+        self._list = None
+        self._trials = []
+        self._rows = {}
+        self.animals = []
+        self.boxes = []
+        self.protocols = []
+        self._animal_ids = {}
+        self._box_ids = {}
+        self._protocol_ids = {}
+        self.start = np.empty(0, dtype=np.float64)
+        self.end = np.empty(0, dtype=np.float64)
+        self.state = np.empty(0, dtype=np.int8)
+        self.animal = np.empty(0, dtype=np.int32)
+        self.box = np.empty(0, dtype=np.int32)
+        self.protocol = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._trials)
+
+    @property
+    def nbytes(self) -> int:
+        """The memory used by the arrays"""
+        return sum(
+            a.nbytes
+            for a in (
+                self.start,
+                self.end,
+                self.state,
+                self.animal,
+                self.box,
+                self.protocol,
+            )
+        )
+
+    def update(self, projectSettings):
+        """Bring the index up to date with the trials of the project
+
+        The index is rebuilt if the trial list itself changed, otherwise only the rows of the trials changed since the last update are rewritten.
+        """
+        revision = currentRevision()
+        if revision == self.revision and len(projectSettings.trials) == len(self):
+            return
+        rebuild = (
+            projectSettings.trials is not self._list
+            or "trials" in projectSettings.changedSince(self._project_revision)
+            or len(projectSettings.trials) != len(self)
+        )
+        if not rebuild:
+            changed = projectSettings.changedTrials(self.revision)
+            # a trial whose uid was changed can't be matched to its row
+            rebuild = any(trial.uid not in self._rows for trial in changed)
+        if rebuild:
+            self.rebuild(projectSettings.trials)
+        else:
+            for trial in changed:
+                self._setRow(self._rows[trial.uid], trial)
+        self.revision = revision
+        self._project_revision = revision
+
+    def rebuild(self, trials: list[TrialBase]):
+        """Build the arrays from scratch"""
+        self._list = trials
+        self._trials = list(trials)
+        self._rows = {trial.uid: i for i, trial in enumerate(self._trials)}
+        self.start = self._toEpoch([trial.start_time for trial in self._trials])
+        self.end = self._toEpoch([trial.end_time for trial in self._trials])
+        self.state = np.fromiter(
+            (STATE_CODES[trial.state] for trial in self._trials),
+            dtype=np.int8,
+            count=len(self._trials),
+        )
+        self.animal = np.fromiter(
+            (self._animalId(trial) for trial in self._trials),
+            dtype=np.int32,
+            count=len(self._trials),
+        )
+        self.box = np.fromiter(
+            (self._boxId(trial) for trial in self._trials),
+            dtype=np.int32,
+            count=len(self._trials),
+        )
+        self.protocol = np.fromiter(
+            (self._protocolId(trial) for trial in self._trials),
+            dtype=np.int32,
+            count=len(self._trials),
+        )
+
+    def _setRow(self, row: int, trial: TrialBase):
+        self._trials[row] = trial
+        self.start[row] = self._toEpoch([trial.start_time])[0]
+        self.end[row] = self._toEpoch([trial.end_time])[0]
+        self.state[row] = STATE_CODES[trial.state]
+        self.animal[row] = self._animalId(trial)
+        self.box[row] = self._boxId(trial)
+        self.protocol[row] = self._protocolId(trial)
+
+    def _animalId(self, trial: TrialBase) -> int:
+        uid = trial.animal.uid if trial.animal is not None else None
+        if uid not in self._animal_ids:
+            self._animal_ids[uid] = len(self.animals)
+            self.animals.append(uid)
+        return self._animal_ids[uid]
+
+    def _boxId(self, trial: TrialBase) -> int:
+        uid = trial.box.uid if trial.box is not None else None
+        if uid not in self._box_ids:
+            self._box_ids[uid] = len(self.boxes)
+            self.boxes.append(uid)
+        return self._box_ids[uid]
+
+    def _protocolId(self, trial: TrialBase) -> int:
+        if trial.protocol not in self._protocol_ids:
+            self._protocol_ids[trial.protocol] = len(self.protocols)
+            self.protocols.append(trial.protocol)
+        return self._protocol_ids[trial.protocol]
+
+    @staticmethod
+    def _toEpoch(times: list) -> np.ndarray:
+        """Convert a list of datetimes (or None) to seconds since the epoch, NaN for None"""
+        times = np.array(times, dtype="datetime64[us]")
+        epoch = times.astype(np.int64) / 1e6
+        epoch[np.isnat(times)] = np.nan
+        return epoch
+
+    @staticmethod
+    def toEpoch(time: datetime.datetime) -> float:
+        """Convert a datetime to the same seconds since the epoch used in the index"""
+        return float(np.datetime64(time, "us").astype(np.int64) / 1e6)
+
+    def filter(
+        self,
+        states: list[str] = None,
+        animals: list[str] = None,
+        boxes: list[str] = None,
+        protocols: list[str] = None,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+    ) -> np.ndarray:
+        """Get a boolean mask of the trials matching all of the given criteria
+
+        Parameters
+        ----------
+        states, animals, boxes, protocols : list[str], optional
+            Only keep trials with one of these states, animal uids, box uids or protocols
+        start, end : datetime.datetime, optional
+            Only keep trials that started at or after ``start`` and before ``end``
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if states is not None:
+            mask &= np.isin(self.state, [STATE_CODES[s] for s in states])
+        if animals is not None:
+            ids = [self._animal_ids[a] for a in animals if a in self._animal_ids]
+            mask &= np.isin(self.animal, ids)
+        if boxes is not None:
+            ids = [self._box_ids[b] for b in boxes if b in self._box_ids]
+            mask &= np.isin(self.box, ids)
+        if protocols is not None:
+            ids = [self._protocol_ids[p] for p in protocols if p in self._protocol_ids]
+            mask &= np.isin(self.protocol, ids)
+        if start is not None:
+            mask &= self.start >= self.toEpoch(start)
+        if end is not None:
+            mask &= self.start < self.toEpoch(end)
+        return mask
+
+    def trials(self, mask: np.ndarray = None) -> list[TrialBase]:
+        """Get the trial objects for a mask (or row numbers)"""
+        if mask is None:
+            return list(self._trials)
+        rows = np.flatnonzero(mask) if mask.dtype == bool else mask
+        return [self._trials[row] for row in rows]
+
+    @property
+    def duration(self) -> np.ndarray:
+        """The duration of every trial in seconds, NaN if it has not started or ended"""
+        return self.end - self.start
+
+    def _key(self, key: str, mask: np.ndarray):
+        """Get the codes and labels for a group by key"""
+        if key == "animal":
+            return self.animal[mask], self.animals
+        if key == "box":
+            return self.box[mask], self.boxes
+        if key == "protocol":
+            return self.protocol[mask], self.protocols
+        if key == "state":
+            return self.state[mask], STATES
+        if key in ("day", "week"):
+            seconds = 86400 if key == "day" else 604800
+            offset = 0 if key == "day" else WEEK_OFFSET
+            # trials that never started can't be put in a day or week
+            periods = np.floor((self.start[mask] + offset) / seconds)
+            periods[np.isnan(periods)] = -1
+            periods = periods.astype(np.int64)
+            first = periods[periods >= 0].min() if np.any(periods >= 0) else 0
+            codes = np.where(periods >= 0, periods - first, -1)
+            n = codes.max() + 1 if len(codes) > 0 else 0
+            labels = [
+                datetime.date(1970, 1, 1)
+                + datetime.timedelta(seconds=int((first + i) * seconds - offset))
+                for i in range(n)
+            ]
+            return codes, labels
+        raise ValueError(f"Can not group trials by {key}")
+
+    def groupBy(
+        self,
+        keys,
+        values: np.ndarray = None,
+        agg: str = "count",
+        mask: np.ndarray = None,
+    ) -> dict:
+        """Aggregate the trials by one or more keys
+
+        Parameters
+        ----------
+        keys : str or list[str]
+            One or more of "animal", "box", "protocol", "state", "day" and "week" (the monday of the week)
+        values : np.ndarray, optional
+            A value per trial to aggregate, e.g. ``duration``, required unless ``agg`` is "count". NaN values are ignored.
+        agg : str, optional
+            "count", "sum" or "mean", by default "count"
+        mask : np.ndarray, optional
+            Only aggregate these trials, see ``filter``
+
+        Returns
+        -------
+        dict
+            label (a tuple of labels for more than one key) -> aggregated value, only groups with trials are included
+
+        Examples
+        --------
+        >>> index.groupBy(["animal", "week"])
+        >>> index.groupBy("box", index.duration, "mean")
+        """
+        single = isinstance(keys, str)
+        keys = [keys] if single else list(keys)
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        if values is not None:
+            values = values[mask]
+            valid = ~np.isnan(values)
+        else:
+            valid = np.ones(int(mask.sum()), dtype=bool)
+        codes, labels = zip(*(self._key(key, mask) for key in keys))
+        for code in codes:
+            valid &= code >= 0
+        shape = tuple(max(len(label), 1) for label in labels)
+        flat = np.ravel_multi_index([code[valid] for code in codes], shape)
+        size = int(np.prod(shape))
+        counts = np.bincount(flat, minlength=size)
+        if agg == "count":
+            result = counts
+        elif agg in ("sum", "mean"):
+            if values is None:
+                raise ValueError(f"{agg} needs values to aggregate")
+            result = np.bincount(flat, weights=values[valid], minlength=size)
+            if agg == "mean":
+                result = result / np.maximum(counts, 1)
+        else:
+            raise ValueError(f"Unknown aggregation {agg}")
+        groups = np.flatnonzero(counts)
+        columns = [
+            [label[j] for j in index.tolist()]
+            for label, index in zip(labels, np.unravel_index(groups, shape))
+        ]
+        names = columns[0] if single else list(zip(*columns))
+        return dict(zip(names, result[groups].tolist()))
@@ -7,6 +7,9 @@ import cv2
 import numpy as np
 from PyQt6.QtCore import QMutex, QObject, Qt, QTimer, pyqtSignal, pyqtSlot
 
+from RVM.camera.frameIndex import FrameIndex, IndexedCapture
+from RVM.camera.watchdog import PUBLISH, RECOVERED, CameraWatchdog
+
 log = logging.getLogger()
 
 
@@ -29,6 +32,8 @@ class vrSignals(QObject):
 class vidReader(QObject):
     """A QObject responsible for frame collection. This is frame blocking and should be run in an isolated thread.
 
+    It is the only reader of the device, the frames are fanned out to the recorder, the preview and anything else through ``vc.bus``. A ``CameraWatchdog`` reconnects the device when it stalls, see its ``signals``.
+
     Attributes:
         vc: a VideoCapture object
     """
@@ -40,6 +45,7 @@ class vidReader(QObject):
         self.lastFrame = []
         self.cameraName = self.vc.cameraName
         self.mspf = self.vc.mspf
+        self.session = self.vc.session  # stop if the device is handed to another camera
         self.cont = self.vc.previewing or self.vc.recording
         self.startTime = datetime.datetime.now()  # time at beginning of reader
         self.lastTime = self.startTime  # time at beginning of last step
@@ -49,6 +55,8 @@ class vidReader(QObject):
         self.framesDropped = 0
         self.dt = 0
         self.sleepTime = 0
+        self.frameNumber = 0  # frames published, including pads
+        self.watchdog = CameraWatchdog(self.vc)
 
     @pyqtSlot()
     def run(self) -> None:
@@ -59,63 +67,80 @@ class vidReader(QObject):
         self.timer.setTimerType(Qt.TimerType.PreciseTimer)
         self.timer.start(self.mspf)
         self.timerRunning = True
+        self.watchdog.start()
+        # an open device has a frame ready, don't wait a timer period for it
+        self.loop()
 
     def loop(self):
         """run this on each loop iteration"""
         self.lastTime = self.dnow
         self.dnow = datetime.datetime.now()
+        previous = self.lastFrame[0] if len(self.lastFrame) > 0 else None
         frame = self.readFrame()  # read the frame
         if not self.cont:
             self.close()
             return
 
-        self.sendNewFrame(frame)  # send back to window
-        self.checkDrop(frame)  # check for dropped frames
+        state = self.watchdog.check(frame)
+        if state == RECOVERED:
+            # fill the stall with the last frame before it, then carry on with the new one,
+            # timed from now as the read itself may have hung
+            self.dnow = datetime.datetime.now()
+            pads = self.checkDrop(previous if previous is not None else frame)
+            self.sendNewFrame(frame)
+            self.watchdog.recovered(pads)
+        elif state == PUBLISH:
+            self.sendNewFrame(frame)  # send back to window
+            self.checkDrop(frame)  # check for dropped frames
 
     @pyqtSlot()
     def readFrame(self):
         """get a frame from the camera"""
         try:
-            self.vc.lock()  # lock camera so only this thread can read frames
-            frame = self.vc.readFrame()  # read frame
+            # the lock only keeps the device from being closed or reconfigured mid read,
+            # the flags and the frame rate are read without it
+            self.vc.lock()
+            try:
+                frame = self.vc.readFrame()  # read frame
+            finally:
+                self.vc.unlock()
             mspf = self.vc.mspf  # update frame rate
             if not mspf == self.mspf:
                 # update frame rate
                 self.timer.stop()
                 self.mspf = mspf
                 self.timer.start(self.mspf)
-            self.cont = self.vc.previewing or self.vc.recording  # whether to continue
-            self.vc.unlock()  # unlock camera
+            # whether to continue
+            self.cont = (
+                self.vc.previewing or self.vc.recording
+            ) and self.vc.session == self.session
         except Exception as e:
+            # nothing is published for a failed read, the watchdog decides when the camera has stalled
             if len(str(e)) > 0:
                 self.signals.error.emit(f"Error collecting frame: {e}", True)
-            if len(self.lastFrame) > 0:
-                frame = self.lastFrame[0]
-            else:
-                self.signals.error.emit(f"Error collecting frame: no last frame", True)
-                return
-        else:
+            return None
+        if frame is not None:
             self.lastFrame = [frame]
         return frame
 
     def sendFrame(self, frame: np.ndarray, pad: bool):
-        """send a frame to the GUI"""
+        """publish a frame to the subscribers of the camera's frame bus"""
         if frame is None:
             return
-        self.signals.frame.emit(
-            frame, pad
-        )  # send the frame back to be displayed and recorded
+        # every subscriber (recorder, preview, ...) gets this same frame, see FrameBus
+        self.vc.bus.publish(self.frameNumber, frame, pad)
+        self.frameNumber += 1
         self.timeRec = self.timeRec + self.mspf / 1000  # keep track of time recorded
 
     def sendNewFrame(self, frame):
         """send a new frame back to the GUI"""
         self.sendFrame(frame, False)
 
-    def checkDrop(self, frame):
-        """check for dropped frames"""
+    def checkDrop(self, frame) -> int:
+        """check for dropped frames, fill them in with ``frame`` and return how many were filled"""
         # check timing
         if not self.cont:
-            return
+            return 0
         self.timeElapsed = (self.dnow - self.startTime).total_seconds()
         framesElapsed = int(
             np.floor((self.timeElapsed - self.timeRec) / (self.mspf / 1000))
@@ -130,113 +155,14 @@ class vidReader(QObject):
             numfill = framesElapsed - 1
             for i in range(numfill):
                 self.sendFrame(frame, True)
+            return numfill
+        return 0
 
     def close(self):
-        log.debug(f"closing reader for {self.cameraName}")
-        if hasattr(self, "timer") and self.timer.isActive():
-            self.timer.stop()
-        self.signals.finished.emit()
-
-
-class prevSignals(QObject):
-    """Defines the signals available from a running worker thread
-    Supported signals are:
-    finished: No data
-    error: a string message and a bool whether this is worth printing to the log
-    result:`object` data returned from processing, anything
-    progress: `int` indicating % progress
-    """
-
-    finished = pyqtSignal()
-    error = pyqtSignal(str, bool)
-    progress = pyqtSignal(str)
-    frame = pyqtSignal(np.ndarray, bool)
-
-
-class previewer(QObject):
-    """previewer puts preview frame collection into the background, so frames from different cameras can be collected in parallel. vc is a vc object (defined in camObj)"""
-
-    def __init__(self, vc: QMutex):
-        super(previewer, self).__init__()
-        self.signals = prevSignals()
-        self.vc = vc
-        self.lastFrame = []
-        self.cameraName = self.vc.cameraName
-        self.mspf = self.vc.prevmspf
-        self.startTime = datetime.datetime.now()  # time at beginning of reader
-        self.lastTime = self.startTime  # time at beginning of last step
-        self.dnow = self.startTime  # current time
-        self.timeRec = 0  # time of video recorded
-        self.timeElapsed = 0
-        self.framesDropped = 0
-        self.dt = 0
-        self.sleepTime = 0
-        self.cont = True
-
-    def run(self) -> None:
-        """Run this function when this thread is started. Collect a frame and return to the gui"""
-        log.debug(f"Starting previewer for {self.cameraName}\n\t{self.vc}")
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.loop)
-        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
-        self.timer.start(int(self.mspf * 2))
-        self.timerRunning = True
-
-    def loop(self):
-        """run this on each loop iteration"""
-        self.lastTime = self.dnow
-        self.dnow = datetime.datetime.now()
-        frame = self.readFrame()  # read the frame
-        if not self.cont:
-            self.close()
-            return
-        self.sendNewFrame(frame)  # send back to window
-
-    @pyqtSlot()
-    def readFrame(self):
-        """get a frame from the camera"""
-        try:
-            self.vc.lock()  # lock camera so only this thread can read frames
-            try:
-                frame = self.vc.frame  # get the frame
-            except Exception as e:
-                frame = self.vc.readFrame()  # read frame
-            mspf = self.vc.prevmspf  # update frame rate
-            if not mspf == self.mspf:
-                # update frame rate
-                self.timer.stop()
-                self.mspf = mspf
-                self.timer.start(self.mspf)
-            self.cont = self.vc.previewing  # whether to continue
-            self.vc.unlock()  # unlock camera
-
-        except Exception as e:
-            if len(str(e)) > 0:
-                self.signals.error.emit(f"Error collecting frame: {e}", True)
-            if len(self.lastFrame) > 0:
-                frame = self.lastFrame[0]
-            else:
-                self.signals.error.emit(f"Error collecting frame: no last frame", True)
-                return
-        else:
-            self.lastFrame = [frame]
-        return frame
-
-    def sendFrame(self, frame: np.ndarray, pad: bool):
-        """send a frame to the GUI"""
-        if frame is None:
-            return
-
-        self.signals.frame.emit(
-            frame, pad
-        )  # send the frame back to be displayed and recorded
-
-    def sendNewFrame(self, frame):
-        """send a new frame back to the GUI"""
-        self.sendFrame(frame, False)
-
-    def close(self):
-        log.debug(f"closing previewer for {self.cameraName}")
+        log.debug(
+            f"closing reader for {self.cameraName}, frames: {self.vc.bus.stats()}"
+        )
+        self.watchdog.stop()
         if hasattr(self, "timer") and self.timer.isActive():
             self.timer.stop()
         self.signals.finished.emit()
@@ -341,7 +267,8 @@ class vidAnalysis(QObject):
         self.vFilename = fn
         self.recFPS = 30
         self.recSPF = 1 / self.recFPS
-        self.vw = cv2.VideoCapture(fn)
+        # seek with the frame index if one was already built for this video
+        self.vw = IndexedCapture(fn, FrameIndex.load(fn))
         self.signals = vidAnalysisSignals()
         self.kill = False
         self.readFrames = 0  # total number of frames read
@@ -349,7 +276,7 @@ class vidAnalysis(QObject):
 
     def seek(self, frame: int):
         """seek to a frame"""
-        self.vw.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        self.vw.seek(frame)
 
     @pyqtSlot()
     def run(self) -> None:
@@ -387,6 +314,43 @@ class vidAnalysis(QObject):
         else:
             return frame
 
+    def readBatch(self, batch: np.ndarray, scale: int = 1, roi: tuple = None) -> int:
+        """read the next frames into a batch of grayscale images, for analysis
+
+        Parameters
+        ----------
+        batch : np.ndarray
+            A (n, height, width) uint8 array, filled with up to n frames cropped to the roi and resized to height x width
+        scale : int, optional
+            1, 2, 4 or 8: read MJPG frames at 1/scale of their size, see ``IndexedCapture.read``
+        roi : tuple, optional
+            (x, y, width, height) of the region to keep in full size pixels, by default the whole frame
+
+        Returns
+        -------
+        int
+            The number of frames read, less than n at the end of the video
+        """
+        height, width = batch.shape[1:3]
+        full_width = self.vw.get(cv2.CAP_PROP_FRAME_WIDTH)
+        for i in range(len(batch)):
+            ok, frame = self.vw.read(scale)
+            if not ok:
+                return i
+            self.readFrames += 1
+            if roi is not None:
+                # the frame may have been decoded smaller than full size
+                x, y, w, h = (int(round(v * frame.shape[1] / full_width)) for v in roi)
+                frame = frame[y : y + h, x : x + w]
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if gray.shape == (height, width):
+                batch[i] = gray
+            else:
+                cv2.resize(
+                    gray, (width, height), dst=batch[i], interpolation=cv2.INTER_AREA
+                )
+        return len(batch)
+
     def sendFrame(self, frame: np.ndarray, pad: bool):
         """send a frame to the GUI"""
         if frame is None:
@@ -2,33 +2,64 @@ import datetime
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
 from typing import TYPE_CHECKING
 
 import cv2
 import numpy as np
-from PyQt6.QtCore import (QMutex, QObject, QRectF, Qt, QThread, QTimer,
-                          pyqtSignal, pyqtSlot)
+from PyQt6.QtCore import (
+    QMutex,
+    QObject,
+    QRectF,
+    Qt,
+    QThread,
+    QTimer,
+    pyqtSignal,
+    pyqtSlot,
+)
 from PyQt6.QtGui import QAction, QIcon, QImage, QPixmap
-from PyQt6.QtWidgets import (QApplication, QLabel, QMainWindow, QMenuBar,
-                             QSizePolicy, QStatusBar, QToolBar, QVBoxLayout,
-                             QWidget)
-
-from RVM.bases import Trial
-from RVM.camera.camThreads import previewer, vidReader, vidWriter
+from PyQt6.QtWidgets import (
+    QApplication,
+    QLabel,
+    QMainWindow,
+    QMenuBar,
+    QSizePolicy,
+    QStatusBar,
+    QToolBar,
+    QVBoxLayout,
+    QWidget,
+)
+
+from RVM.bases import GapBase, TrackingBase, Trial
+from RVM.camera.camThreads import vidReader, vidWriter
+from RVM.camera.devicePool import sharedDevicePool
+from RVM.camera.frameBus import FrameBus
+from RVM.camera.plugins import PluginHost
+from RVM.camera.tracking import TrackingPlugin
 
 if TYPE_CHECKING:
     from RVM.mainWindow import MainWindow
 
 log = logging.getLogger()
 
+# frames read when a device is opened, so exposure and format negotiation are done before recording
+WARMUP_FRAMES = 5
+# ms to wait for a read in progress when reconnecting, a stalled read can hang for good
+RECONNECT_LOCK_TIMEOUT = 2000
+
 
 class VideoCaptureSignals(QObject):
     status = pyqtSignal(str, bool)
 
 
 class VideoCapture(QMutex):
-    """holds the videoCapture object and surrounding functions"""
+    """holds the videoCapture object and surrounding functions
+
+    The mutex guards the device only: the reader holds it while it reads a frame, and whatever connects, closes or configures the device takes it too. The previewing, recording and writing flags and the frame rate are plain attributes that are set atomically (see ``setFlags``) and read by the reader once per frame, so changing them never waits on a frame being read. Frames reach consumers through ``bus`` and ``frame`` without the mutex.
+    """
 
     def __init__(
         self, camNum: int, cameraName: str, fps: int, prevFPS: int, recFPS: int
@@ -40,10 +71,19 @@ class VideoCapture(QMutex):
         self.camNum = camNum
         self.cameraName = cameraName
         self.signals = VideoCaptureSignals()
+        self.camDevice = None
+        # set when a reconnect gave up on a device stuck in a read, see reconnect
+        self.abandoned = False
         self.connected = False
         self.previewing = False  # is the live preview on?
         self.recording = False  # are we collecting frames for a video?
         self.writing = False  # are we writing video frames to file?
+        # the frames read from the device, published once to every consumer
+        self.bus = FrameBus()
+        self.resetLockStats()
+        self.openLatency = None  # seconds it took to open and warm up the device
+        # counts the cameras the device was handed to by the device pool, a reader only reads for its own
+        self.session = 0
         self.updateFPS(fps)
         self.updatePrevFPS(prevFPS)
 
@@ -51,6 +91,65 @@ class VideoCapture(QMutex):
     def id(self):
         return self._id
 
+    @property
+    def frame(self) -> np.ndarray:
+        """The latest frame read from the device, None before the first"""
+        return self.bus.latest.frame
+
+    def setFlags(self, **flags):
+        """Set any of previewing, recording and writing, each assignment is atomic so the reader sees either the old or the new value"""
+        for flag, value in flags.items():
+            if flag not in ("previewing", "recording", "writing"):
+                raise ValueError(f"Unknown flag {flag}")
+            setattr(self, flag, value)
+
+    def lock(self):
+        """Lock the device, timing how long it took to get and how long it is held"""
+        start = time.perf_counter()
+        if not super(VideoCapture, self).tryLock():
+            super(VideoCapture, self).lock()
+            self._lockStats["contended"] += 1
+        self._locked(start)
+
+    def tryLock(self, timeout: int = 0) -> bool:
+        start = time.perf_counter()
+        if not super(VideoCapture, self).tryLock(timeout):
+            return False
+        self._locked(start)
+        return True
+
+    def _locked(self, start: float):
+        self._lockedAt = time.perf_counter()
+        wait = self._lockedAt - start
+        self._lockStats["locks"] += 1
+        self._lockStats["wait"] += wait
+        self._lockStats["max_wait"] = max(self._lockStats["max_wait"], wait)
+
+    def unlock(self):
+        held = time.perf_counter() - self._lockedAt
+        self._lockStats["hold"] += held
+        self._lockStats["max_hold"] = max(self._lockStats["max_hold"], held)
+        super(VideoCapture, self).unlock()
+
+    def resetLockStats(self):
+        self._lockedAt = 0.0
+        self._lockStats = dict.fromkeys(
+            ("locks", "contended", "wait", "max_wait", "hold", "max_hold"), 0
+        )
+
+    def lockStats(self) -> dict:
+        """How often the device was locked, how often someone had to wait, and the mean and max wait and hold times in ms"""
+        stats = dict(self._lockStats)
+        locks = max(1, stats["locks"])
+        return {
+            "locks": stats["locks"],
+            "contended": stats["contended"],
+            "mean_wait_ms": 1000 * stats["wait"] / locks,
+            "max_wait_ms": 1000 * stats["max_wait"],
+            "mean_hold_ms": 1000 * stats["hold"] / locks,
+            "max_hold_ms": 1000 * stats["max_hold"],
+        }
+
     def updateStatus(self, msg: str, _log: bool = False):
         """update the status bar by sending a signal"""
         log.info(msg)
@@ -68,21 +167,58 @@ class VideoCapture(QMutex):
 
     def connectVC(self):
         try:
-            self.camDevice = cv2.VideoCapture(self.camNum, cv2.CAP_DSHOW)
-            self.camDevice.set(
-                cv2.CAP_PROP_BUFFERSIZE, 1
-            )  # limit buffer size to one frame
+            device = cv2.VideoCapture(self.camNum, cv2.CAP_DSHOW)
+            device.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # limit buffer size to one frame
             # set the fourcc to MJPG
-            # self.camDevice.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            # device.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
 
         except Exception as e:
             self.updateStatus(f"Failed connect to {self.cameraName}: {e}")
             self.connected = False
             return
-        else:
-            self.connected = True
-        self.imw = int(self.camDevice.get(3))  # image width (px)
-        self.imh = int(self.camDevice.get(4))  # image height (px)
+        # the reader may be running (see reconnect), only swap the device under the lock
+        self.lock()
+        try:
+            self.camDevice = device
+        finally:
+            self.unlock()
+        self.connected = True
+        self.imw = int(device.get(3))  # image width (px)
+        self.imh = int(device.get(4))  # image height (px)
+
+    def warmUp(self, frames: int = WARMUP_FRAMES) -> int:
+        """Read and discard a few frames, the first frames of a freshly opened device are slow. Returns the number of frames read."""
+        read = 0
+        if not self.tryLock(RECONNECT_LOCK_TIMEOUT):
+            log.debug(f"Cannot warm up {self.cameraName}: a read is still in progress")
+            return read
+        try:
+            for _ in range(frames):
+                rval, frame = self.camDevice.read()
+                if not rval:
+                    break
+                read += 1
+        except Exception as e:
+            log.debug(f"Error warming up {self.cameraName}: {e}")
+        finally:
+            self.unlock()
+        return read
+
+    def open(self, warmup_frames: int = WARMUP_FRAMES) -> bool:
+        """Connect to the device and warm it up, timing how long that takes (``openLatency``). Safe to run outside the gui thread.
+
+        Returns
+        -------
+        bool
+            Whether the device delivers frames
+        """
+        start = time.perf_counter()
+        self.connectVC()
+        ok = self.connected
+        if ok and warmup_frames > 0:
+            ok = self.warmUp(warmup_frames) > 0
+        self.openLatency = time.perf_counter() - start
+        return ok
 
     def getFrameRate(self) -> float:
         """Determine the native device frame rate"""
@@ -101,23 +237,64 @@ class VideoCapture(QMutex):
             )
             return 0
 
+    def reconnect(self, warmup_frames: int = WARMUP_FRAMES) -> bool:
+        """Close the device and open it again, e.g. after it stalled (see ``CameraWatchdog``). Safe to run outside the gui thread, reads return nothing in the meantime.
+
+        Returns
+        -------
+        bool
+            Whether the reopened device delivers frames
+        """
+        if not self.tryLock(RECONNECT_LOCK_TIMEOUT):
+            # a read hangs on the device, releasing it under the read would crash the process:
+            # the reader releases it once the read returns and the next attempt reopens it
+            self.abandoned = True
+            return False
+        try:
+            device, self.camDevice = self.camDevice, None
+            self.abandoned = False
+            if device is not None:
+                self._release(device)
+        finally:
+            self.unlock()
+        return self.open(warmup_frames)
+
+    def _release(self, device):
+        try:
+            device.release()
+        except Exception as e:
+            log.debug(f"Error releasing {self.cameraName}: {e}")
+
     @pyqtSlot()
     def readFrame(self):
-        """Get a frame from the webcam using cv2.VideoCapture.read()"""
+        """Get a frame from the webcam using cv2.VideoCapture.read(), call this with the device locked"""
+        if self.camDevice is None:
+            # being reconnected
+            return None
         try:
             rval, frame = self.camDevice.read()
         except:
             self.updateStatus("Error reading frame", True)
-
-        else:
-            self.frame = frame
-            return frame
+            frame = None
+        if self.abandoned:
+            # a reconnect gave up on this device while the read hung, see reconnect
+            device, self.camDevice = self.camDevice, None
+            self.abandoned = False
+            self._release(device)
+            return None
+        return frame
 
     def closeVC(self):
         """Close the webcam device"""
         try:
             if self.camDevice is not None:
-                self.camDevice.release()
+                # wait for a read in progress
+                self.lock()
+                try:
+                    self.camDevice.release()
+                finally:
+                    self.unlock()
+                log.debug(f"{self.cameraName} device lock: {self.lockStats()}")
             else:
                 self.updateStatus(
                     f"Cannot close {self.cameraName}: device not connected", True
@@ -131,6 +308,8 @@ class VideoCapture(QMutex):
 
 class CameraSignals(QObject):
     finishedClose = pyqtSignal()
+    # preview frames from the frame bus, to be displayed in the gui thread
+    prevFrame = pyqtSignal(np.ndarray, bool)
     finishedOpen = pyqtSignal()
 
 
@@ -213,6 +392,19 @@ class Camera(QObject):
         self.writing = False
         self.reader = None
         self.deviceOpen = False
+        # track the animal in every recorded frame
+        self.tracking = True
+        # real time analyses of the recorded frames, see startPlugins
+        self.plugins = None
+        # subscriptions to the frame bus of the device, see startReader and startPreviewer
+        self.recSubscription = None
+        self.prevSubscription = None
+        # recorded frames arrive in the reader thread, this keeps them from racing the start and end of a recording
+        self.recLock = threading.Lock()
+        # recorded frames are dropped until this is set, see startRecording
+        self.recordGate = None
+        # (first frame, time, reason) of a stall of the camera during the recording, see cameraStalled
+        self.stall = None
         self.frames = Queue()
         self.framesSincePrev = 0
         self.prevWindow = VideoDisplay()
@@ -226,16 +418,29 @@ class Camera(QObject):
         else:
             self.saveFolder = saveFolder
         self.resetVidStats()
+        self.signals.prevFrame.connect(self.receivePrevFrame)
 
         self.vc = None
 
-    def createVC(self):
-        """Create a VideoCapture object"""
+    def createVC(self, connect: bool = True):
+        """Take the still open device from the device pool, or create a VideoCapture object and connect to the device unless ``connect`` is False (see ``cameraOpener``)"""
+        pool = sharedDevicePool()
+        vc = pool.acquire(self.camNum)
+        if vc is not None:
+            vc.session += 1
+            vc.cameraName = self.camName
+            vc.updateFPS(self.fps)
+            vc.updatePrevFPS(self.prevFPS)
+            self.vc = vc
+            self.deviceOpen = True
+            return self.deviceOpen
         self.vc = VideoCapture(
             self.camNum, self.camName, self.fps, self.prevFPS, self.recFPS
         )
-        self.vc.connectVC()
-        self.deviceOpen = self.vc.connected
+        pool.adopt(self.vc)
+        if connect:
+            self.vc.connectVC()
+            self.deviceOpen = self.vc.connected
         return self.deviceOpen
 
     def resetVidStats(self) -> None:
@@ -267,23 +472,29 @@ class Camera(QObject):
 
         self.updateFramesToPrev()
         self.previewing = True
-        self.vc.lock()
-        self.vc.previewing = True
-        self.vc.unlock()
+        self.vc.setFlags(previewing=True)
         self.startReader()  # this only starts the reader if we're not already recording
         self.startPreviewer()
 
-    def startRecording(self) -> None:
-        """start recording a video"""
+    def startRecording(self, gate: threading.Event = None) -> None:
+        """start recording a video
+
+        Parameters
+        ----------
+        gate : threading.Event, optional
+            Set up the writer and the reader but only record the frames that arrive once this is set, so the recordings of several cameras start together (see ``TrialManagerDockWidget.startOpenedTrials``). By default recording starts at once.
+        """
         if not self.deviceOpen:
             self.updateStatus(f"Opening {self.camName} preview...")
             self.createVC()
         if self.writing:
             if not self.writeWarning:
                 self.writeWarning = True
-            QTimer.singleShot(50, self.startRecording)  # stop previewing and recording
+            QTimer.singleShot(
+                50, lambda: self.startRecording(gate)
+            )  # stop previewing and recording
         else:
-            self.createWriter()
+            self.createWriter(gate)
 
     def startReader(self) -> None:
         """start updating preview or recording"""
@@ -307,37 +518,28 @@ class Camera(QObject):
             self.readThread.finished.connect(self.readWorker.close)
             self.readThread.finished.connect(self.readThread.deleteLater)
             self.readWorker.signals.error.connect(self.updateStatus)
-            self.readWorker.signals.frame.connect(self.receiveRecFrame)
             self.readWorker.signals.progress.connect(self.printDiagnostics)
+            self.readWorker.watchdog.signals.stalled.connect(self.cameraStalled)
+            self.readWorker.watchdog.signals.recovered.connect(self.cameraRecovered)
+            self.readWorker.watchdog.signals.error.connect(self.updateStatus)
+            # recorded frames are queued for the writer straight from the reader thread
+            self.recSubscription = self.vc.bus.subscribe(
+                "recorder", lambda n, frame, pad: self.receiveRecFrame(frame, pad)
+            )
             # Step 6: Start the thread
             self.readThread.start()
             log.debug("start reader")
 
     def startPreviewer(self) -> None:
-        """start updating preview"""
+        """start updating preview from the frames the reader publishes, at the preview frame rate"""
         if not self.prevRunning:
             self.prevRunning = True
-            # if self.diag>1:
-            #     logging.debug(f'Starting {self.cameraName} reader')
-
-            # https://realpython.com/python-pyqt-qthread/
-            self.prevThread = QThread()
-            # Step 3: Create a worker object
-            self.prevWorker = previewer(
-                self.vc
-            )  # creates a new thread to read frames to GUI
-            # Step 4: Move worker to the thread
-            self.prevWorker.moveToThread(self.prevThread)
-            # Step 5: Connect signals and slots
-            self.prevThread.started.connect(self.prevWorker.run)
-            self.prevWorker.signals.finished.connect(self.prevThread.quit)
-            self.prevWorker.signals.finished.connect(self.prevWorker.deleteLater)
-            self.prevThread.finished.connect(self.prevWorker.close)
-            self.prevThread.finished.connect(self.prevThread.deleteLater)
-            self.prevWorker.signals.error.connect(self.updateStatus)
-            self.prevWorker.signals.frame.connect(self.receivePrevFrame)
-            self.prevWorker.signals.progress.connect(self.printDiagnostics)
-            self.prevThread.start()
+            self.prevSubscription = self.vc.bus.subscribe(
+                "preview",
+                lambda n, frame, pad: self.signals.prevFrame.emit(frame, pad),
+                max_fps=self.prevFPS,
+                pads=False,
+            )
 
     def getFilename(self) -> str:
         """determine the file name for the file we're about to record."""
@@ -369,8 +571,8 @@ class Camera(QObject):
             log.debug(f"Error getting filename: {e}")
             return "UNKNOWN"
 
-    def createWriter(self) -> None:
-        """create a videoWriter object"""
+    def createWriter(self, gate: threading.Event = None) -> None:
+        """create a videoWriter object, see ``startRecording`` for the gate"""
         if self.vidFilePath is None:
             raise ValueError("No filename specified")
         if not os.path.exists(os.path.dirname(self.vidFilePath)):
@@ -379,13 +581,12 @@ class Camera(QObject):
             raise ValueError("No trial specified")
 
         self.writeWarning = False
-        self.recording = True
-        self.writing = True
-        self.vc.lock()
-        self.vc.recording = True
-        self.vc.writing = True
-        self.vc.unlock()
-        self.resetVidStats()  # this resets the frame list, and other vars
+        with self.recLock:
+            self.recordGate = gate
+            self.recording = True
+            self.writing = True
+            self.vc.setFlags(recording=True, writing=True)
+            self.resetVidStats()  # this resets the frame list, and other vars
         vidvars = {
             "fourcc": self.fourcc,
             "fps": self.fps,
@@ -409,10 +610,65 @@ class Camera(QObject):
         self.writeWorker.signals.error.connect(self.updateStatus)
         self.writeThread.start()
 
+        self.startPlugins()
         self.updateStatus(f"Recording {self.vidFilePath} ... ", True)
         # QThreadPool.globalInstance().start(recthread)          # start writing in a background thread
         self.startReader()  # this only starts the reader if we're not already previewing
 
+    def startPlugins(self) -> None:
+        """start the real time analyses of the recorded frames"""
+        self.plugins = PluginHost(self.fps)
+        self.plugins.signals.error.connect(self.updateStatus)
+        self.plugins.signals.finished.connect(self.pluginFinished)
+        if self.tracking:
+            self.plugins.add(TrackingPlugin(self.vidFilePath))
+
+    @pyqtSlot(str, dict)
+    def pluginFinished(self, name: str, result: dict) -> None:
+        log.debug(
+            f"{self.camName} {name}: {result['processed']}/{result['offered']} frames, {result['mean_ms']:.2f} ms/frame (max {result['max_ms']:.1f})"
+        )
+        if name == "tracking" and self.trial is not None and "location" in result:
+            self.trial.tracking = TrackingBase(
+                frames=result["processed"],
+                dropped=result["dropped"],
+                mean_ms=result["mean_ms"],
+                max_ms=result["max_ms"],
+                **{k: result[k] for k in ("location", "occupancy_location", "scale")},
+            )
+            self.requestSave()
+
+    def requestSave(self) -> None:
+        """ask the main window to save the project soon. ``mainWin`` is the camera's window, which holds the main window."""
+        mainWin = getattr(self.mainWin, "mainWin", None)
+        if mainWin is not None:
+            mainWin.requestSave()
+
+    @pyqtSlot(str)
+    def cameraStalled(self, reason: str) -> None:
+        """the device stopped delivering frames and is being reconnected, remember where the recording stands"""
+        self.updateStatus(f"{self.camName} stalled ({reason}), reconnecting...", True)
+        self.stall = (
+            (self.totalFrames, datetime.datetime.now(), reason)
+            if self.recording
+            else None
+        )
+
+    @pyqtSlot(float, int)
+    def cameraRecovered(self, seconds: float, pads: int) -> None:
+        """the device delivers frames again, record the gap it left in the trial"""
+        self.updateStatus(f"{self.camName} recovered after {seconds:.1f} s", True)
+        stall, self.stall = self.stall, None
+        if stall is None or self.trial is None or not self.recording:
+            return
+        frame, start, reason = stall
+        gap = GapBase(
+            frame=frame, frames=pads, duration=seconds, start=start, reason=reason
+        )
+        # assigned rather than appended so the change is tracked
+        self.trial.gaps = self.trial.gaps + [gap]
+        self.requestSave()
+
     def setFrameRate(self, fps: float) -> int:
         """Set the frame rate of the camera.
 
@@ -437,10 +693,8 @@ class Camera(QObject):
             self.mspf = int(round(1000.0 / self.fps))  # ms per frame
             self.updateFramesToPrev()  # update the preview downsample rate
             if hasattr(self, "vc"):
-                # update the vc object
-                self.vc.lock()
+                # update the vc object, the reader picks it up on its next frame
                 self.vc.updateFPS(self.fps)
-                self.vc.unlock()
             return 0
 
     def saveFrame(self, frame: np.ndarray) -> None:
@@ -506,9 +760,15 @@ class Camera(QObject):
         """
 
         self.lastFrame = [frame]
-        self.saveFrame(frame)  # save to file
-        if pad:
-            self.framesDropped += 1
+        if self.recordGate is not None and not self.recordGate.is_set():
+            # armed, waiting for the recordings of the other cameras to be set up
+            return
+        with self.recLock:
+            self.saveFrame(frame)  # save to file
+            if self.recording and self.plugins is not None:
+                self.plugins.push(self.totalFrames - 1, frame)
+            if pad:
+                self.framesDropped += 1
 
     @pyqtSlot(int)
     def writingRecording(self, fleft: int) -> None:
@@ -530,9 +790,7 @@ class Camera(QObject):
         # we put this in a try block because it can fail if we stop recording abruptly and the vc is destroyed
         try:
             self.writing = False
-            self.vc.lock()
-            self.vc.writing = False
-            self.vc.unlock()
+            self.vc.setFlags(writing=False)
             self.updateRecordStatus()
         except:
             pass
@@ -547,32 +805,39 @@ class Camera(QObject):
         """this only stops the reader if we are neither recording nor previewing"""
         if not self.recording and not self.previewing and self.readerRunning:
             self.readerRunning = False
+            if self.recSubscription is not None and self.vc is not None:
+                self.vc.bus.unsubscribe(self.recSubscription)
+            self.recSubscription = None
 
     def stopRecording(self) -> None:
         """stop collecting frames for the video"""
         if not self.recording:
             return
-        self.frames.put(
-            [None, 0]
-        )  # this tells the vidWriter that this is the end of the video
-        self.recording = False
+        with self.recLock:
+            self.frames.put(
+                [None, 0]
+            )  # this tells the vidWriter that this is the end of the video
+            if self.plugins is not None:
+                self.plugins.finish()
+                self.plugins = None
+            self.recording = False
         if hasattr(self, "vc"):
-            self.vc.lock()
-            self.vc.recording = False  # this helps the frame reader and the status update know we're not reading frames
-            self.vc.unlock()
+            # this helps the frame reader and the status update know we're not reading frames
+            self.vc.setFlags(recording=False)
         self.stopReader()  # only turns off the reader if we're not recording or previewing
 
     def stopPreviewer(self) -> None:
-        if not self.recording and not self.previewing and self.prevRunning:
+        if not self.previewing and self.prevRunning:
             self.prevRunning = False
+            if self.prevSubscription is not None and self.vc is not None:
+                self.vc.bus.unsubscribe(self.prevSubscription)
+            self.prevSubscription = None
 
     def stopPreview(self) -> None:
         """stop live preview. This freezes the last frame on the screen."""
         self.previewing = False
         if hasattr(self, "vc"):
-            self.vc.lock()
-            self.vc.previewing = False
-            self.vc.unlock()
+            self.vc.setFlags(previewing=False)
         self.stopReader()  # this only stops the reader if we are neither recording nor previewing
         self.stopPreviewer()
 
@@ -617,10 +882,7 @@ class Camera(QObject):
         if self.recording:
             self.stopRecording()
         if hasattr(self, "vc") and self.vc is not None:
-            self.vc.lock()
-            self.vc.recording = False
-            self.vc.previewing = False
-            self.vc.unlock()
+            self.vc.setFlags(recording=False, previewing=False)
         self.signals.finishedClose.emit()
 
     def close(self) -> None:
@@ -630,6 +892,69 @@ class Camera(QObject):
     def finishClose(self) -> None:
         """finish closing the camera"""
         if hasattr(self, "vc") and self.vc is not None:
-            self.vc.closeVC()
+            # keep the device open for the next camera on it, see DevicePool
+            sharedDevicePool().release(self.camNum, self.vc)
             self.vc = None
         self.deleteLater()
+
+
+class cameraOpenerSignals(QObject):
+    """Defines the signals available from the camera opener
+
+    Supported signals are:
+    opened: `str` camera name, `float` seconds it took to open and warm up, `bool` whether it delivers frames
+    finished: `dict` camera name -> seconds it took, None for the cameras that failed
+    """
+
+    opened = pyqtSignal(str, float, bool)
+    finished = pyqtSignal(dict)
+
+
+class cameraOpener(QObject):
+    """Opens and warms up the devices of several cameras at once, run in a QThread.
+
+    Opening a USB camera can take seconds, one after another that adds up to a minute for a rack of boxes. Here every device is opened on its own thread, so it takes about as long as the slowest one, and recording can start on all of them together afterwards.
+
+    Parameters
+    ----------
+    cameras : list
+        The Camera objects, their VideoCaptures are created here (in the calling thread)
+    warmup_frames : int, optional
+        Frames read and discarded after opening, by default WARMUP_FRAMES
+    """
+
+    def __init__(self, cameras: list, warmup_frames: int = WARMUP_FRAMES):
+        super(cameraOpener, self).__init__()
+        self.warmup_frames = warmup_frames
+        self.signals = cameraOpenerSignals()
+        for cam in cameras:
+            if not cam.deviceOpen:
+                # the qt objects of the capture belong to the calling thread, only the device is opened in the pool.
+                # a device still open from the last trial is taken from the device pool
+                cam.createVC(connect=False)
+        self.cameras = [cam for cam in cameras if not cam.deviceOpen]
+        self.ready = [cam for cam in cameras if cam.deviceOpen]
+
+    def _open(self, cam: Camera) -> tuple:
+        try:
+            ok = cam.vc.open(self.warmup_frames)
+        except Exception as e:
+            log.warning(f"Could not open {cam.camName}: {e}")
+            ok = False
+        cam.deviceOpen = ok
+        latency = cam.vc.openLatency or 0.0
+        self.signals.opened.emit(cam.camName, latency, ok)
+        return cam.camName, latency if ok else None
+
+    @pyqtSlot()
+    def run(self):
+        latencies = {}
+        for cam in self.ready:
+            self.signals.opened.emit(cam.camName, 0.0, True)
+            latencies[cam.camName] = 0.0
+        if self.cameras:
+            with ThreadPoolExecutor(
+                max_workers=len(self.cameras), thread_name_prefix="CameraOpen"
+            ) as pool:
+                latencies.update(pool.map(self._open, self.cameras))
+        self.signals.finished.emit(latencies)
@@ -0,0 +1,174 @@
+# keeps camera devices open and streaming between trials
+import atexit
+import logging
+import threading
+import time
+
+log = logging.getLogger()
+
+# seconds an unused device is kept open
+IDLE_TIMEOUT = 600
+# the most devices open at once, in use and idle
+MAX_OPEN = 16
+# frames per second read from idle devices to keep them streaming
+KEEPALIVE_FPS = 2
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+def sharedDevicePool() -> "DevicePool":
+    """The device pool shared by every camera of the application"""
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = DevicePool()
+            # release the idle devices when the application quits
+            atexit.register(_pool.close)
+        return _pool
+
+
+class DevicePool:
+    """Keeps camera devices open between the trials of a box.
+
+    Opening a device and letting its auto exposure settle takes seconds. When a camera is done with its device it is released to the pool instead of closed: the pool keeps reading it at ``keepalive_fps`` so it stays negotiated and exposed, and ``acquire`` hands it to the next camera on the same device, which can start reading at once.
+
+    Idle devices are closed after ``idle_timeout`` seconds, and when more than ``max_open`` devices would be open the one idle the longest is closed.
+
+    Parameters
+    ----------
+    idle_timeout : float, optional
+        Seconds an unused device is kept open, by default IDLE_TIMEOUT
+    max_open : int, optional
+        The most devices open at once, in use and idle, by default MAX_OPEN
+    keepalive_fps : float, optional
+        Frames per second read from idle devices, by default KEEPALIVE_FPS
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = IDLE_TIMEOUT,
+        max_open: int = MAX_OPEN,
+        keepalive_fps: float = KEEPALIVE_FPS,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_open = max_open
+        self.keepalive_fps = keepalive_fps
+        # device number -> (VideoCapture, time released)
+        self._idle = {}
+        # the devices handed out or adopted, that are open. The objects themselves, an id
+        # could be reused by another device once one is garbage collected
+        self._inUse = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """The number of open devices, in use and idle"""
+        return len(self._idle) + len(self._inUse)
+
+    def acquire(self, camNum: int):
+        """Take the open device of a camera number from the pool
+
+        Returns
+        -------
+        VideoCapture
+            The open device, None if the pool has none
+        """
+        with self._lock:
+            vc, _ = self._idle.pop(camNum, (None, None))
+            if vc is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._inUse.add(vc)
+        vc.resetLockStats()
+        # the last frame belongs to the previous camera
+        vc.bus.latest.clear()
+        log.debug(f"Reusing the open device {camNum} for {vc.cameraName}")
+        return vc
+
+    def adopt(self, vc):
+        """Count a device opened outside the pool towards ``max_open``, it can be released to the pool later"""
+        with self._lock:
+            self._inUse.add(vc)
+        self._enforceLimit()
+
+    def release(self, camNum: int, vc):
+        """Give a device back to the pool instead of closing it. Devices that are not connected are closed."""
+        with self._lock:
+            self._inUse.discard(vc)
+            if not vc.connected or self.idle_timeout <= 0:
+                close = [vc]
+            else:
+                # a camera number only has one device, an older one is stale
+                old = self._idle.pop(camNum, None)
+                close = [old[0]] if old is not None and old[0] is not vc else []
+                self._idle[camNum] = (vc, time.monotonic())
+        for device in close:
+            device.closeVC()
+        self._enforceLimit()
+        self._startKeepalive()
+
+    def close(self, camNum: int = None):
+        """Close one or all of the idle devices"""
+        with self._lock:
+            if camNum is None:
+                idle, self._idle = list(self._idle.values()), {}
+            else:
+                idle = [self._idle.pop(camNum)] if camNum in self._idle else []
+        for vc, _ in idle:
+            vc.closeVC()
+
+    def _enforceLimit(self):
+        with self._lock:
+            close = []
+            while self._idle and len(self) > self.max_open:
+                # the device idle the longest goes first
+                camNum = min(self._idle, key=lambda n: self._idle[n][1])
+                close.append(self._idle.pop(camNum)[0])
+        for vc in close:
+            log.debug(f"Closing the idle device of {vc.cameraName}, too many are open")
+            vc.closeVC()
+
+    def _startKeepalive(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._keepalive, name="DevicePool", daemon=True
+            )
+            self._thread.start()
+
+    def _keepalive(self):
+        """Read a frame from every idle device now and then, and close the devices idle too long. Runs until no device is idle."""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                if not self._idle:
+                    self._thread = None
+                    return
+                expired = [
+                    n for n, (_, t) in self._idle.items() if now - t > self.idle_timeout
+                ]
+                expired = [self._idle.pop(n)[0] for n in expired]
+                idle = list(self._idle)
+            for vc in expired:
+                log.debug(f"Closing the idle device of {vc.cameraName}")
+                vc.closeVC()
+            for camNum in idle:
+                # acquire takes the pool lock, so a device still idle here stays idle until
+                # the grab is done and the keepalive never reads from a camera's device
+                with self._lock:
+                    vc, _ = self._idle.get(camNum, (None, None))
+                    if vc is None or not vc.tryLock():
+                        continue
+                    try:
+                        vc.camDevice.grab()
+                    except Exception as e:
+                        log.debug(f"Error keeping {vc.cameraName} open: {e}")
+                    finally:
+                        vc.unlock()
+            self._wake.wait(1.0 / self.keepalive_fps)
@@ -0,0 +1,157 @@
+# one capture loop per device, fanning its frames out to every consumer
+import logging
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger()
+
+
+class Subscription:
+    """A consumer of the frames on a FrameBus
+
+    Parameters
+    ----------
+    name : str
+        Identifies the subscriber in the statistics
+    callback : callable
+        Called as ``callback(frame_number, frame, pad)`` in the capture thread, it must return quickly (hand the frame to a queue, a signal or a worker)
+    max_fps : float, optional
+        The most frames per second delivered, by default every frame
+    pads : bool, optional
+        Whether to deliver the repeats that fill in for dropped frames, by default True
+    """
+
+    def __init__(self, name: str, callback, max_fps: float = None, pads: bool = True):
+        self.name = name
+        self.callback = callback
+        self.max_fps = max_fps
+        self.pads = pads
+        self.delivered = 0
+        self.skipped = 0
+        self.callbackTime = 0.0
+        self._due = 0.0
+
+    def due(self, now: float) -> bool:
+        """Whether a frame published now should be delivered, by the rate limit"""
+        if not self.max_fps:
+            return True
+        if now < self._due:
+            return False
+        interval = 1.0 / self.max_fps
+        # keep to the rate on average without bunching up after a stall
+        self._due = max(self._due + interval, now - interval)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "delivered": self.delivered,
+            "skipped": self.skipped,
+            "max_fps": self.max_fps,
+            "callback_ms": 1000 * self.callbackTime / self.delivered
+            if self.delivered
+            else 0.0,
+        }
+
+
+class FrameBus:
+    """Publishes each captured frame once to every subscriber.
+
+    The capture loop is the only reader of the device. Every subscriber gets the same read only array, nothing is copied: the frame stays alive as long as any subscriber still holds it (python's reference counting) and no subscriber can change it under the others.
+    """
+
+    def __init__(self):
+        self._subscriptions = ()
+        self._lock = threading.Lock()
+        self.published = 0
+        # the latest captured frame (not a pad), see FrameSlot
+        self.latest = FrameSlot()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(
+        self, name: str, callback, max_fps: float = None, pads: bool = True
+    ) -> Subscription:
+        """Start delivering frames to a callback, see ``Subscription``"""
+        subscription = Subscription(name, callback, max_fps, pads)
+        with self._lock:
+            # publish iterates over a snapshot, so (un)subscribing never blocks it
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions = tuple(
+                s for s in self._subscriptions if s is not subscription
+            )
+
+    def subscription(self, name: str) -> Subscription:
+        """The first subscription with a name, None if there is none"""
+        for subscription in self._subscriptions:
+            if subscription.name == name:
+                return subscription
+        return None
+
+    def publish(self, frame_number: int, frame: np.ndarray, pad: bool = False):
+        """Deliver a frame to the subscribers that are due one
+
+        Parameters
+        ----------
+        frame_number : int
+            The number of the frame since capture started
+        frame : np.ndarray
+            The frame, it is made read only
+        pad : bool, optional
+            Whether the frame is a repeat filling in for a dropped frame
+        """
+        if frame is None:
+            return
+        frame.flags.writeable = False
+        self.published += 1
+        if not pad:
+            self.latest.put(frame_number, frame)
+        now = time.perf_counter()
+        for subscription in self._subscriptions:
+            if (pad and not subscription.pads) or not subscription.due(now):
+                subscription.skipped += 1
+                continue
+            start = time.perf_counter()
+            try:
+                subscription.callback(frame_number, frame, pad)
+            except Exception as e:
+                log.warning(f"Frame subscriber {subscription.name} failed: {e}")
+            subscription.callbackTime += time.perf_counter() - start
+            subscription.delivered += 1
+
+    def stats(self) -> dict:
+        """subscriber name -> its delivery statistics"""
+        return {s.name: s.stats() for s in self._subscriptions}
+
+
+class FrameSlot:
+    """The latest frame of a single producer, for consumers that poll instead of subscribing.
+
+    This does for python what a triple buffer does for preallocated buffers: the producer never waits for a consumer and a consumer never waits for the producer or the device. Published frames are read only and never reused, so handing over a frame is a single reference assignment, which is atomic, and a consumer always sees a complete (frame number, frame, time) of the same frame.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def put(self, frame_number: int, frame: np.ndarray):
+        self._slot = (frame_number, frame, time.perf_counter())
+
+    def clear(self):
+        self._slot = (-1, None, 0.0)
+
+    def get(self, newer_than: int = None) -> tuple:
+        """The latest (frame number, frame, perf_counter time), None if there is no frame newer than ``newer_than``"""
+        slot = self._slot
+        if slot[1] is None or (newer_than is not None and slot[0] <= newer_than):
+            return None
+        return slot
+
+    @property
+    def frame(self) -> np.ndarray:
+        return self._slot[1]
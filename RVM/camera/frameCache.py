@@ -0,0 +1,235 @@
+# decoded frame caching and read ahead for video playback
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from RVM.camera.frameIndex import FrameIndex, IndexedCapture
+
+log = logging.getLogger()
+
+# enough for ~190 frames of 720p or ~65 frames of 1080p video
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+# a reader's own cache holds this many read ahead windows: the frames ahead and as many
+# behind them for stepping back, sized from the first decoded frame
+CACHED_READ_AHEADS = 2
+
+
+class FrameCache:
+    """A least recently used cache of decoded frames bounded by the bytes it holds
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        The most bytes of frames kept, by default 512 MB
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, frame: int) -> bool:
+        return frame in self._frames
+
+    def get(self, frame: int) -> np.ndarray:
+        """Get a frame and mark it as recently used, None if it is not cached"""
+        with self._lock:
+            image = self._frames.get(frame)
+            if image is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._frames.move_to_end(frame)
+            return image
+
+    def peek(self, frame: int) -> np.ndarray:
+        """Get a frame without counting a hit or miss or marking it as used"""
+        return self._frames.get(frame)
+
+    def put(self, frame: int, image: np.ndarray):
+        """Add a frame, dropping the least recently used frames to stay within ``max_bytes``"""
+        # consumers get the cached array itself, it must never change
+        image.flags.writeable = False
+        with self._lock:
+            old = self._frames.pop(frame, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._frames[frame] = image
+            self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes and len(self._frames) > 1:
+                _, dropped = self._frames.popitem(last=False)
+                self.nbytes -= dropped.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    @property
+    def hitRate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+class PrefetchReader:
+    """Decodes frames in a background thread ahead of playback into a FrameCache.
+
+    The thread keeps the ``read_ahead`` frames after the last requested frame decoded. A request for a frame that is cached returns at once, otherwise the caller waits for the thread to decode it (a stall) and the thread continues reading ahead from there. Frames that were shown stay in the cache, so stepping back and forth around a frame does not decode again.
+
+    Only the reader thread touches the capture.
+
+    Parameters
+    ----------
+    capture : IndexedCapture
+        The video to read
+    cache : FrameCache, optional
+        By default a new cache of ``CACHED_READ_AHEADS`` times ``read_ahead`` frames, at most ``DEFAULT_CACHE_BYTES``
+    read_ahead : int, optional
+        How many frames to decode ahead of the last requested frame, by default 30
+    """
+
+    def __init__(
+        self, capture: IndexedCapture, cache: FrameCache = None, read_ahead: int = 30
+    ):
+        self.capture = capture
+        # an own cache is sized once the frame size is known, see _run
+        self._sizeCache = cache is None
+        self.cache = cache if cache is not None else FrameCache()
+        self.read_ahead = read_ahead
+        # read ahead every stride-th frame, for fast playback that skips frames
+        self.stride = 1
+        self.length = len(capture)
+        self.stalls = 0
+        self.stallTime = 0.0
+        self.decoded = 0
+        self.decodeTime = 0.0
+        self._wanted = 0
+        # how many frames fit in the cache, read ahead beyond half of that would evict itself
+        self._fit = read_ahead * 2
+        self._index = None
+        self._failed = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="PrefetchReader", daemon=True
+        )
+        self._thread.start()
+
+    def __len__(self):
+        return self.length
+
+    def frame(self, frame: int, timeout: float = 5.0) -> np.ndarray:
+        """Get a frame, waiting for it to be decoded if it is not cached
+
+        Returns
+        -------
+        np.ndarray
+            The read only frame, None if it could not be read
+        """
+        frame = max(0, min(frame, self.length - 1))
+        with self._condition:
+            self._wanted = frame
+            self._condition.notify_all()
+        image = self.cache.get(frame)
+        if image is not None:
+            return image
+        self.stalls += 1
+        start = time.perf_counter()
+        deadline = start + timeout
+        with self._condition:
+            while not self._closed and frame not in self._failed:
+                image = self.cache.peek(frame)
+                if image is not None:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    log.warning(f"Timed out waiting for frame {frame}")
+                    break
+                self._condition.wait(remaining)
+        self.stallTime += time.perf_counter() - start
+        return image
+
+    def setIndex(self, index: FrameIndex):
+        """Have the reader thread start seeking with a frame index"""
+        with self._condition:
+            self._index = index
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Cache and decoding statistics, for display or benchmarking"""
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "hit_rate": self.cache.hitRate,
+            "stalls": self.stalls,
+            "stall_time": self.stallTime,
+            "decoded": self.decoded,
+            "decode_ms": 1000 * self.decodeTime / self.decoded if self.decoded else 0.0,
+            "skipped": self.capture.skipped,
+            "cached_frames": len(self.cache),
+            "cached_bytes": self.cache.nbytes,
+        }
+
+    def _next(self):
+        """The next frame to decode, None if the read ahead window is full"""
+        ahead = max(1, min(self.read_ahead, self._fit // 2))
+        end = min(self._wanted + ahead * self.stride, self.length)
+        for frame in range(self._wanted, end, self.stride):
+            if frame not in self.cache and frame not in self._failed:
+                return frame
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._index is not None:
+                        self.capture.setIndex(self._index)
+                        self.length = len(self.capture)
+                        self._index = None
+                    frame = self._next()
+                    if frame is not None:
+                        break
+                    self._condition.wait()
+                if self._closed:
+                    return
+            # decode without holding the lock so cached frames can be served meanwhile
+            start = time.perf_counter()
+            try:
+                self.capture.seek(frame)
+                ok, image = self.capture.read()
+            except Exception as e:
+                log.warning(f"Error decoding frame {frame}: {e}")
+                ok = False
+            with self._condition:
+                if ok:
+                    if self._sizeCache:
+                        self._sizeCache = False
+                        self.cache.max_bytes = min(
+                            self.cache.max_bytes,
+                            image.nbytes * self.read_ahead * CACHED_READ_AHEADS,
+                        )
+                    self.cache.put(frame, image)
+                    self.decoded += 1
+                    # includes skipping to the frame, the cost of showing it
+                    self.decodeTime += time.perf_counter() - start
+                    self._fit = self.cache.max_bytes // max(image.nbytes, 1)
+                else:
+                    self._failed.add(frame)
+                self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.capture.release()
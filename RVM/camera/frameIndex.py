@@ -0,0 +1,385 @@
+# a persistent index of the frames of a video file for fast and accurate seeking
+import logging
+import os
+
+import cv2
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+log = logging.getLogger()
+
+INDEX_SUFFIX = ".frameindex.npz"
+# bump when the layout of the index file changes, older files are rebuilt
+INDEX_VERSION = 1
+# imdecode flags for decoding jpegs at a fraction of their size
+REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# opencv starts decoding this many frames before the frame it is asked to seek to
+SEEK_BACKOFF = 16
+
+
+class FrameIndex:
+    """The timestamp, keyframe flag and packet size of every frame of a video, in display order.
+
+    The index is built by reading the encoded packets of the video without decoding them, which takes a fraction of a second even for hours of video. It is saved beside the video (``<video>.frameindex.npz``) together with the size and modification time of the video, a changed video invalidates it.
+
+    OpenCV seeks by frame number or time rather than by byte, so packet sizes are kept instead of file offsets.
+
+    Parameters
+    ----------
+    path : str
+        The video file
+    timestamps : np.ndarray
+        The presentation time of every frame in seconds
+    keyframe : np.ndarray
+        Whether every frame is a keyframe
+    sizes : np.ndarray
+        The encoded size of every frame in bytes
+    video_size, video_mtime : int
+        The size and modification time (ns) of the video when it was indexed
+    standalone : bool
+        Whether every frame is a JPEG image that can be decoded on its own (MJPG)
+    size : tuple
+        The (width, height) of the frames
+    """
+
+    def __init__(
+        self,
+        path,
+        timestamps: np.ndarray,
+        keyframe: np.ndarray,
+        sizes: np.ndarray,
+        video_size: int,
+        video_mtime: int,
+        standalone: bool = False,
+        size: tuple = (0, 0),
+    ):
+        self.path = str(path)
+        self.timestamps = timestamps
+        self.keyframe = keyframe
+        self.sizes = sizes
+        self.keyframes = np.flatnonzero(keyframe)
+        self.video_size = video_size
+        self.video_mtime = video_mtime
+        self.standalone = standalone
+        self.size = size
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def fps(self) -> float:
+        """The average frame rate"""
+        if len(self) < 2 or self.timestamps[-1] <= self.timestamps[0]:
+            return 0.0
+        return (len(self) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+    @staticmethod
+    def indexPath(path) -> str:
+        return str(path) + INDEX_SUFFIX
+
+    @classmethod
+    def build(cls, path) -> "FrameIndex":
+        """Index a video by reading its packets without decoding them"""
+        stat = os.stat(path)
+        cap = cv2.VideoCapture(str(path), cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        if not cap.isOpened():
+            raise ValueError(f"Could not open the video {path}")
+        timestamps, keyframe, sizes = [], [], []
+        size = (0, 0)
+        standalone = False
+        try:
+            while True:
+                ok, packet = cap.read()
+                if not ok:
+                    break
+                if len(sizes) == 0:
+                    first = cv2.imdecode(packet, cv2.IMREAD_COLOR)
+                    if first is not None:
+                        standalone = True
+                        size = (first.shape[1], first.shape[0])
+                timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+                keyframe.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0)
+                sizes.append(packet.size)
+        finally:
+            cap.release()
+        timestamps = np.array(timestamps, dtype=np.float64) / 1000
+        # packets are in decode order, frames are numbered in display order
+        order = np.argsort(timestamps, kind="stable")
+        return cls(
+            path,
+            timestamps[order],
+            np.array(keyframe, dtype=bool)[order],
+            np.array(sizes, dtype=np.int64)[order],
+            stat.st_size,
+            stat.st_mtime_ns,
+            standalone and all(keyframe),
+            size,
+        )
+
+    @classmethod
+    def load(cls, path) -> "FrameIndex":
+        """Load the saved index of a video, None if there isn't one or the video changed since"""
+        try:
+            with np.load(cls.indexPath(path)) as data:
+                if int(data["version"]) != INDEX_VERSION:
+                    return None
+                index = cls(
+                    path,
+                    data["timestamps"],
+                    data["keyframe"],
+                    data["sizes"],
+                    int(data["video_size"]),
+                    int(data["video_mtime"]),
+                    bool(data["standalone"]),
+                    tuple(int(x) for x in data["size"]),
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+        return index if index.isValid() else None
+
+    @classmethod
+    def loadOrBuild(cls, path, save=True) -> "FrameIndex":
+        """Load the saved index of a video, building (and saving) it if needed"""
+        index = cls.load(path)
+        if index is None:
+            index = cls.build(path)
+            if save:
+                index.save()
+        return index
+
+    def isValid(self) -> bool:
+        """Whether the video is unchanged since it was indexed"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_size == self.video_size and stat.st_mtime_ns == self.video_mtime
+
+    def save(self):
+        """Save the index beside the video, a read only folder only costs rebuilding it next time"""
+        tmp = self.indexPath(self.path) + ".tmp"
+        try:
+            with open(tmp, "wb") as file:
+                np.savez(
+                    file,
+                    version=INDEX_VERSION,
+                    timestamps=self.timestamps,
+                    keyframe=self.keyframe,
+                    sizes=self.sizes,
+                    video_size=self.video_size,
+                    video_mtime=self.video_mtime,
+                    standalone=self.standalone,
+                    size=self.size,
+                )
+            os.replace(tmp, self.indexPath(self.path))
+        except OSError as e:
+            log.warning(f"Could not save the frame index of {self.path}: {e}")
+
+    def keyframeBefore(self, frame: int) -> int:
+        """The last keyframe at or before a frame, 0 if there is none"""
+        i = np.searchsorted(self.keyframes, frame, side="right") - 1
+        return int(self.keyframes[i]) if i >= 0 else 0
+
+    def frameAt(self, seconds: float) -> int:
+        """The frame shown at a time"""
+        return max(int(np.searchsorted(self.timestamps, seconds, side="right")) - 1, 0)
+
+
+class IndexedCapture:
+    """Reads a video file with seeking driven by its FrameIndex.
+
+    Videos whose frames are all standalone JPEG images (the MJPG files the recorder writes) are read as encoded packets and decoded with ``cv2.imdecode``, so seeking only moves the packet reader and any frame costs one decode. Skipping frames with ``grab`` costs no decoding at all.
+
+    For other codecs OpenCV decodes forward from a keyframe on every seek. The index is used to decode forward from the current position instead of seeking whenever that is cheaper, e.g. stepping a few frames forward inside a group of pictures. Without an index seeking falls back to ``CAP_PROP_POS_FRAMES``.
+
+    Parameters
+    ----------
+    path : str
+        The video file
+    index : FrameIndex, optional
+        The index of the video, can be set later with ``setIndex``
+    """
+
+    def __init__(self, path, index: FrameIndex = None):
+        self.path = str(path)
+        self.cap = cv2.VideoCapture(self.path)
+        self.raw = None
+        self.index = None
+        self._pending = None
+        # frames passed over with grab, without converting (or for MJPG decoding) them
+        self.skipped = 0
+        # the number of the frame the next read returns
+        self.position = 0
+        self.setIndex(index)
+
+    def setIndex(self, index: FrameIndex):
+        """Start using an index, switching to reading packets if the frames are standalone images"""
+        self.index = index
+        if index is None or not index.standalone or self.raw is not None:
+            return
+        raw = cv2.VideoCapture(self.path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        if not raw.isOpened():
+            return
+        self.raw = raw
+        self.cap.release()
+        # the packet reader starts at the first frame
+        position, self.position = self.position, 0
+        self.seek(position)
+
+    def isOpened(self) -> bool:
+        return (self.raw or self.cap).isOpened()
+
+    def get(self, prop: int) -> float:
+        """Get a property of the decoding capture, see cv2.VideoCapture.get"""
+        if self.raw is not None:
+            if prop == cv2.CAP_PROP_FRAME_COUNT:
+                return len(self.index)
+            if prop == cv2.CAP_PROP_POS_FRAMES:
+                return self.position
+            if prop == cv2.CAP_PROP_FPS:
+                return self.index.fps
+            if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT):
+                return self.index.size[prop == cv2.CAP_PROP_FRAME_HEIGHT]
+        return self.cap.get(prop)
+
+    def __len__(self):
+        if self.index is not None:
+            return len(self.index)
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def read(self, scale: int = 1):
+        """Read the next frame
+
+        Parameters
+        ----------
+        scale : int, optional
+            1, 2, 4 or 8: MJPG frames are decoded at 1/scale of their size, which is much faster. Other videos are always read at full size.
+        """
+        if self.raw is not None:
+            if self._pending is not None:
+                self._applySeek()
+            ok, packet = self.raw.read()
+            frame = cv2.imdecode(packet, REDUCED_READ_FLAGS[scale]) if ok else None
+            ok = frame is not None
+        else:
+            ok, frame = self.cap.read()
+        if ok:
+            self.position += 1
+        return ok, frame
+
+    def grab(self) -> bool:
+        if self._pending is not None:
+            self._applySeek()
+        ok = (self.raw or self.cap).grab()
+        if ok:
+            self.position += 1
+            self.skipped += 1
+        return ok
+
+    def seek(self, frame: int):
+        """Position the capture so the next read returns ``frame``"""
+        frame = max(0, min(frame, len(self) - 1))
+        if frame == self.position:
+            return
+        if self.index is None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+            self.position = frame
+            return
+        if self.raw is not None:
+            self._seekRaw(frame)
+            return
+        # opencv seeks to the keyframe before (frame - SEEK_BACKOFF) then decodes
+        # forward, decoding forward from here is cheaper if it is fewer frames
+        cost = frame - self.index.keyframeBefore(frame - SEEK_BACKOFF)
+        if not 0 < frame - self.position <= cost:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+            self.position = frame
+            return
+        while self.position < frame:
+            if not self.grab():
+                break
+
+    def _seekRaw(self, frame: int):
+        # reading packets without decoding is nearly free, so short skips just read
+        if self._pending is None and 0 < frame - self.position <= SEEK_BACKOFF:
+            while self.position < frame:
+                if not self.grab():
+                    break
+            return
+        # the packet reader ignores a seek that directly follows another one, so
+        # seeks are applied by the next read
+        self._pending = frame
+        self.position = frame
+
+    def _applySeek(self):
+        frame, self._pending = self._pending, None
+        self.raw.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        if self.raw.get(cv2.CAP_PROP_POS_FRAMES) != frame:
+            # read a packet and try again before reading up to the frame
+            self.raw.grab()
+            self.raw.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        landed = int(self.raw.get(cv2.CAP_PROP_POS_FRAMES))
+        if landed != frame:
+            log.debug(f"Seek to frame {frame} of {self.path} landed on {landed}")
+            self.raw.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(frame):
+                if not self.raw.grab():
+                    break
+
+    def release(self):
+        self.cap.release()
+        if self.raw is not None:
+            self.raw.release()
+
+
+class frameIndexerSignals(QObject):
+    """Defines the signals available from the frame indexer
+
+    Supported signals are:
+    indexed: `str` the video path, `object` its FrameIndex
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    indexed = pyqtSignal(str, object)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class frameIndexer(QObject):
+    """Loads or builds the frame indexes of videos in a background thread
+
+    Parameters
+    ----------
+    paths : list
+        The videos to index
+    """
+
+    def __init__(self, paths: list):
+        super(frameIndexer, self).__init__()
+        self.paths = list(paths)
+        self.signals = frameIndexerSignals()
+        self.kill = False
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            for path in self.paths:
+                if self.kill:
+                    break
+                try:
+                    index = FrameIndex.loadOrBuild(path)
+                except Exception as e:
+                    self.signals.error.emit(f"Could not index {path}: {e}", True)
+                    continue
+                self.signals.indexed.emit(str(path), index)
+        finally:
+            self.signals.finished.emit()
+
+    def stop(self):
+        self.kill = True
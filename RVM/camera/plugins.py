@@ -0,0 +1,269 @@
+# real time analysis of the frames of a camera by plugins
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+
+log = logging.getLogger()
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+def sharedPool() -> ThreadPoolExecutor:
+    """The worker threads every camera's plugins run on, opencv and numpy release the GIL so threads run in parallel"""
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=max(2, os.cpu_count() or 2),
+                thread_name_prefix="FramePlugin",
+            )
+        return _pool
+
+
+class FramePlugin:
+    """An analysis that runs on the frames of a camera as they are captured.
+
+    Subclasses implement ``process`` and optionally ``start`` and ``finish``. A plugin gets one frame at a time, in order, so it can keep state between frames. Frames it has no time for are dropped, never queued.
+
+    Parameters
+    ----------
+    name : str
+        Identifies the plugin in results and statistics
+    decimation : int, optional
+        Only every nth captured frame is offered to the plugin, by default 1
+    scale : int, optional
+        Frames are shrunk to 1/scale of their size before ``process``, by default 1
+    gray : bool, optional
+        Frames are converted to grayscale before ``process``, by default False
+    budget_ms : float, optional
+        The processing time per frame the plugin may use. A plugin that takes longer on average is offered proportionally fewer frames, by default no limit
+    """
+
+    def __init__(
+        self,
+        name: str,
+        decimation: int = 1,
+        scale: int = 1,
+        gray: bool = False,
+        budget_ms: float = None,
+    ):
+        self.name = name
+        self.decimation = max(1, int(decimation))
+        self.scale = max(1, int(scale))
+        self.gray = gray
+        self.budget_ms = budget_ms
+
+    def start(self, shape: tuple, fps: float):
+        """Called before the first frame with the (height, width) of the frames ``process`` gets and the capture frame rate"""
+
+    def process(self, frame_number: int, frame: np.ndarray):
+        """Analyse a frame, returns a result for ``PluginHost.signals.result`` or None. Must not modify the frame."""
+        raise NotImplementedError
+
+    def finish(self) -> dict:
+        """Called after the last frame, returns anything worth keeping"""
+        return {}
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Shrink and convert a captured frame for ``process``"""
+        if self.scale > 1:
+            frame = cv2.resize(
+                frame,
+                (frame.shape[1] // self.scale, frame.shape[0] // self.scale),
+                interpolation=cv2.INTER_AREA,
+            )
+        if self.gray and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+
+class MotionPlugin(FramePlugin):
+    """The fraction of pixels that changed by more than ``pixel_threshold`` grey levels since the last frame processed"""
+
+    def __init__(
+        self, name="motion", pixel_threshold: int = 20, scale: int = 4, **kwargs
+    ):
+        super().__init__(name, scale=scale, gray=True, **kwargs)
+        self.pixel_threshold = pixel_threshold
+        self.previous = None
+
+    def process(self, frame_number, frame):
+        previous, self.previous = self.previous, frame
+        if previous is None:
+            return 0.0
+        moving = cv2.absdiff(frame, previous) > self.pixel_threshold
+        return np.count_nonzero(moving) / moving.size
+
+
+class ROIIntensityPlugin(FramePlugin):
+    """The mean grey level in each of a set of regions, e.g. to see when a cue light is on
+
+    Parameters
+    ----------
+    rois : dict
+        region name -> (x, y, width, height) in video pixels
+    """
+
+    def __init__(self, rois: dict, name="roi_intensity", **kwargs):
+        super().__init__(name, gray=True, **kwargs)
+        self.rois = {
+            roi: tuple(int(v) // self.scale for v in box) for roi, box in rois.items()
+        }
+
+    def process(self, frame_number, frame):
+        return {
+            roi: float(frame[y : y + h, x : x + w].mean()) if w and h else np.nan
+            for roi, (x, y, w, h) in self.rois.items()
+        }
+
+
+class pluginHostSignals(QObject):
+    """Defines the signals available from a plugin host
+
+    Supported signals are:
+    result: `str` plugin name, `int` frame number, `object` the result of ``process``
+    finished: `str` plugin name, `dict` the result of ``finish`` with its statistics
+    error: a string message and a bool whether this is worth printing to the log
+    """
+
+    result = pyqtSignal(str, int, object)
+    finished = pyqtSignal(str, dict)
+    error = pyqtSignal(str, bool)
+
+
+class _PluginState:
+    """Bookkeeping of one plugin in a host"""
+
+    def __init__(self, plugin: FramePlugin):
+        self.plugin = plugin
+        self.future = None
+        self.started = False
+        self.offered = 0
+        self.processed = 0
+        self.dropped = 0
+        self.over_budget = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # moving average of the processing time
+        self.average = 0.0
+        self.latency = 0.0
+        # the decimation after slowing the plugin down to its budget
+        self.stride = plugin.decimation
+
+    def stats(self) -> dict:
+        return {
+            "offered": self.offered,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "over_budget": self.over_budget,
+            "mean_ms": 1000 * self.total_time / self.processed
+            if self.processed
+            else 0.0,
+            "max_ms": 1000 * self.max_time,
+            "latency_ms": 1000 * self.latency,
+            "decimation": self.stride,
+        }
+
+
+class PluginHost:
+    """Runs the plugins of one camera on the shared worker pool.
+
+    ``push`` is called by the camera for every captured frame and returns at once: each plugin that is due a frame and is not still busy with its previous one gets a task on the pool, a busy plugin has the frame dropped. The capture is never held up by a plugin.
+
+    Parameters
+    ----------
+    fps : float
+        The capture frame rate
+    pool : ThreadPoolExecutor, optional
+        By default the ``sharedPool``
+    """
+
+    def __init__(self, fps: float, pool: ThreadPoolExecutor = None):
+        self.fps = fps
+        self.pool = pool or sharedPool()
+        self.signals = pluginHostSignals()
+        self._plugins = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._plugins
+
+    def add(self, plugin: FramePlugin):
+        with self._lock:
+            if plugin.name in self._plugins:
+                raise ValueError(f"There is already a plugin named {plugin.name}")
+            self._plugins[plugin.name] = _PluginState(plugin)
+
+    def push(self, frame_number: int, frame: np.ndarray):
+        """Offer a captured frame to the plugins"""
+        with self._lock:
+            for state in self._plugins.values():
+                if frame_number % state.stride:
+                    continue
+                state.offered += 1
+                if state.future is not None and not state.future.done():
+                    state.dropped += 1
+                    continue
+                state.future = self.pool.submit(
+                    self._run, state, frame_number, frame, time.perf_counter()
+                )
+
+    def _run(self, state: _PluginState, frame_number: int, frame, queued: float):
+        plugin = state.plugin
+        try:
+            start = time.perf_counter()
+            frame = plugin.prepare(frame)
+            if not state.started:
+                plugin.start(frame.shape[:2], self.fps / plugin.decimation)
+                state.started = True
+            result = plugin.process(frame_number, frame)
+            done = time.perf_counter()
+        except Exception as e:
+            self.signals.error.emit(f"Plugin {plugin.name} failed: {e}", True)
+            return
+        elapsed = done - start
+        state.processed += 1
+        state.total_time += elapsed
+        state.max_time = max(state.max_time, elapsed)
+        state.latency = done - queued
+        state.average += (elapsed - state.average) * 0.1
+        if plugin.budget_ms is not None:
+            if elapsed * 1000 > plugin.budget_ms:
+                state.over_budget += 1
+            # offer fewer frames until the average fits the budget
+            state.stride = plugin.decimation * max(
+                1, math.ceil(state.average * 1000 / plugin.budget_ms)
+            )
+        if result is not None:
+            self.signals.result.emit(plugin.name, frame_number, result)
+
+    def stats(self) -> dict:
+        """plugin name -> its timing and drop statistics"""
+        return {name: state.stats() for name, state in self._plugins.items()}
+
+    def finish(self, name: str = None):
+        """Finish one or all plugins once their last frame is processed, without blocking, see ``signals.finished``"""
+        with self._lock:
+            names = [name] if name is not None else list(self._plugins)
+            states = [self._plugins.pop(n) for n in names if n in self._plugins]
+        for state in states:
+            self.pool.submit(self._finish, state)
+
+    def _finish(self, state: _PluginState):
+        if state.future is not None:
+            state.future.result()
+        try:
+            result = state.plugin.finish() or {}
+        except Exception as e:
+            self.signals.error.emit(f"Plugin {state.plugin.name} failed: {e}", True)
+            result = {}
+        result.update(state.stats())
+        self.signals.finished.emit(state.plugin.name, result)
@@ -0,0 +1,177 @@
+# low resolution proxy copies of trial videos for fast review
+import datetime
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.camera.frameIndex import FrameIndex, IndexedCapture
+
+log = logging.getLogger()
+
+PROXY_DIR_NAME = "proxies"
+PROXY_WIDTH = 320
+# jpeg quality of the proxy frames, they are only for finding things
+PROXY_QUALITY = 75
+
+
+def proxyPath(project_location, uid: str) -> str:
+    """Where the proxy of a trial is kept: in the project folder, so review does not read from network shares"""
+    return os.path.join(str(project_location), PROXY_DIR_NAME, f"{uid}.avi")
+
+
+def transcodeProxy(
+    source, target, width: int = PROXY_WIDTH, quality: int = PROXY_QUALITY
+) -> dict:
+    """Write a small all intra (MJPG) copy of a video with the same frames, runs in a worker process
+
+    Returns
+    -------
+    dict
+        The fields of a ProxyBase for the proxy
+    """
+    stat = os.stat(source)
+    index = FrameIndex.loadOrBuild(source)
+    capture = IndexedCapture(source, index)
+    try:
+        fps = index.fps or capture.get(cv2.CAP_PROP_FPS)
+        src_width, src_height = index.size
+        if src_width <= 0:
+            src_width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            src_height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        width = min(width, src_width)
+        height = int(round(src_height * width / src_width / 2) * 2)
+        # mjpg frames can be decoded straight to a fraction of their size
+        scale = 1
+        while scale < 8 and src_width // (scale * 2) >= width:
+            scale *= 2
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = target + ".part.avi"
+        writer = cv2.VideoWriter(
+            partial, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height)
+        )
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, quality)
+        frames = 0
+        try:
+            while True:
+                ok, frame = capture.read(scale)
+                if not ok:
+                    break
+                writer.write(
+                    cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                )
+                frames += 1
+        finally:
+            writer.release()
+    finally:
+        capture.release()
+    os.replace(partial, target)
+    return {
+        "location": target,
+        "width": width,
+        "height": height,
+        "frames": frames,
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime_ns,
+        "created": datetime.datetime.now(),
+    }
+
+
+def exportClip(source, target, start: int, end: int, fps: float = None) -> int:
+    """Copy frames [start, end) of a video, decoded from the original for frame accuracy
+
+    Returns
+    -------
+    int
+        The number of frames written
+    """
+    capture = IndexedCapture(source, FrameIndex.loadOrBuild(source))
+    writer = None
+    written = 0
+    try:
+        fps = fps or capture.get(cv2.CAP_PROP_FPS)
+        capture.seek(start)
+        for _ in range(start, end):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if writer is None:
+                writer = cv2.VideoWriter(
+                    str(target),
+                    cv2.VideoWriter_fourcc(*"MJPG"),
+                    fps,
+                    (frame.shape[1], frame.shape[0]),
+                )
+            writer.write(frame)
+            written += 1
+    finally:
+        capture.release()
+        if writer is not None:
+            writer.release()
+    return written
+
+
+class proxyMakerSignals(QObject):
+    """Defines the signals available from the proxy maker
+
+    Supported signals are:
+    made: `str` the trial uid, `dict` the fields of its ProxyBase
+    progress: `int` proxies done, `int` number of proxies
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    made = pyqtSignal(str, dict)
+    progress = pyqtSignal(int, int)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class proxyMaker(QObject):
+    """Transcodes proxies across a process pool, run it in a QThread
+
+    The proxies are recorded on the trials by whoever receives ``made``, in the gui thread.
+
+    Parameters
+    ----------
+    jobs : list
+        (trial uid, video path, proxy path) of the proxies to make
+    max_workers : int, optional
+        The number of worker processes, by default half the cpus
+    """
+
+    def __init__(self, jobs: list, max_workers: int = None):
+        super(proxyMaker, self).__init__()
+        self.jobs = list(jobs)
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.signals = proxyMakerSignals()
+        self.kill = False
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {
+                    pool.submit(transcodeProxy, source, target): uid
+                    for uid, source, target in self.jobs
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    uid = futures[future]
+                    try:
+                        self.signals.made.emit(uid, future.result())
+                    except Exception as e:
+                        self.signals.error.emit(
+                            f"Could not make the proxy of trial {uid}: {e}", True
+                        )
+                    self.signals.progress.emit(done, len(futures))
+                    if self.kill:
+                        for future in futures:
+                            future.cancel()
+                        break
+        finally:
+            self.signals.finished.emit()
+
+    def stop(self):
+        self.kill = True
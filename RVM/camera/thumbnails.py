@@ -0,0 +1,334 @@
+# background generation of video thumbnails for timeline strips
+import json
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.camera.frameIndex import FrameIndex, IndexedCapture
+
+log = logging.getLogger()
+
+THUMBS_SUFFIX = ".thumbs.npy"
+META_SUFFIX = ".thumbs.json"
+# bump when the layout of the cache changes, older caches are regenerated
+THUMBS_VERSION = 1
+# progress is written to disk every this many thumbnails
+FLUSH_EVERY = 16
+
+# video path -> lock held while its thumbnails are generated, see generateThumbnails
+_videoLocks = {}
+_videoLocksLock = threading.Lock()
+
+
+def _videoLock(path) -> threading.Lock:
+    with _videoLocksLock:
+        return _videoLocks.setdefault(os.path.abspath(str(path)), threading.Lock())
+
+
+class ThumbnailCache:
+    """The thumbnails of one video, one every ``interval`` seconds, in a single memory mapped array.
+
+    The thumbnails are kept in ``<video>.thumbs.npy`` as an (n, height, width, 3) uint8 array that can be opened with ``np.load(mmap_mode="r")``, so showing a timeline never reads more than the thumbnails drawn. ``<video>.thumbs.json`` records how many are done and the size and modification time of the video; generation resumes from there after an interruption and starts over if the video changed.
+
+    Parameters
+    ----------
+    path : str
+        The video file
+    thumbs : np.ndarray
+        The (memory mapped) thumbnails
+    meta : dict
+        The contents of the json file
+    """
+
+    def __init__(self, path, thumbs: np.ndarray, meta: dict):
+        self.path = str(path)
+        self.thumbs = thumbs
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.meta["frames"])
+
+    @property
+    def done(self) -> int:
+        """How many thumbnails, from the start, have been generated"""
+        return self.meta["done"]
+
+    @property
+    def complete(self) -> bool:
+        return self.done >= len(self)
+
+    @property
+    def interval(self) -> float:
+        return self.meta["interval"]
+
+    @property
+    def frames(self) -> list:
+        """The frame number of every thumbnail"""
+        return self.meta["frames"]
+
+    @staticmethod
+    def paths(path) -> tuple:
+        return str(path) + THUMBS_SUFFIX, str(path) + META_SUFFIX
+
+    @classmethod
+    def load(cls, path, writable=False) -> "ThumbnailCache":
+        """Open the thumbnails of a video, None if there are none or the video changed since"""
+        thumbs_path, meta_path = cls.paths(path)
+        try:
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+            stat = os.stat(path)
+            if (
+                meta.get("version") != THUMBS_VERSION
+                or meta["video_size"] != stat.st_size
+                or meta["video_mtime"] != stat.st_mtime_ns
+            ):
+                return None
+            thumbs = np.load(thumbs_path, mmap_mode="r+" if writable else "r")
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(path, thumbs, meta)
+
+    @classmethod
+    def create(cls, path, interval: float, height: int) -> "ThumbnailCache":
+        """Start new thumbnails for a video, replacing any old ones"""
+        index = FrameIndex.load(path)
+        cap = cv2.VideoCapture(str(path))
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            video_height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        finally:
+            cap.release()
+        if index is not None:
+            count = len(index)
+            duration = index.timestamps[-1] if count > 0 else 0.0
+        else:
+            duration = count / fps if fps > 0 else 0.0
+        if count <= 0 or video_height <= 0:
+            raise ValueError(f"Could not read the video {path}")
+        times = np.arange(0.0, max(duration, 0.0) + 1e-9, interval)
+        if index is not None:
+            frames = [index.frameAt(t) for t in times]
+        else:
+            frames = [min(int(round(t * fps)), count - 1) for t in times]
+        # even widths keep every row aligned
+        thumb_width = int(round(height * width / video_height / 2) * 2)
+        thumbs_path, meta_path = cls.paths(path)
+        thumbs = np.lib.format.open_memmap(
+            thumbs_path,
+            mode="w+",
+            dtype=np.uint8,
+            shape=(len(frames), height, thumb_width, 3),
+        )
+        stat = os.stat(path)
+        meta = {
+            "version": THUMBS_VERSION,
+            "video_size": stat.st_size,
+            "video_mtime": stat.st_mtime_ns,
+            "interval": interval,
+            "frames": frames,
+            "done": 0,
+        }
+        cache = cls(path, thumbs, meta)
+        cache.flush()
+        return cache
+
+    @classmethod
+    def open(cls, path, interval: float, height: int) -> "ThumbnailCache":
+        """Open the thumbnails of a video to continue generating them, starting over if the settings differ"""
+        cache = cls.load(path, writable=True)
+        if (
+            cache is None
+            or cache.interval != interval
+            or cache.thumbs.shape[1] != height
+        ):
+            cache = cls.create(path, interval, height)
+        return cache
+
+    def flush(self):
+        """Write the thumbnails, then the progress, so the progress never runs ahead of the data"""
+        self.thumbs.flush()
+        _, meta_path = self.paths(self.path)
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump(self.meta, file)
+        os.replace(tmp, meta_path)
+
+    def timeOf(self, i: int) -> float:
+        return i * self.interval
+
+
+def generateThumbnails(
+    path,
+    interval: float = 10.0,
+    height: int = 72,
+    wait=None,
+    stopped=None,
+    progress=None,
+) -> ThumbnailCache:
+    """Generate (or finish generating) the thumbnails of a video
+
+    Only one job works on a video at a time, a second one (e.g. the scoring widget and the menu action asking for the same video) waits for the first and then finds the thumbnails done, instead of recreating the cache under it.
+
+    Parameters
+    ----------
+    path : str
+        The video file
+    interval : float, optional
+        Seconds between thumbnails, by default 10
+    height : int, optional
+        The height of the thumbnails in pixels, by default 72
+    wait : callable, optional
+        Called before every thumbnail, blocks while generation should yield (e.g. during recordings)
+    stopped : callable, optional
+        Returns True when generation should stop, what is done so far is kept
+    progress : callable, optional
+        Called with (done, total) after every flush
+
+    Returns
+    -------
+    ThumbnailCache
+        The thumbnails, possibly incomplete if stopped, None if stopped while waiting for another job on the video
+    """
+    lock = _videoLock(path)
+    while not lock.acquire(timeout=0.5):
+        if stopped is not None and stopped():
+            return ThumbnailCache.load(path)
+    try:
+        return _generate(path, interval, height, wait, stopped, progress)
+    finally:
+        lock.release()
+
+
+def _generate(path, interval, height, wait, stopped, progress) -> ThumbnailCache:
+    cache = ThumbnailCache.open(path, interval, height)
+    if cache.complete:
+        return cache
+    index = FrameIndex.load(path)
+    capture = IndexedCapture(path, index)
+    shape = cache.thumbs.shape
+    # jpeg frames can be decoded straight to a fraction of their size
+    scale = 1
+    if index is not None and index.standalone and index.size[1] > 0:
+        scale = 2 ** min(3, int(math.log2(max(index.size[1] // height, 1))))
+    try:
+        for i in range(cache.done, len(cache)):
+            if wait is not None:
+                wait()
+            if stopped is not None and stopped():
+                break
+            capture.seek(cache.frames[i])
+            ok, frame = capture.read(scale)
+            if ok:
+                cache.thumbs[i] = cv2.resize(
+                    frame, (shape[2], shape[1]), interpolation=cv2.INTER_AREA
+                )
+            cache.meta["done"] = i + 1
+            if (i + 1) % FLUSH_EVERY == 0 or i + 1 == len(cache):
+                cache.flush()
+                if progress is not None:
+                    progress(i + 1, len(cache))
+    finally:
+        cache.flush()
+        capture.release()
+    return cache
+
+
+class thumbnailerSignals(QObject):
+    """Defines the signals available from the thumbnailer
+
+    Supported signals are:
+    progress: `str` the video, `int` thumbnails done, `int` number of thumbnails
+    done: `str` the video whose thumbnails are complete
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    progress = pyqtSignal(str, int, int)
+    done = pyqtSignal(str)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class thumbnailer(QObject):
+    """Generates the thumbnails of videos across a pool of worker threads, run it in a QThread
+
+    Generation pauses while ``setYield(True)`` is in effect (the main window sets this while cameras are recording) and can be stopped at any time, it resumes where it left off the next time.
+
+    Parameters
+    ----------
+    paths : list
+        The videos
+    interval : float, optional
+        Seconds between thumbnails, by default 10
+    height : int, optional
+        The height of the thumbnails in pixels, by default 72
+    max_workers : int, optional
+        How many videos are worked on at once, by default 2
+    """
+
+    def __init__(
+        self,
+        paths: list,
+        interval: float = 10.0,
+        height: int = 72,
+        max_workers: int = 2,
+    ):
+        super(thumbnailer, self).__init__()
+        self.paths = [str(path) for path in paths]
+        self.interval = interval
+        self.height = height
+        self.max_workers = max_workers
+        self.signals = thumbnailerSignals()
+        self._stop = threading.Event()
+        self._go = threading.Event()
+        self._go.set()
+
+    def setYield(self, yielding: bool):
+        """Pause (True) or resume (False) generation"""
+        if yielding:
+            self._go.clear()
+        else:
+            self._go.set()
+
+    def _wait(self):
+        while not self._go.wait(0.5):
+            if self._stop.is_set():
+                return
+
+    def _generate(self, path):
+        try:
+            cache = generateThumbnails(
+                path,
+                self.interval,
+                self.height,
+                wait=self._wait,
+                stopped=self._stop.is_set,
+                progress=lambda done, total: self.signals.progress.emit(
+                    path, done, total
+                ),
+            )
+            if cache is not None and cache.complete:
+                self.signals.done.emit(path)
+        except Exception as e:
+            self.signals.error.emit(f"Could not make thumbnails of {path}: {e}", True)
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(self._generate, self.paths))
+        finally:
+            self.signals.finished.emit()
+
+    def stop(self):
+        self._stop.set()
+        self._go.set()
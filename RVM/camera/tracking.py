@@ -0,0 +1,211 @@
+# online animal tracking by background subtraction
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from RVM.camera.plugins import FramePlugin
+
+log = logging.getLogger()
+
+TRACK_SUFFIX = ".track.npy"
+OCCUPANCY_SUFFIX = ".occupancy.npy"
+# one row per frame, nan position and zero area when nothing was found
+TRACK_DTYPE = np.dtype([("frame", "<u4"), ("x", "<f4"), ("y", "<f4"), ("area", "<f4")])
+# positions are binned into the occupancy map this many at a time
+OCCUPANCY_BATCH = 64
+
+
+class BackgroundTracker:
+    """Finds the animal in grayscale frames as the largest blob that differs from a running average background.
+
+    The background adapts with ``learning_rate`` everywhere except under the animal, so a still animal is not absorbed into it while ghosts and lighting changes fade. During the first ``warmup`` frames the whole background learns fast to build it; an animal that is in view and barely moves during that time leaves a ghost that joins its blob until it moves away.
+
+    Parameters
+    ----------
+    shape : tuple
+        (height, width) of the frames
+    threshold : int, optional
+        Grey levels a pixel must differ from the background to be foreground, by default 25
+    learning_rate : float, optional
+        How fast the background adapts per frame, by default 0.01
+    min_area : int, optional
+        The fewest foreground pixels that count as the animal, by default 20
+    warmup : int, optional
+        Frames before the tracker reports positions, by default 30
+    """
+
+    def __init__(
+        self,
+        shape: tuple,
+        threshold: int = 25,
+        learning_rate: float = 0.01,
+        min_area: int = 20,
+        warmup: int = 30,
+    ):
+        self.shape = tuple(shape)
+        self.threshold = threshold
+        self.learning_rate = learning_rate
+        self.min_area = min_area
+        self.warmup = warmup
+        self.frames = 0
+        self.background = None
+        self._diff = np.empty(self.shape, dtype=np.float32)
+
+    def update(self, gray: np.ndarray) -> tuple:
+        """Find the animal in a frame and update the background
+
+        Returns
+        -------
+        tuple
+            (x, y, area) in pixels of the frame, (nan, nan, 0) if nothing was found
+        """
+        self.frames += 1
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return np.nan, np.nan, 0
+        np.subtract(gray, self.background, out=self._diff, dtype=np.float32)
+        if self.frames <= self.warmup:
+            self.background += self._diff * max(self.learning_rate, 0.2)
+            return np.nan, np.nan, 0
+        foreground = (np.abs(self._diff) > self.threshold).view(np.uint8)
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(
+            foreground, connectivity=8
+        )
+        self._diff *= self.learning_rate
+        if count < 2:
+            self.background += self._diff
+            return np.nan, np.nan, 0
+        # label 0 is the background
+        best = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        area = int(stats[best, cv2.CC_STAT_AREA])
+        if area < self.min_area:
+            self.background += self._diff
+            return np.nan, np.nan, area
+        # learn everywhere but the animal
+        self._diff[labels == best] = 0
+        self.background += self._diff
+        x, y = centroids[best]
+        return float(x), float(y), area
+
+
+class OccupancyMap:
+    """Counts the frames spent in each pixel of a (downscaled) frame
+
+    Positions are buffered and added with ``np.bincount`` in batches.
+
+    Parameters
+    ----------
+    shape : tuple
+        (height, width) of the map
+    """
+
+    def __init__(self, shape: tuple):
+        self.shape = tuple(shape)
+        self.counts = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+        self._pending = []
+
+    def add(self, x: float, y: float):
+        if x == x and y == y:
+            self._pending.append(
+                min(int(y), self.shape[0] - 1) * self.shape[1]
+                + min(int(x), self.shape[1] - 1)
+            )
+            if len(self._pending) >= OCCUPANCY_BATCH:
+                self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.counts += np.bincount(self._pending, minlength=len(self.counts))
+            self._pending = []
+
+    @property
+    def map(self) -> np.ndarray:
+        self.flush()
+        return self.counts.reshape(self.shape)
+
+
+class TrackFile:
+    """Positions of one recording, appended to a raw file as they come in and saved as a .npy array at the end
+
+    Parameters
+    ----------
+    path : str
+        The .npy file to write, the raw rows go to ``<path>.part`` until ``close``
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.part = self.path + ".part"
+        self.rows = 0
+        self._buffer = np.empty(OCCUPANCY_BATCH, dtype=TRACK_DTYPE)
+        self._n = 0
+        self._file = open(self.part, "wb")
+
+    def append(self, frame: int, x: float, y: float, area: float):
+        self._buffer[self._n] = (frame, x, y, area)
+        self._n += 1
+        if self._n == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer[: self._n].tobytes())
+        self.rows += self._n
+        self._n = 0
+
+    def close(self) -> str:
+        """Write the .npy file and remove the raw file, returns the path"""
+        self.flush()
+        self._file.close()
+        np.save(self.path, np.fromfile(self.part, dtype=TRACK_DTYPE))
+        os.remove(self.part)
+        return self.path
+
+
+class TrackingPlugin(FramePlugin):
+    """Tracks the animal in the frames of a recording, see ``BackgroundTracker``
+
+    The positions are written to ``<path>.track.npy`` and the occupancy map to ``<path>.occupancy.npy``. Frames the plugin has no time for are skipped and have no row.
+
+    Parameters
+    ----------
+    path : str
+        The recording
+    scale : int, optional
+        Frames are tracked at 1/scale of their size, by default 4
+    **kwargs
+        Passed to ``BackgroundTracker``
+    """
+
+    def __init__(self, path, name="tracking", scale: int = 4, budget_ms=None, **kwargs):
+        super().__init__(name, scale=scale, gray=True, budget_ms=budget_ms)
+        self.path = str(path)
+        self.kwargs = kwargs
+        self.track = None
+        self.tracker = None
+        self.occupancy = None
+
+    def start(self, shape, fps):
+        self.tracker = BackgroundTracker(shape, **self.kwargs)
+        self.occupancy = OccupancyMap(shape)
+        self.track = TrackFile(self.path + TRACK_SUFFIX)
+
+    def process(self, frame_number, frame):
+        x, y, area = self.tracker.update(frame)
+        self.occupancy.add(x, y)
+        # positions are stored in video pixels
+        x, y, area = x * self.scale, y * self.scale, area * self.scale**2
+        self.track.append(frame_number, x, y, area)
+        return x, y, area
+
+    def finish(self) -> dict:
+        if self.track is None:
+            return {}
+        occupancy_location = self.path + OCCUPANCY_SUFFIX
+        np.save(occupancy_location, self.occupancy.map)
+        return {
+            "location": self.track.close(),
+            "occupancy_location": occupancy_location,
+            "scale": self.scale,
+        }
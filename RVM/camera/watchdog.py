@@ -0,0 +1,211 @@
+# notices a camera that stopped delivering frames and reconnects it
+import logging
+import threading
+import time
+import zlib
+
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+
+log = logging.getLogger()
+
+# frame periods without a new frame before a camera is considered stalled
+STALL_PERIODS = 30
+# seconds a stall lasts at least, for high frame rates
+MIN_STALL_TIME = 1.0
+# seconds between reconnect attempts, doubling up to the maximum
+RETRY_INTERVAL = 1.0
+MAX_RETRY_INTERVAL = 10.0
+
+# what the reader does with a frame, see CameraWatchdog.check
+PUBLISH = 0
+WITHHOLD = 1
+RECOVERED = 2
+
+
+def frameSignature(frame: np.ndarray) -> int:
+    """A cheap checksum of a frame, from every 8th pixel of every 8th row. Frames with the same signature are (almost certainly) the same image."""
+    return zlib.crc32(np.ascontiguousarray(frame[::8, ::8]))
+
+
+class watchdogSignals(QObject):
+    """Defines the signals available from a camera watchdog
+
+    Supported signals are:
+    stalled: `str` why the camera is considered stalled
+    recovered: `float` seconds the camera was stalled, `int` frames padded in for the stall
+    error: a string message and a bool whether this is worth printing to the log
+    """
+
+    stalled = pyqtSignal(str)
+    recovered = pyqtSignal(float, int)
+    error = pyqtSignal(str, bool)
+
+
+class CameraWatchdog:
+    """Watches the frames a reader gets from a device and reconnects the device when it stalls.
+
+    A camera is stalled when there was no new frame for ``stall_periods`` frame periods: the reads fail, they keep returning the same image (a device that froze), or a read does not return at all, which a monitor thread notices (see ``start``). The reader then keeps running but publishes nothing, and the device is closed and reopened in a background thread, retrying with a growing interval until it delivers frames again. Once it does the reader pads the time lost with the last frame (see ``vidReader.checkDrop``), so the recording stays in step with the clock and its writer never closes.
+
+    Some scenes legitimately give the same image over and over (a covered lens). If the image is still the same after a successful reconnect it is accepted and published again, until the image changes.
+
+    Parameters
+    ----------
+    vc : VideoCapture
+        The device to watch
+    stall_periods : int, optional
+        Frame periods without a new frame before the camera is stalled, by default STALL_PERIODS
+    """
+
+    def __init__(self, vc, stall_periods: int = STALL_PERIODS):
+        self.vc = vc
+        self.session = vc.session
+        self.stall_periods = stall_periods
+        self.signals = watchdogSignals()
+        self.stalled = False
+        self.reason = ""
+        self.stallStart = 0.0
+        self.lastNew = time.monotonic()
+        self.lastSignature = None
+        # an image accepted as genuinely unchanging, see check
+        self.acceptedSignature = None
+        self.reconnects = 0
+        self.kill = False
+        # when the reader last got back from a read, see _monitor
+        self.lastCheck = self.lastNew
+        # the reader and the monitor both decide on stalls
+        self._lock = threading.Lock()
+        self._reconnected = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._monitorThread = None
+
+    @property
+    def stallTime(self) -> float:
+        """Seconds without a new frame before the camera is stalled"""
+        return max(MIN_STALL_TIME, self.stall_periods * self.vc.mspf / 1000)
+
+    def check(self, frame: np.ndarray) -> int:
+        """Look at the result of a read, run by the reader after every read.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The frame read, None if the read failed
+
+        Returns
+        -------
+        int
+            PUBLISH the frame, WITHHOLD it because the camera is stalled, or the camera RECOVERED with this frame (the reader pads the stall and calls ``recovered``)
+        """
+        with self._lock:
+            return self._check(frame, time.monotonic())
+
+    def _check(self, frame: np.ndarray, now: float) -> int:
+        self.lastCheck = now
+        new = frame is not None
+        if new:
+            signature = frameSignature(frame)
+            new = signature != self.lastSignature or signature == self.acceptedSignature
+            if signature != self.acceptedSignature:
+                # the accepted image is gone, freezing on it again is a new stall
+                self.acceptedSignature = None
+            self.lastSignature = signature
+        if self.stalled:
+            if not new and frame is not None and self._reconnected.is_set():
+                # the device was reopened and still shows this image, so it is real
+                self.acceptedSignature = self.lastSignature
+                new = True
+            if new:
+                self.lastNew = now
+                return RECOVERED
+            if not self._reconnecting() and now - self.lastNew > self.stallTime:
+                # reopened but still nothing, try again
+                self.lastNew = now
+                self._startReconnect()
+            return WITHHOLD
+        if new:
+            self.lastNew = now
+            return PUBLISH
+        if now - self.lastNew <= self.stallTime:
+            # a short hiccup, the reader pads it like any dropped frame
+            return PUBLISH if frame is not None else WITHHOLD
+        self._stall("frozen image" if frame is not None else "no frames", now)
+        return WITHHOLD
+
+    def _stall(self, reason: str, now: float):
+        self.stalled = True
+        self.reason = reason
+        self.stallStart = self.lastNew
+        log.warning(
+            f"{self.vc.cameraName} stalled ({self.reason}) after {now - self.lastNew:.1f} s, reconnecting"
+        )
+        self.signals.stalled.emit(self.reason)
+        self.lastNew = now
+        self._startReconnect()
+
+    def recovered(self, pads: int):
+        """The reader padded the stall with ``pads`` frames and publishes again"""
+        with self._lock:
+            duration = time.monotonic() - self.stallStart
+            log.info(
+                f"{self.vc.cameraName} recovered after {duration:.1f} s and {self.reconnects} reconnects, padded {pads} frames"
+            )
+            self.stalled = False
+            self.reconnects = 0
+            self._reconnected.clear()
+        self.signals.recovered.emit(duration, pads)
+
+    def start(self):
+        """Start watching for a read that does not return, run by the reader when it starts"""
+        self.lastCheck = time.monotonic()
+        self._monitorThread = threading.Thread(
+            target=self._monitor, name=f"watchdog {self.vc.cameraName}", daemon=True
+        )
+        self._monitorThread.start()
+
+    def _monitor(self):
+        """A read that hangs blocks the reader, so it never gets to ``check``: declare the stall from here"""
+        while not self.kill:
+            self._wake.wait(self.stallTime / 2)
+            with self._lock:
+                now = time.monotonic()
+                if self.kill or self.stalled or now - self.lastCheck <= self.stallTime:
+                    continue
+                self._stall("read hung", now)
+
+    def _reconnecting(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _startReconnect(self):
+        if self._reconnecting():
+            return
+        self._reconnected.clear()
+        self._thread = threading.Thread(
+            target=self._reconnect, name=f"reconnect {self.vc.cameraName}", daemon=True
+        )
+        self._thread.start()
+
+    def _reconnect(self):
+        """Reopen the device until it delivers frames, runs in its own thread so the reader keeps its timing"""
+        interval = RETRY_INTERVAL
+        while not self.kill and self.vc.session == self.session:
+            self.reconnects += 1
+            try:
+                if self.vc.reconnect():
+                    self._reconnected.set()
+                    return
+            except Exception as e:
+                self.signals.error.emit(
+                    f"Error reconnecting {self.vc.cameraName}: {e}", True
+                )
+            log.debug(
+                f"Reconnecting {self.vc.cameraName} failed, retrying in {interval:.0f} s"
+            )
+            self._wake.wait(interval)
+            interval = min(2 * interval, MAX_RETRY_INTERVAL)
+
+    def stop(self):
+        """Stop watching and reconnecting, a reconnect in progress finishes in the background"""
+        self.kill = True
+        self._wake.set()
@@ -0,0 +1,231 @@
+# aligning MedPC event timestamps to video frames
+import logging
+
+import cv2
+import numpy as np
+
+from RVM.bases.base import AlignmentBase, TrialBase
+
+log = logging.getLogger()
+
+
+class FrameClock:
+    """Maps times in seconds since the start of a video to frame numbers.
+
+    Either the timestamp of every frame or a constant frame rate is needed. The recorder pads dropped frames so recorded videos have a constant rate, the timestamps are for videos where that isn't true.
+
+    Parameters
+    ----------
+    fps : float, optional
+        The frame rate of the video
+    timestamps : np.ndarray, optional
+        The time of every frame in seconds since the start of the video, increasing
+    n_frames : int, optional
+        The number of frames, times after the last frame are outside the video. By default the length of ``timestamps``, or unbounded.
+    """
+
+    def __init__(
+        self, fps: float = None, timestamps: np.ndarray = None, n_frames: int = None
+    ):
+        if fps is None and timestamps is None:
+            raise ValueError("A frame clock needs an fps or frame timestamps")
+        self.timestamps = None
+        if timestamps is not None:
+            self.timestamps = np.asarray(timestamps, dtype=np.float64)
+            if n_frames is None:
+                n_frames = len(self.timestamps)
+            if fps is None and len(self.timestamps) > 1:
+                fps = (len(self.timestamps) - 1) / (
+                    self.timestamps[-1] - self.timestamps[0]
+                )
+        self.fps = fps or 0.0
+        self.n_frames = n_frames
+
+    @classmethod
+    def fromVideo(cls, path):
+        """A constant rate clock from the fps and frame count of a video file"""
+        cap = cv2.VideoCapture(str(path))
+        try:
+            if not cap.isOpened():
+                raise ValueError(f"Could not open the video {path}")
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            cap.release()
+        if fps <= 0:
+            raise ValueError(f"The video {path} has no frame rate")
+        return cls(fps=fps, n_frames=n_frames if n_frames > 0 else None)
+
+    def frames(self, times: np.ndarray) -> np.ndarray:
+        """The frame showing each time, -1 for times outside the video"""
+        times = np.asarray(times, dtype=np.float64)
+        if self.timestamps is not None:
+            # the frame shown at a time is the last one stamped at or before it
+            frames = np.searchsorted(self.timestamps, times, side="right") - 1
+            if len(self.timestamps) > 0 and self.fps > 0:
+                # the last frame is only shown for one frame period
+                outside_end = times >= self.timestamps[-1] + 1.0 / self.fps
+            else:
+                outside_end = False
+        else:
+            frames = np.floor(times * self.fps).astype(np.int64)
+            outside_end = False
+        outside = (frames < 0) | np.isnan(times) | outside_end
+        if self.n_frames is not None:
+            outside |= frames >= self.n_frames
+        return np.where(outside, -1, frames)
+
+    def bounds(self, times: np.ndarray) -> np.ndarray:
+        """The first frame at or after each time, clipped to the video"""
+        times = np.asarray(times, dtype=np.float64)
+        if self.timestamps is not None:
+            frames = np.searchsorted(self.timestamps, times, side="left")
+        else:
+            frames = np.ceil(times * self.fps).astype(np.int64)
+        return np.clip(frames, 0, self.n_frames)
+
+
+def toVideoTime(
+    timestamps: np.ndarray, resolution: float = 0.01, offset=0.0, drift=0.0
+) -> np.ndarray:
+    """Convert MedPC timestamps to seconds since the start of the video
+
+    Parameters
+    ----------
+    timestamps : np.ndarray
+        MedPC timestamps in ticks
+    resolution : float, optional
+        Seconds per tick, by default 0.01
+    offset : float, optional
+        The video time of MedPC time zero, negative if the video started after MedPC
+    drift : float, optional
+        How many seconds the MedPC clock gains per second relative to the video clock
+    """
+    seconds = np.asarray(timestamps, dtype=np.float64) * resolution
+    return offset + seconds / (1.0 + drift)
+
+
+def fitClock(
+    medpc_times: np.ndarray, video_times: np.ndarray, resolution: float = 0.01
+) -> tuple[float, float]:
+    """Estimate the offset and drift between the clocks from events seen by both (e.g. a sync light)
+
+    Parameters
+    ----------
+    medpc_times : np.ndarray
+        The MedPC timestamps of the events in ticks
+    video_times : np.ndarray
+        The times the same events were seen in the video, in seconds
+    resolution : float, optional
+        Seconds per MedPC tick, by default 0.01
+
+    Returns
+    -------
+    tuple[float, float]
+        (offset, drift) for ``toVideoTime``
+    """
+    medpc_seconds = np.asarray(medpc_times, dtype=np.float64) * resolution
+    video_times = np.asarray(video_times, dtype=np.float64)
+    if len(medpc_seconds) != len(video_times) or len(medpc_seconds) == 0:
+        raise ValueError("Need the same events, at least one, from both clocks")
+    if len(medpc_seconds) == 1:
+        return float(video_times[0] - medpc_seconds[0]), 0.0
+    slope, offset = np.polyfit(medpc_seconds, video_times, 1)
+    return float(offset), float(1.0 / slope - 1.0)
+
+
+def alignEvents(
+    events: dict,
+    clock: FrameClock,
+    resolution: float = 0.01,
+    offset: float = 0.0,
+    drift: float = 0.0,
+    pre: float = 0.0,
+    post: float = 0.0,
+) -> AlignmentBase:
+    """Find the frames of all events and their windows at once
+
+    Parameters
+    ----------
+    events : dict
+        event name -> MedPC timestamps in ticks, as from ``splitEvents``
+    clock : FrameClock
+        The frame clock of the video
+    resolution, offset, drift
+        See ``toVideoTime``
+    pre, post : float, optional
+        Seconds before and after each event to include in its window
+
+    Returns
+    -------
+    AlignmentBase
+        The frames and windows of every event, windows are [first, last) frames clipped to the video
+    """
+    names = list(events)
+    counts = [len(events[name]) for name in names]
+    times = toVideoTime(
+        np.concatenate([np.asarray(events[n], dtype=np.float64) for n in names])
+        if len(names) > 0
+        else np.empty(0),
+        resolution,
+        offset,
+        drift,
+    )
+    frames = clock.frames(times)
+    windows = clock.bounds(np.stack([times - pre, times + post], axis=1))
+    splits = np.cumsum(counts)[:-1]
+    # the values are built here with the right types, validating them per event is slow
+    return AlignmentBase.fromTrusted(
+        dict(
+            resolution=float(resolution),
+            offset=float(offset),
+            drift=float(drift),
+            fps=float(clock.fps),
+            pre=float(pre),
+            post=float(post),
+            frames={
+                name: part.tolist()
+                for name, part in zip(names, np.split(frames, splits))
+            },
+            windows={
+                name: part.tolist()
+                for name, part in zip(names, np.split(windows, splits))
+            },
+        )
+    )
+
+
+def clockOffset(trial: TrialBase) -> float:
+    """The video time of MedPC time zero for a trial: the seconds from the start of its video (``start_time``) to the start of its MedPC session (``data_start_time``), 0 if either is unknown"""
+    if trial.start_time is None or trial.data_start_time is None:
+        log.debug(f"Trial {trial.uid} has no start times, aligning without an offset")
+        return 0.0
+    return (trial.data_start_time - trial.start_time).total_seconds()
+
+
+def alignTrial(
+    trial: TrialBase, clock: FrameClock = None, offset: float = None, **kwargs
+) -> AlignmentBase:
+    """Align the events in a trial's data to its video and store the result in ``trial.alignment``
+
+    Parameters
+    ----------
+    trial : TrialBase
+        A trial with imported events in ``data`` (see ``BatchImporter``)
+    clock : FrameClock, optional
+        By default a constant rate clock read from the trial's video
+    offset : float, optional
+        See ``toVideoTime``, by default the difference of the trial's start times (see ``clockOffset``)
+    **kwargs
+        Passed to ``alignEvents``
+    """
+    if not isinstance(trial.data, dict) or len(trial.data) == 0:
+        raise ValueError(f"Trial {trial.uid} has no events to align")
+    if clock is None:
+        if trial.video_location is None:
+            raise ValueError(f"Trial {trial.uid} has no video to align to")
+        clock = FrameClock.fromVideo(trial.video_location)
+    if offset is None:
+        offset = clockOffset(trial)
+    trial.alignment = alignEvents(trial.data, clock, offset=offset, **kwargs)
+    return trial.alignment
@@ -0,0 +1,394 @@
+# run analyses over many trial videos across a process pool, caching the results
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.camera.frameIndex import FrameIndex
+from RVM.data.batchImport import ImportIndex, hashFile
+from RVM.data.freezing import motionEnergy, saveMotion, summarizeFreezing
+
+log = logging.getLogger()
+
+CACHE_DIR_NAME = "analysis_cache"
+HASH_INDEX_FILE_NAME = "video_hashes.json"
+# long videos are split into ranges of this many frames (5 minutes at 30 fps)
+RANGE_FRAMES = 9000
+
+
+class Analysis:
+    """An analysis in two stages: an expensive per frame stage run on ranges of frames across the pool, and a cheap summary of its output
+
+    The per frame results are cached under the video contents and only the parameters of the per frame stage, so changing a summary parameter only reruns the summary.
+
+    Parameters
+    ----------
+    name : str
+        The name of the analysis
+    stage : str
+        The name of the per frame stage, analyses with the same stage share its cache
+    frames : callable
+        ``frames(path, start, end, **frame_params) -> np.ndarray`` with one value per frame in [start, end), runs in a worker process so it must be a module level function
+    frame_params : dict
+        The parameters of ``frames`` and their defaults
+    summarize : callable
+        ``summarize(values, fps, windows, **summary_params) -> dict`` from the values of every frame of the video
+    summary_params : dict
+        The parameters of ``summarize`` and their defaults
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stage: str,
+        frames,
+        frame_params: dict,
+        summarize,
+        summary_params: dict,
+    ):
+        self.name = name
+        self.stage = stage
+        self.frames = frames
+        self.frame_params = frame_params
+        self.summarize = summarize
+        self.summary_params = summary_params
+
+    def split(self, params: dict = None) -> tuple:
+        """Split parameters into (frame params, summary params), filling in the defaults"""
+        params = dict(params or {})
+        unknown = set(params) - set(self.frame_params) - set(self.summary_params)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self.name}: {sorted(unknown)}")
+        frame_params = {k: params.get(k, v) for k, v in self.frame_params.items()}
+        summary_params = {k: params.get(k, v) for k, v in self.summary_params.items()}
+        return frame_params, summary_params
+
+
+ANALYSES = {
+    "freezing": Analysis(
+        "freezing",
+        "motion_energy",
+        motionEnergy,
+        {"roi": None, "scale": 4, "pixel_threshold": 20},
+        summarizeFreezing,
+        {"motion_threshold": 0.002, "min_duration": 1.0},
+    ),
+}
+
+
+def _prepareVideo(path, known_sha256=None) -> tuple:
+    """Hash and index a video, runs in a worker process
+
+    Returns
+    -------
+    tuple
+        (path, sha256, number of frames, fps)
+    """
+    sha256 = known_sha256 or hashFile(path)
+    index = FrameIndex.loadOrBuild(path)
+    return path, sha256, len(index), index.fps
+
+
+def _runRange(frames, path, start: int, end: int, params: dict) -> np.ndarray:
+    """Run a per frame stage on a range of frames, runs in a worker process"""
+    return np.asarray(frames(path, start=start, end=end, **params))
+
+
+class ResultCache:
+    """Per frame results stored under a hash of what they were computed from
+
+    The key is the sha256 of the video contents, the stage, its parameters and the frame range, so a result is never stale: a changed video or parameter is a different key.
+
+    Parameters
+    ----------
+    path : str
+        The folder the results are kept in
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    @staticmethod
+    def key(sha256: str, stage: str, params: dict, start: int, end: int) -> str:
+        description = json.dumps(
+            [sha256, stage, params, start, end], sort_keys=True, default=str
+        )
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".npy")
+
+    def get(self, key: str) -> np.ndarray:
+        """The cached result, None if there is none"""
+        try:
+            return np.load(self._file(key))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, values: np.ndarray):
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp = file + ".tmp.npy"
+        np.save(tmp, values)
+        os.replace(tmp, file)
+
+
+class BatchAnalyzer:
+    """Runs an analysis over the videos of many trials.
+
+    Videos are split into ranges of ``range_frames`` frames, so long videos are spread across the whole pool. Every range is cached (see ``ResultCache``) in the project folder, running again with the same videos and parameters reads everything from the cache. Only the per frame stage is cached, the summaries are cheap and always recomputed.
+
+    The content hashes of the videos are remembered by size and mtime, so a video is only hashed again when it changes.
+
+    Parameters
+    ----------
+    projectSettings : ProjectSettings
+        The project of the trials
+    max_workers : int, optional
+        The number of worker processes, by default the number of cpus
+    range_frames : int, optional
+        The most frames in one job, by default 9000
+    """
+
+    def __init__(
+        self, projectSettings, max_workers: int = None, range_frames: int = RANGE_FRAMES
+    ):
+        self.projectSettings = projectSettings
+        self.max_workers = max_workers
+        self.range_frames = range_frames
+        location = str(projectSettings.project_location)
+        self.cache = ResultCache(os.path.join(location, CACHE_DIR_NAME))
+        self.hashes = ImportIndex(os.path.join(location, HASH_INDEX_FILE_NAME))
+        self.hits = 0
+        self.misses = 0
+
+    def select(
+        self,
+        protocols: list = None,
+        animals: list = None,
+        start=None,
+        end=None,
+        states: list = ("Finished", "Stopped"),
+    ) -> list:
+        """The trials with videos matching all of the given criteria, see ``TrialIndex.filter``"""
+        index = self.projectSettings.trialIndex
+        mask = index.filter(
+            states=list(states) if states is not None else None,
+            animals=animals,
+            protocols=protocols,
+            start=start,
+            end=end,
+        )
+        return [
+            trial
+            for trial in index.trials(mask)
+            if trial.video_location is not None and os.path.isfile(trial.video_location)
+        ]
+
+    def ranges(self, frames: int) -> list:
+        return [
+            (start, min(start + self.range_frames, frames))
+            for start in range(0, frames, self.range_frames)
+        ]
+
+    def run(
+        self,
+        jobs: list,
+        analysis: str = "freezing",
+        params: dict = None,
+        progress=None,
+        stopped=None,
+    ):
+        """Run an analysis on videos
+
+        Parameters
+        ----------
+        jobs : list
+            (trial uid, video path, event windows or None) of the videos to analyse
+        analysis : str, optional
+            A name in ``ANALYSES``, by default "freezing"
+        params : dict, optional
+            Parameters of the analysis, the defaults are used for the rest
+        progress : callable, optional
+            Called with (frames done, frames) as ranges complete, cached ranges count as done
+        stopped : callable, optional
+            Returns True when the run should stop
+
+        Yields
+        ------
+        tuple
+            (trial uid, result dict) as each video completes
+        """
+        analysis = ANALYSES[analysis]
+        frame_params, summary_params = analysis.split(params)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            videos = {}
+            futures = []
+            for uid, path, windows in jobs:
+                path = os.path.abspath(str(path))
+                stat = os.stat(path)
+                known = self.hashes.sha256(path)
+                if not self.hashes.isCurrent(path, stat):
+                    known = None
+                videos[uid] = {"path": path, "stat": stat, "windows": windows}
+                futures.append(pool.submit(_prepareVideo, path, known))
+            by_path = {}
+            for future in as_completed(futures):
+                try:
+                    path, sha256, frames, fps = future.result()
+                except Exception as e:
+                    log.warning(f"Could not read a video to analyse: {e}")
+                    continue
+                by_path[path] = (sha256, frames, fps)
+            # find what is cached and submit the rest
+            pending = {}
+            total = done = 0
+            for uid, video in videos.items():
+                if video["path"] not in by_path:
+                    continue
+                sha256, frames, fps = by_path[video["path"]]
+                self.hashes.update(video["path"], video["stat"], sha256)
+                video.update(sha256=sha256, fps=fps, parts={})
+                for start, end in self.ranges(frames):
+                    total += end - start
+                    key = self.cache.key(
+                        sha256, analysis.stage, frame_params, start, end
+                    )
+                    values = self.cache.get(key)
+                    if values is not None:
+                        self.hits += 1
+                        done += end - start
+                        video["parts"][start] = values
+                        continue
+                    self.misses += 1
+                    future = pool.submit(
+                        _runRange,
+                        analysis.frames,
+                        video["path"],
+                        start,
+                        end,
+                        frame_params,
+                    )
+                    pending[future] = (uid, start, end, key)
+            self.hashes.save()
+            if progress is not None:
+                progress(done, total)
+            remaining = {}
+            for uid, _, _, _ in pending.values():
+                remaining[uid] = remaining.get(uid, 0) + 1
+            # videos that were completely cached are done already
+            for uid, video in videos.items():
+                if "parts" in video and uid not in remaining:
+                    yield uid, self._summarize(
+                        analysis, video, summary_params, frame_params
+                    )
+            for future in as_completed(pending):
+                uid, start, end, key = pending[future]
+                video = videos[uid]
+                try:
+                    values = future.result()
+                except Exception as e:
+                    log.warning(
+                        f"Could not analyse frames {start}-{end} of {video['path']}: {e}"
+                    )
+                    remaining[uid] = -1
+                    continue
+                self.cache.put(key, values)
+                video["parts"][start] = values
+                done += end - start
+                if progress is not None:
+                    progress(done, total)
+                if stopped is not None and stopped():
+                    for future in pending:
+                        future.cancel()
+                    return
+                if remaining[uid] < 0:
+                    continue
+                remaining[uid] -= 1
+                if remaining[uid] == 0:
+                    yield uid, self._summarize(
+                        analysis, video, summary_params, frame_params
+                    )
+
+    def _summarize(
+        self, analysis: Analysis, video: dict, summary_params: dict, frame_params: dict
+    ) -> dict:
+        parts = [video["parts"][start] for start in sorted(video["parts"])]
+        values = np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+        result = analysis.summarize(
+            values, video["fps"], video["windows"], **summary_params
+        )
+        result.update(frame_params)
+        if analysis.stage == "motion_energy":
+            result["motion_location"] = saveMotion(video["path"], values)
+        return result
+
+
+class batchAnalysisSignals(QObject):
+    """Defines the signals available from the batch analysis worker
+
+    Supported signals are:
+    analyzed: `str` the trial uid, `dict` its result
+    progress: `int` frames done, `int` frames
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    analyzed = pyqtSignal(str, dict)
+    progress = pyqtSignal(int, int)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class batchAnalysisWorker(QObject):
+    """Runs a BatchAnalyzer in a QThread, the results are stored on the trials in the gui thread
+
+    Parameters
+    ----------
+    analyzer : BatchAnalyzer
+        The analyzer to run
+    jobs : list
+        (trial uid, video path, event windows or None) of the videos to analyse
+    analysis : str, optional
+        A name in ``ANALYSES``, by default "freezing"
+    params : dict, optional
+        Parameters of the analysis
+    """
+
+    def __init__(
+        self,
+        analyzer: BatchAnalyzer,
+        jobs: list,
+        analysis: str = "freezing",
+        params: dict = None,
+    ):
+        super(batchAnalysisWorker, self).__init__()
+        self.analyzer = analyzer
+        self.jobs = jobs
+        self.analysis = analysis
+        self.params = params
+        self.signals = batchAnalysisSignals()
+        self.kill = False
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            for uid, result in self.analyzer.run(
+                self.jobs,
+                self.analysis,
+                self.params,
+                progress=self.signals.progress.emit,
+                stopped=lambda: self.kill,
+            ):
+                self.signals.analyzed.emit(uid, result)
+        except Exception as e:
+            self.signals.error.emit(f"Batch analysis failed: {e}", True)
+        finally:
+            self.signals.finished.emit()
+
+    def stop(self):
+        self.kill = True
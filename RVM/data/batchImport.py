@@ -0,0 +1,285 @@
+# import a folder of MedPC files into the trials of a project
+import datetime
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.bases.base import atomicWrite
+from RVM.bases.trialIndex import TrialIndex
+from RVM.data.medpc import readMedPC
+
+log = logging.getLogger()
+
+INDEX_FILE_NAME = "import_index.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def hashFile(path) -> str:
+    """The sha256 of the contents of a file"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _parseFile(path, known_sha256=None):
+    """Hash and parse a file, runs in a worker process
+
+    Returns
+    -------
+    tuple
+        (path, sha256, records), records is None if the contents match ``known_sha256``
+    """
+    sha256 = hashFile(path)
+    if sha256 == known_sha256:
+        return path, sha256, None
+    return path, sha256, list(readMedPC(path))
+
+
+class ImportIndex:
+    """The files that were already imported, keyed by path with their size, mtime and content hash
+
+    A file with records that matched no trial stays pending: it is parsed and matched again on every import until all of its records found their trial.
+
+    Parameters
+    ----------
+    path : str
+        The json file the index is kept in
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(self.path, "r") as file:
+                self.files = json.load(file)
+        except (OSError, ValueError):
+            self.files = {}
+
+    def isCurrent(self, path, stat: os.stat_result) -> bool:
+        """Whether the file is unchanged since it was imported, judged by size and mtime only"""
+        entry = self.files.get(path)
+        return (
+            entry is not None
+            and not self.isPending(path)
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime_ns
+        )
+
+    def isPending(self, path) -> bool:
+        """Whether some records of the file matched no trial when it was imported"""
+        entry = self.files.get(path)
+        return entry is not None and entry.get("unmatched", 0) > 0
+
+    def sha256(self, path):
+        """The content hash of the file when it was imported, None if it has to be parsed again"""
+        entry = self.files.get(path)
+        return None if entry is None or self.isPending(path) else entry["sha256"]
+
+    def update(
+        self,
+        path,
+        stat: os.stat_result,
+        sha256: str,
+        trials: list = None,
+        unmatched: int = None,
+    ):
+        entry = self.files.setdefault(path, {"trials": []})
+        entry["size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime_ns
+        entry["sha256"] = sha256
+        if trials is not None:
+            entry["trials"] = trials
+        if unmatched is not None:
+            entry["unmatched"] = unmatched
+
+    def save(self):
+        atomicWrite(self.path, json.dumps(self.files, indent=4).encode("utf-8"))
+
+
+class BatchImporter:
+    """Imports every MedPC file in a folder into the matching trials of a project.
+
+    Files are parsed across a process pool. A record is matched to the trial with the same animal (the MedPC subject) and box that started closest to the record, within ``tolerance``. The events of the record are stored in the trial's ``data`` and the file in its ``original_data_location``.
+
+    An index of the imported files is kept in the project folder, so importing the same folder again only parses files that are new or changed: files with an unchanged size and mtime are skipped without being read, files whose contents hash is unchanged are not parsed. Files with records that matched no trial are imported again every time, their trials may have been added since.
+
+    Parameters
+    ----------
+    projectSettings : ProjectSettings
+        The project to import into
+    tolerance : datetime.timedelta, optional
+        How far apart the trial and record start times can be, by default 10 minutes
+    max_workers : int, optional
+        The number of worker processes, by default the number of cpus
+    """
+
+    def __init__(
+        self,
+        projectSettings,
+        tolerance: datetime.timedelta = datetime.timedelta(minutes=10),
+        max_workers: int = None,
+    ):
+        self.projectSettings = projectSettings
+        self.tolerance = tolerance
+        self.max_workers = max_workers
+        self.index = ImportIndex(
+            os.path.join(str(projectSettings.project_location), INDEX_FILE_NAME)
+        )
+
+    def scan(self, dir_path) -> list:
+        """Find the files in a folder that are new or changed since they were last imported
+
+        Returns
+        -------
+        list
+            (path, os.stat_result) of every file to import
+        """
+        changed = []
+        for entry in os.scandir(dir_path):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            path = os.path.abspath(entry.path)
+            stat = entry.stat()
+            if not self.index.isCurrent(path, stat):
+                changed.append((path, stat))
+        return changed
+
+    def parse(self, files: list, progress=None):
+        """Parse the files across a process pool
+
+        Parameters
+        ----------
+        files : list
+            (path, os.stat_result) as returned by ``scan``
+        progress : callable, optional
+            Called with (number done, number of files) after each file
+
+        Yields
+        ------
+        tuple
+            (path, os.stat_result, sha256, records), records is None if the contents were unchanged
+        """
+        stats = dict(files)
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [
+                pool.submit(_parseFile, path, self.index.sha256(path))
+                for path, _ in files
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    path, sha256, records = future.result()
+                except Exception as e:
+                    log.warning(f"Could not import a MedPC file: {e}")
+                    continue
+                finally:
+                    if progress is not None:
+                        progress(done, len(futures))
+                yield path, stats[path], sha256, records
+
+    def apply(self, results) -> dict:
+        """Store parsed records in their matching trials and update the index, run this in the gui thread
+
+        Parameters
+        ----------
+        results : iterable
+            As yielded by ``parse``
+
+        Returns
+        -------
+        dict
+            counts of "files", "unchanged", "records", "matched" and the "unmatched" records
+        """
+        summary = {"files": 0, "unchanged": 0, "records": 0, "matched": 0}
+        summary["unmatched"] = []
+        for path, stat, sha256, records in results:
+            summary["files"] += 1
+            if records is None:
+                summary["unchanged"] += 1
+                self.index.update(path, stat, sha256)
+                continue
+            trials = []
+            unmatched = 0
+            for record in records:
+                summary["records"] += 1
+                trial = self.match(record)
+                if trial is None:
+                    summary["unmatched"].append(record)
+                    unmatched += 1
+                    continue
+                trial.original_data_location = path
+                trial.data = {name: ts.tolist() for name, ts in record.events().items()}
+                # the events are in ticks since this, see alignTrial
+                trial.data_start_time = record.start_time
+                trials.append(trial.uid)
+            summary["matched"] += len(trials)
+            self.index.update(path, stat, sha256, trials, unmatched)
+        self.index.save()
+        return summary
+
+    def match(self, record):
+        """Find the trial for a MedPC record, None if there isn't one"""
+        if record.start_time is None:
+            return None
+        index = self.projectSettings.trialIndex
+        rows = np.flatnonzero(
+            index.filter(animals=[record.subject], boxes=[record.box])
+        )
+        diffs = np.abs(index.start[rows] - TrialIndex.toEpoch(record.start_time))
+        if len(rows) == 0 or np.all(np.isnan(diffs)):
+            return None
+        best = np.nanargmin(diffs)
+        if diffs[best] > self.tolerance.total_seconds():
+            return None
+        return index.trials(rows[[best]])[0]
+
+    def run(self, dir_path, progress=None) -> dict:
+        """Scan, parse and apply in one go, see the methods for details"""
+        return self.apply(self.parse(self.scan(dir_path), progress))
+
+
+class batchImportSignals(QObject):
+    """Defines the signals available from the batch import worker
+
+    Supported signals are:
+    progress: `int` files done, `int` number of files
+    parsed: `list` the results of ``BatchImporter.parse``
+    finished: No data
+    """
+
+    progress = pyqtSignal(int, int)
+    parsed = pyqtSignal(list)
+    finished = pyqtSignal()
+
+
+class batchImportWorker(QObject):
+    """Parses files for a BatchImporter in a QThread, the results are applied to the project in the gui thread
+
+    Parameters
+    ----------
+    importer : BatchImporter
+        The importer to parse for
+    files : list
+        (path, os.stat_result) as returned by ``BatchImporter.scan``
+    """
+
+    def __init__(self, importer: BatchImporter, files: list):
+        super(batchImportWorker, self).__init__()
+        self.importer = importer
+        self.files = files
+        self.signals = batchImportSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            results = list(
+                self.importer.parse(self.files, progress=self.signals.progress.emit)
+            )
+            self.signals.parsed.emit(results)
+        finally:
+            self.signals.finished.emit()
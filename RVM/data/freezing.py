@@ -0,0 +1,277 @@
+# freezing from the motion energy of trial videos
+import datetime
+import logging
+
+import cv2
+import numpy as np
+
+from RVM.bases.base import FreezingBase, TrialBase
+from RVM.camera.camThreads import vidAnalysis
+from RVM.camera.frameIndex import FrameIndex
+
+log = logging.getLogger()
+
+MOTION_SUFFIX = ".motion.npy"
+# frames read and differenced at once
+CHUNK_FRAMES = 256
+
+
+def motionEnergy(
+    path,
+    roi: tuple = None,
+    scale: int = 4,
+    pixel_threshold: int = 20,
+    start: int = 0,
+    end: int = None,
+    chunk: int = CHUNK_FRAMES,
+    stopped=None,
+    progress=None,
+) -> np.ndarray:
+    """The fraction of pixels in a region that change between consecutive frames
+
+    Frames are read in chunks as grayscale at 1/scale of their size, then differenced all at once.
+
+    Parameters
+    ----------
+    path : str
+        The video file
+    roi : tuple, optional
+        (x, y, width, height) in video pixels, by default the whole frame
+    scale : int, optional
+        1, 2, 4 or 8, how much smaller than full size the frames are compared, by default 4
+    pixel_threshold : int, optional
+        Grey levels a pixel must change by to count as moving, by default 20
+    start, end : int, optional
+        The range of frames [start, end), by default the whole video
+    chunk : int, optional
+        Frames read and differenced at once
+    stopped : callable, optional
+        Returns True when the analysis should stop
+    progress : callable, optional
+        Called with (frames done, frames) after every chunk
+
+    Returns
+    -------
+    np.ndarray
+        float32 motion energy of each frame in the range, the first frame of the video is 0
+    """
+    analysis = vidAnalysis(str(path))
+    capture = analysis.vw
+    try:
+        if capture.index is None:
+            capture.setIndex(FrameIndex.loadOrBuild(path))
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if roi is None:
+            roi = (0, 0, width, height)
+        end = len(capture) if end is None else min(end, len(capture))
+        start = max(0, min(start, end))
+        shape = (max(1, roi[3] // scale), max(1, roi[2] // scale))
+        # one extra row holds the frame before the chunk
+        batch = np.empty((chunk + 1,) + shape, dtype=np.uint8)
+        moving = np.empty((chunk,) + shape, dtype=np.uint8)
+        motion = np.zeros(end - start, dtype=np.float32)
+        have_previous = False
+        if start > 0:
+            capture.seek(start - 1)
+            have_previous = analysis.readBatch(batch[:1], scale, roi) == 1
+        else:
+            capture.seek(0)
+        done = 0
+        while done < len(motion):
+            if stopped is not None and stopped():
+                break
+            want = min(chunk, len(motion) - done)
+            read = analysis.readBatch(batch[1 : want + 1], scale, roi)
+            if read == 0:
+                break
+            if have_previous:
+                first, frames = 0, batch[: read + 1]
+            else:
+                first, frames = 1, batch[1 : read + 1]
+            # |a - b| without leaving uint8
+            n = len(frames) - 1
+            np.subtract(
+                np.maximum(frames[1:], frames[:-1]),
+                np.minimum(frames[1:], frames[:-1]),
+                out=moving[:n],
+            )
+            counts = np.count_nonzero(moving[:n] > pixel_threshold, axis=(1, 2))
+            motion[done + first : done + read] = counts / (shape[0] * shape[1])
+            batch[0] = batch[read]
+            have_previous = True
+            done += read
+            if progress is not None:
+                progress(done, len(motion))
+        return motion[:done]
+    finally:
+        capture.release()
+
+
+def freezingBouts(
+    motion: np.ndarray,
+    fps: float,
+    motion_threshold: float = 0.002,
+    min_duration: float = 1.0,
+) -> np.ndarray:
+    """Find the runs of still frames that last at least ``min_duration`` seconds
+
+    Returns
+    -------
+    np.ndarray
+        (n, 2) int64 first and last (exclusive) frame of each bout
+    """
+    still = np.asarray(motion) < motion_threshold
+    edges = np.diff(np.concatenate(([False], still, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) >= max(1, int(round(min_duration * fps)))
+    return np.stack([starts[keep], ends[keep]], axis=1)
+
+
+def boutMask(bouts: np.ndarray, n_frames: int) -> np.ndarray:
+    """A bool array of the frames inside the bouts"""
+    change = np.zeros(n_frames + 1, dtype=np.int32)
+    bouts = np.asarray(bouts, dtype=np.int64).reshape(-1, 2)
+    np.add.at(change, np.clip(bouts[:, 0], 0, n_frames), 1)
+    np.add.at(change, np.clip(bouts[:, 1], 0, n_frames), -1)
+    return np.cumsum(change[:-1]) > 0
+
+
+def windowFreezing(frozen: np.ndarray, windows: dict) -> dict:
+    """The fraction of each event window spent freezing
+
+    Parameters
+    ----------
+    frozen : np.ndarray
+        Whether the animal is freezing in each frame
+    windows : dict
+        event name -> [first, last) frames of each window, as in ``AlignmentBase.windows``
+
+    Returns
+    -------
+    dict
+        event name -> the freezing fraction of each window, nan for empty windows
+    """
+    total = np.concatenate(([0], np.cumsum(frozen, dtype=np.int64)))
+    result = {}
+    for name, bounds in windows.items():
+        bounds = np.clip(
+            np.asarray(bounds, dtype=np.int64).reshape(-1, 2), 0, len(frozen)
+        )
+        length = bounds[:, 1] - bounds[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = (total[bounds[:, 1]] - total[bounds[:, 0]]) / length
+        result[name] = np.where(length > 0, fraction, np.nan).tolist()
+    return result
+
+
+def summarizeFreezing(
+    motion: np.ndarray,
+    fps: float,
+    windows: dict = None,
+    motion_threshold: float = 0.002,
+    min_duration: float = 1.0,
+) -> dict:
+    """Find the freezing bouts in the motion energy of a video and summarise them by event window
+
+    Returns
+    -------
+    dict
+        The fields of a FreezingBase that depend on the bouts
+    """
+    bouts = freezingBouts(motion, fps, motion_threshold, min_duration)
+    frozen = boutMask(bouts, len(motion))
+    return {
+        "motion_threshold": motion_threshold,
+        "min_duration": min_duration,
+        "fps": float(fps),
+        "frames": len(motion),
+        "bouts": bouts.tolist(),
+        "freezing": float(frozen.mean()) if len(frozen) > 0 else 0.0,
+        "windows": windowFreezing(frozen, windows or {}),
+        "created": datetime.datetime.now(),
+    }
+
+
+def saveMotion(path, motion: np.ndarray) -> str:
+    """Save the motion energy of a video next to it, returns where"""
+    motion_location = str(path) + MOTION_SUFFIX
+    np.save(motion_location, motion)
+    return motion_location
+
+
+def analyzeFreezing(
+    path,
+    windows: dict = None,
+    roi: tuple = None,
+    scale: int = 4,
+    pixel_threshold: int = 20,
+    motion_threshold: float = 0.002,
+    min_duration: float = 1.0,
+    stopped=None,
+    progress=None,
+) -> dict:
+    """Measure the motion energy of a video, find its freezing bouts and summarise them by event window
+
+    The motion energy is saved next to the video in ``<video>.motion.npy``.
+
+    Parameters
+    ----------
+    path : str
+        The video file
+    windows : dict, optional
+        event name -> [first, last) frames of each window, as in ``AlignmentBase.windows``
+    roi, scale, pixel_threshold
+        See ``motionEnergy``
+    motion_threshold, min_duration
+        See ``freezingBouts``
+
+    Returns
+    -------
+    dict
+        The fields of a FreezingBase
+    """
+    motion = motionEnergy(
+        path,
+        roi,
+        scale,
+        pixel_threshold,
+        stopped=stopped,
+        progress=progress,
+    )
+    result = summarizeFreezing(
+        motion,
+        FrameIndex.loadOrBuild(path).fps,
+        windows,
+        motion_threshold,
+        min_duration,
+    )
+    result.update(
+        roi=tuple(roi) if roi is not None else None,
+        scale=scale,
+        pixel_threshold=pixel_threshold,
+        motion_location=saveMotion(path, motion),
+    )
+    return result
+
+
+def analyzeTrialFreezing(trial: TrialBase, **kwargs) -> FreezingBase:
+    """Analyse the freezing in a trial's video and store the result in ``trial.freezing``
+
+    The event windows of ``trial.alignment`` are summarised if the trial was aligned, see ``alignTrial``.
+
+    Parameters
+    ----------
+    trial : TrialBase
+        A trial with a video
+    **kwargs
+        Passed to ``analyzeFreezing``
+    """
+    if trial.video_location is None:
+        raise ValueError(f"Trial {trial.uid} has no video to analyse")
+    windows = trial.alignment.windows if trial.alignment is not None else None
+    trial.freezing = FreezingBase(
+        **analyzeFreezing(trial.video_location, windows, **kwargs)
+    )
+    return trial.freezing
@@ -5,6 +5,7 @@ from json import load
 import pandas as pd
 
 from RVM.bases import Trial
+from RVM.data.medpc import readArray, splitEvents
 
 
 class Loader:
@@ -56,44 +57,16 @@ class Loader:
             if line.__contains__("MSN"):
                 self.protocal_name = line.split(":")[1].strip()
             if line.__contains__("C:\n"):
-                # the next lines till the end of the file are the data
-                data = lines[i + 1 :]
-                # save the data to a temp csv file
-                with open("temp.txt", "w") as f:
-                    f.writelines(data)
-                # load the data into a pandas dataframe
-                df = pd.read_csv("temp.txt", delim_whitespace=True, header=None)
-                # drop the first column
-                df = df.drop(df.columns[0], axis=1)
+                # the next lines till the next array (or the end of the file) are the data
+                values = readArray(lines[i + 1 :])
+                # typed timestamp arrays for "CS+", "CS-" and "Shock"
+                self.events = splitEvents(values)
                 self.outdf = pd.DataFrame()
-                csp = []
-                csm = []
-                shock = []
-                # iterate through each row and then column in the row and print the data
-                for row in df.iterrows():
-                    for col in row[1]:
-                        # convert to a string
-                        col = str(col)
-                        ts = col.split(".")[0]
-                        ts_type = col.split(".")[1]
-                        if ts_type == "6":
-                            # CS+
-                            csp.append(ts)
-                        elif ts_type == "19":
-                            # Shock
-                            shock.append(ts)
-                        elif ts_type == "13":
-                            # CS-
-                            csm.append(ts)
-                # save the data to a csv file
                 # get the longest list and make all lists that length with Null values
-                max_len = max(len(csp), len(csm), len(shock))
-                csp = csp + [None] * (max_len - len(csp))
-                csm = csm + [None] * (max_len - len(csm))
-                shock = shock + [None] * (max_len - len(shock))
-                self.outdf["CS+ TS's"] = csp
-                self.outdf["CS- TS's"] = csm
-                self.outdf["Shock TS's"] = shock
+                max_len = max(len(ts) for ts in self.events.values())
+                for name, ts in self.events.items():
+                    column = [str(t) for t in ts.tolist()]
+                    self.outdf[f"{name} TS's"] = column + [None] * (max_len - len(ts))
                 self.data_savable = True
                 break
 
@@ -0,0 +1,248 @@
+# parsing of MedPC data files
+import datetime
+import re
+
+import numpy as np
+
+# the event codes written after the decimal point of a timestamp in the C array
+EVENT_CODES = {
+    "CS+": "6",
+    "CS-": "13",
+    "Shock": "19",
+}
+# the fraction of a value is compared in millionths, MedPC writes 3 decimals
+FRACTION_SCALE = 1_000_000
+ROW_LABEL = re.compile(r"^\s*\d+:")
+ARRAY_HEADER = re.compile(r"^\s*[A-Z]:")
+
+
+def readArray(lines: list[str]) -> np.ndarray:
+    """Read the values of a MedPC array into a float array
+
+    Parameters
+    ----------
+    lines : list[str]
+        The lines following the array header (e.g. "C:"), reading stops at the next array header
+
+    Returns
+    -------
+    np.ndarray
+        The values of the array in order, without the row labels
+    """
+    rows = []
+    for line in lines:
+        if ARRAY_HEADER.match(line):
+            break
+        rows.append(ROW_LABEL.sub("", line, count=1))
+    text = " ".join(rows)
+    if len(text.strip()) == 0:
+        return np.empty(0, dtype=np.float64)
+    return np.array(text.split(), dtype=np.float64)
+
+
+def eventCode(code: str) -> int:
+    """The fraction of a value (in millionths) that encodes the given event code"""
+    return int(code.ljust(6, "0")[:6])
+
+
+def splitEvents(values: np.ndarray, codes: dict = None) -> dict:
+    """Split timestamp.code values into integer timestamps per event type
+
+    A value of 1234.6 is the event with code "6" at timestamp 1234, the code is the digits after the decimal point as they are written (so "06" and "6" are different codes).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values of the array, see ``readArray``
+    codes : dict, optional
+        event name -> code, by default ``EVENT_CODES``
+
+    Returns
+    -------
+    dict
+        event name -> int64 array of the timestamps of that event, in the order they appear
+    """
+    if codes is None:
+        codes = EVENT_CODES
+    values = values[~np.isnan(values)]
+    timestamps = np.trunc(values)
+    fractions = np.rint(np.abs(values - timestamps) * FRACTION_SCALE).astype(np.int64)
+    timestamps = timestamps.astype(np.int64)
+    return {
+        name: timestamps[fractions == eventCode(code)] for name, code in codes.items()
+    }
+
+
+HEADER_FIELDS = {
+    "File": "file",
+    "Start Date": "start_date",
+    "End Date": "end_date",
+    "Subject": "subject",
+    "Experiment": "experiment",
+    "Group": "group",
+    "Box": "box",
+    "Start Time": "start_time",
+    "End Time": "end_time",
+    "MSN": "msn",
+}
+# array values are converted to floats in batches of this many, to bound memory
+CONVERT_BATCH = 65536
+
+
+class MedPCRecord:
+    """The data for one subject from a MedPC file
+
+    Attributes
+    ----------
+    file, subject, experiment, group, box, msn : str
+        The header values as written in the file ("" if missing)
+    start_time, end_time : datetime.datetime
+        The start and end of the session, None if they could not be read
+    scalars : dict
+        variable letter -> value, for the variables written on the same line as their letter
+    arrays : dict
+        array letter -> np.ndarray of float64 values
+    """
+
+    def __init__(self, file=""):
+        self.file = file
+        self.start_date = ""
+        self.end_date = ""
+        self.subject = ""
+        self.experiment = ""
+        self.group = ""
+        self.box = ""
+        self.start_time = None
+        self.end_time = None
+        self.msn = ""
+        self.scalars = {}
+        self.arrays = {}
+
+    def events(self, array: str = "C", codes: dict = None) -> dict:
+        """Split an array of timestamp.code values into timestamps per event, see ``splitEvents``"""
+        return splitEvents(self.arrays.get(array, np.empty(0)), codes)
+
+    def _setHeader(self, key: str, value: str):
+        attr = HEADER_FIELDS[key]
+        if attr in ("start_time", "end_time"):
+            value = self._parseTime(attr, value)
+        setattr(self, attr, value)
+
+    def _parseTime(self, attr: str, value: str):
+        date = self.start_date if attr == "start_time" else self.end_date
+        try:
+            return datetime.datetime.strptime(f"{date} {value}", "%m/%d/%y %H:%M:%S")
+        except ValueError:
+            return None
+
+    def __repr__(self):
+        return (
+            f"MedPCRecord(subject={self.subject!r}, box={self.box!r}, "
+            f"start_time={self.start_time}, arrays={sorted(self.arrays)})"
+        )
+
+
+class _ArrayBuilder:
+    """Collects the values of an array and converts them to floats in batches"""
+
+    def __init__(self):
+        self.tokens = []
+        self.chunks = []
+
+    def add(self, tokens: list[str]):
+        self.tokens.extend(tokens)
+        if len(self.tokens) >= CONVERT_BATCH:
+            self._convert()
+
+    def _convert(self):
+        if len(self.tokens) > 0:
+            self.chunks.append(np.array(self.tokens, dtype=np.float64))
+            self.tokens = []
+
+    def build(self) -> np.ndarray:
+        self._convert()
+        if len(self.chunks) == 0:
+            return np.empty(0, dtype=np.float64)
+        return np.concatenate(self.chunks)
+
+
+def _readLines(file, chunk_size: int):
+    """Yield the lines of a text file, reading it in chunks"""
+    rest = ""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+
+def readMedPC(path, chunk_size: int = 1 << 20):
+    """Read a MedPC data file, one subject at a time
+
+    The file is read once, in chunks, and only the subject being read is held in memory, so files with many subjects (e.g. a day's export of every box) can be read in one pass regardless of their size.
+
+    Parameters
+    ----------
+    path : str
+        The MedPC data file
+    chunk_size : int, optional
+        The number of characters to read at a time, by default 1 MiB
+
+    Yields
+    ------
+    MedPCRecord
+        The data of each subject in the file, in order
+    """
+    file_name = ""
+    record = None
+    array_name = None
+    array = None
+
+    def finishArray():
+        if array_name is not None:
+            record.arrays[array_name] = array.build()
+
+    with open(path, "r") as file:
+        for line in _readLines(file, chunk_size):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            key, sep, value = line.partition(":")
+            if not sep:
+                continue
+            value = value.strip()
+            if key.isdigit():
+                # a row of the current array
+                if array is not None:
+                    array.add(value.split())
+                continue
+            if key == "File":
+                file_name = value
+                continue
+            if key == "Start Date":
+                # every subject starts with its start date
+                if record is not None:
+                    finishArray()
+                    yield record
+                record = MedPCRecord(file_name)
+                array_name, array = None, None
+            if record is None:
+                continue
+            if key in HEADER_FIELDS:
+                finishArray()
+                array_name, array = None, None
+                record._setHeader(key, value)
+            elif len(key) == 1 and key.isalpha():
+                finishArray()
+                if len(value) == 0:
+                    array_name, array = key, _ArrayBuilder()
+                else:
+                    array_name, array = None, None
+                    record.scalars[key] = float(value)
+        if record is not None:
+            finishArray()
+            yield record
@@ -1,2 +1,12 @@
-from RVM.devices.devices import (check_ffmpeg, format_device_output,
-                                 get_devices, get_ffmpeg_list)
+from RVM.devices.devices import (
+    check_ffmpeg,
+    device_fingerprint,
+    device_index,
+    format_device_output,
+    get_devices,
+    get_ffmpeg_list,
+    get_video_devices,
+    list_v4l2_devices,
+)
+from RVM.devices.discovery import DeviceCache, deviceScanner
+from RVM.devices.hotplug import deviceWatcher, diffDevices
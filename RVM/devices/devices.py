@@ -3,6 +3,7 @@ import json
 import os
 import re
 import subprocess
+import sys
 import urllib.request
 import zipfile
 
@@ -131,3 +132,134 @@ def get_devices():
         a dict of all the devices that ffmpeg can use
     """
     return format_device_output(get_ffmpeg_list())
+
+
+V4L2_ROOT = "/sys/class/video4linux"
+
+
+def _read_sysfs(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def list_v4l2_devices(root=None):
+    """
+    list the video devices of a linux machine from sysfs, without running anything
+
+    Parameters
+    ----------
+    root : str
+        the video4linux class folder, by default V4L2_ROOT
+
+    Returns
+    -------
+    dict
+        device path (/dev/videoN) -> device name, in device number order. the numbers are what cv2.VideoCapture takes, cameras that expose a second (metadata) node get the node number in their name
+    """
+    root = root or V4L2_ROOT
+    try:
+        entries = [e for e in os.listdir(root) if re.fullmatch(r"video\d+", e)]
+    except OSError:
+        return {}
+    entries.sort(key=lambda e: int(e[5:]))
+    devices = {}
+    for entry in entries:
+        name = _read_sysfs(os.path.join(root, entry, "name")) or entry
+        # index 0 is the main node of a device, the others carry metadata
+        index = _read_sysfs(os.path.join(root, entry, "index"))
+        if index not in (None, "0"):
+            name = f"{name} ({entry})"
+        devices[f"/dev/{entry}"] = name
+    names = list(devices.values())
+    for device, name in devices.items():
+        if names.count(name) > 1:
+            devices[device] = f"{name} ({device[5:]})"
+    return devices
+
+
+# the usb video class driver lists the cameras it is currently running for here
+USBVIDEO_KEY = r"SYSTEM\CurrentControlSet\Services\usbvideo"
+
+
+def _usbvideo_fingerprint():
+    """the instance ids of the attached usb video class cameras, from the registry"""
+    try:
+        import winreg
+    except ImportError:
+        return None
+    try:
+        # the driver is part of windows, without it there is nothing to go by
+        winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, USBVIDEO_KEY).Close()
+    except OSError:
+        return None
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, USBVIDEO_KEY + r"\Enum") as key:
+            count = winreg.QueryValueEx(key, "Count")[0]
+            return ";".join(
+                str(winreg.QueryValueEx(key, str(i))[0]) for i in range(count)
+            )
+    except OSError:
+        # no camera was attached since windows started
+        return ""
+
+
+def device_fingerprint(root=None):
+    """
+    a cheap signature of the attached video devices, it changes when one is plugged in or removed
+
+    On linux these are the v4l2 devices in sysfs. On windows these are the usb video class cameras (nearly every webcam) in the registry, other capture devices only show up in a full enumeration.
+
+    Returns
+    -------
+    str
+        the signature, None where there is no cheap way to tell
+    """
+    root = root or V4L2_ROOT
+    if not os.path.isdir(root):
+        return _usbvideo_fingerprint() if sys.platform == "win32" else None
+    parts = []
+    for entry in sorted(os.listdir(root)):
+        parts.append(f"{entry}:{_read_sysfs(os.path.join(root, entry, 'dev'))}")
+    return ";".join(parts)
+
+
+def get_video_devices():
+    """
+    get a dict of the video devices, from sysfs on linux and from ffmpeg (downloaded if needed) elsewhere
+
+    Returns
+    -------
+    dict
+        device id -> device name
+    """
+    if os.path.isdir(V4L2_ROOT):
+        return list_v4l2_devices()
+    check_ffmpeg()
+    return get_devices().get("video", {})
+
+
+def device_index(devices, key):
+    """
+    the number cv2.VideoCapture takes for a device
+
+    Parameters
+    ----------
+    devices : dict
+        device id -> device name, as from get_video_devices
+    key : str
+        the device id
+
+    Returns
+    -------
+    int
+        N for a linux /dev/videoN, which stays the same while other devices come and go, otherwise the position of the device in the list
+    """
+    if key not in devices:
+        raise ValueError(f"The video device {key} is not connected")
+    match = re.fullmatch(r"/dev/video(\d+)", key)
+    if match is not None:
+        return int(match.group(1))
+    return list(devices.keys()).index(key)
@@ -0,0 +1,123 @@
+# video device discovery in the background, with the last result cached on disk
+import json
+import logging
+import os
+import time
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.bases.base import atomicWrite
+from RVM.devices.devices import (
+    GLOBAL_FFMPEG_LOCATION,
+    device_fingerprint,
+    get_video_devices,
+)
+
+log = logging.getLogger()
+
+CACHE_FILE = os.path.join(GLOBAL_FFMPEG_LOCATION, ".rvm_video_devices.json")
+# seconds a discovered device list is trusted when there is no fingerprint to check
+DEVICE_TTL = 300
+
+
+class DeviceCache:
+    """The last discovered video devices, kept in a json file so the next start can show them at once
+
+    A cached list is fresh while the device fingerprint (see ``device_fingerprint``) is unchanged and it is younger than ``ttl`` seconds. Where there is no fingerprint (windows) only the ttl counts.
+
+    Parameters
+    ----------
+    path : str, optional
+        The cache file, by default CACHE_FILE
+    ttl : float, optional
+        Seconds a list is trusted, by default DEVICE_TTL
+    """
+
+    def __init__(self, path: str = CACHE_FILE, ttl: float = DEVICE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entry = None
+
+    def _load(self) -> dict:
+        if self._entry is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entry = json.load(f)
+            except (OSError, ValueError):
+                self._entry = {}
+        return self._entry
+
+    def devices(self) -> dict:
+        """The cached devices, fresh or not, None if nothing was ever cached"""
+        return self._load().get("devices")
+
+    def isFresh(self, fingerprint: str = None) -> bool:
+        entry = self._load()
+        if entry.get("devices") is None:
+            return False
+        if entry.get("fingerprint") != fingerprint:
+            return False
+        return time.time() - entry.get("time", 0) < self.ttl
+
+    def save(self, devices: dict, fingerprint: str = None):
+        self._entry = {
+            "devices": devices,
+            "fingerprint": fingerprint,
+            "time": time.time(),
+        }
+        try:
+            # the scanner and the watcher both save, each through its own temporary file
+            atomicWrite(self.path, json.dumps(self._entry).encode("utf-8"))
+        except OSError as e:
+            log.debug(f"Could not cache the video devices: {e}")
+
+
+class deviceScannerSignals(QObject):
+    """Defines the signals available from the device scanner
+
+    Supported signals are:
+    found: `dict` device id -> device name, `bool` whether it was read from the cache
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    found = pyqtSignal(dict, bool)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class deviceScanner(QObject):
+    """Finds the video devices in a QThread, the gui never waits on ffmpeg or a download
+
+    Parameters
+    ----------
+    cache : DeviceCache
+        Where the result is kept
+    force : bool, optional
+        Enumerate the devices even if the cached list is fresh, by default False
+    """
+
+    def __init__(self, cache: DeviceCache, force: bool = False):
+        super(deviceScanner, self).__init__()
+        self.cache = cache
+        self.force = force
+        self.signals = deviceScannerSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            fingerprint = device_fingerprint()
+            if not self.force and self.cache.isFresh(fingerprint):
+                self.signals.found.emit(self.cache.devices(), True)
+                return
+            start = time.perf_counter()
+            devices = get_video_devices()
+            log.debug(
+                f"Found {len(devices)} video devices in {time.perf_counter() - start:.3f} s"
+            )
+            self.cache.save(devices, fingerprint)
+            self.signals.found.emit(devices, False)
+        except Exception as e:
+            self.signals.error.emit(f"Could not list the video devices: {e}", True)
+        finally:
+            self.signals.finished.emit()
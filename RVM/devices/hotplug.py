@@ -0,0 +1,204 @@
+# notices video devices being plugged in and removed
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from RVM.devices import devices as _devices
+from RVM.devices.devices import device_fingerprint, get_video_devices
+
+log = logging.getLogger()
+
+# seconds between checks when there are no inotify events to wait for
+POLL_INTERVAL = 2
+# seconds between full enumerations where there is no cheap fingerprint
+ENUMERATE_INTERVAL = 30
+# seconds to let udev finish setting up a node before it is read
+SETTLE_TIME = 0.25
+
+_IN_ATTRIB = 0x00000004
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """The bits of linux inotify needed to watch a folder, through libc"""
+
+    def __init__(self, path: str, mask: int):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Cannot watch {path}")
+
+    def read(self, timeout: float, wake: int = None) -> list:
+        """The names of the entries that changed, waits up to ``timeout`` seconds for any or until ``wake`` is readable"""
+        fds = [self.fd] if wake is None else [self.fd, wake]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self.fd not in ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            names.append(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def diffDevices(old: dict, new: dict) -> tuple:
+    """The devices added to and removed from a device list
+
+    Returns
+    -------
+    tuple
+        (added: device id -> name, removed: device id -> name), a device whose name changed is in both
+    """
+    added = {k: v for k, v in new.items() if old.get(k) != v}
+    removed = {k: v for k, v in old.items() if new.get(k) != v}
+    return added, removed
+
+
+class deviceWatcherSignals(QObject):
+    """Defines the signals available from the device watcher
+
+    Supported signals are:
+    added: `str` device id, `str` device name
+    removed: `str` device id, `str` device name
+    changed: `dict` the current devices, after the added and removed signals of a change
+    error: a string message and a bool whether this is worth printing to the log
+    finished: No data
+    """
+
+    added = pyqtSignal(str, str)
+    removed = pyqtSignal(str, str)
+    changed = pyqtSignal(dict)
+    error = pyqtSignal(str, bool)
+    finished = pyqtSignal()
+
+
+class deviceWatcher(QObject):
+    """Watches for video devices being plugged in and removed, run in a QThread.
+
+    On linux it waits on inotify events for the video nodes in /dev (which udev creates and removes), and only then lists the devices from sysfs, which takes well under a millisecond. Where inotify is not available, and on windows, it polls the device fingerprint (see ``device_fingerprint``) every ``POLL_INTERVAL`` seconds and only enumerates the devices when it changes. Only where there is no fingerprint at all it enumerates every ``ENUMERATE_INTERVAL`` seconds.
+
+    Parameters
+    ----------
+    known : dict
+        The devices the gui knows about, differences to them are reported straight away (on linux)
+    cache : DeviceCache, optional
+        Updated with every change
+    dev : str, optional
+        The folder the device nodes appear in, by default /dev
+    """
+
+    def __init__(self, known: dict, cache=None, dev: str = "/dev"):
+        super(deviceWatcher, self).__init__()
+        self.devices = dict(known)
+        self.cache = cache
+        self.dev = dev
+        self.signals = deviceWatcherSignals()
+        self.kill = False
+        self.wake = threading.Event()
+        self._wakeWrite = None
+
+    def check(self):
+        """List the devices and report what changed"""
+        fingerprint = device_fingerprint()
+        devices = get_video_devices()
+        added, removed = diffDevices(self.devices, devices)
+        if not added and not removed:
+            return
+        self.devices = devices
+        if self.cache is not None:
+            self.cache.save(devices, fingerprint)
+        for key, name in removed.items():
+            log.info(f"Video device removed: {name} ({key})")
+            self.signals.removed.emit(key, name)
+        for key, name in added.items():
+            log.info(f"Video device added: {name} ({key})")
+            self.signals.added.emit(key, name)
+        self.signals.changed.emit(dict(devices))
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            if os.path.isdir(_devices.V4L2_ROOT):
+                try:
+                    inotify = _Inotify(self.dev, _IN_CREATE | _IN_DELETE | _IN_ATTRIB)
+                except (OSError, AttributeError) as e:
+                    log.debug(f"Polling for video devices, no inotify: {e}")
+                    inotify = None
+                self.check()
+                if inotify is not None:
+                    self._watch(inotify)
+                else:
+                    self._poll(POLL_INTERVAL, device_fingerprint)
+            elif device_fingerprint() is not None:
+                # windows: a registry read, the slow enumeration only runs on a change
+                self._poll(POLL_INTERVAL, device_fingerprint)
+            else:
+                self._poll(ENUMERATE_INTERVAL, None)
+        except Exception as e:
+            self.signals.error.emit(f"Stopped watching the video devices: {e}", True)
+        finally:
+            self.signals.finished.emit()
+
+    def _watch(self, inotify: _Inotify):
+        # stop writes to this pipe to end the wait for events
+        self._wakeRead, self._wakeWrite = os.pipe()
+        try:
+            while not self.kill:
+                names = inotify.read(POLL_INTERVAL, self._wakeRead)
+                if not any(name.startswith("video") for name in names):
+                    continue
+                # a camera comes with several nodes, wait for all of them
+                while inotify.read(SETTLE_TIME):
+                    pass
+                self.check()
+        finally:
+            inotify.close()
+            wakeWrite, self._wakeWrite = self._wakeWrite, None
+            os.close(self._wakeRead)
+            os.close(wakeWrite)
+
+    def _poll(self, interval: float, fingerprint):
+        last = fingerprint() if fingerprint is not None else None
+        while not self.kill:
+            self.wake.wait(interval)
+            if self.kill:
+                return
+            if fingerprint is not None:
+                current = fingerprint()
+                if current == last:
+                    continue
+                last = current
+            self.check()
+
+    def stop(self):
+        self.kill = True
+        self.wake.set()
+        if self._wakeWrite is not None:
+            try:
+                os.write(self._wakeWrite, b"\0")
+            except OSError:
+                pass
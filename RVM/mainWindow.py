@@ -1,12 +1,19 @@
+import datetime
 import logging
 import os
 import sys
 from typing import Literal, Union
 
-from bases import ProjectSettings
-from devices import check_ffmpeg, get_devices
 from PyQt6 import QtCore, QtGui, QtWidgets
-from widgets import *
+
+from RVM.bases import ProjectSettings, ProxyBase, currentRevision
+from RVM.bases.autosave import autoSaver
+from RVM.camera.devicePool import sharedDevicePool
+from RVM.camera.proxy import proxyMaker, proxyPath
+from RVM.camera.thumbnails import thumbnailer
+from RVM.data.batchImport import BatchImporter, batchImportWorker
+from RVM.devices import DeviceCache, device_index, deviceScanner, deviceWatcher
+from RVM.widgets import *
 
 log = logging.getLogger()
 
@@ -19,10 +26,16 @@ def logging_exept_hook(exctype, value, traceback):
 sys.excepthook = logging_exept_hook
 
 
+class MainWindowSignals(QtCore.QObject):
+    settingsProblems = QtCore.pyqtSignal(list)
+
+
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self, logging_level=logging.DEBUG):
         super(MainWindow, self).__init__()
         self.setWindowTitle("Root Video Manager")
+        self.signals = MainWindowSignals()
+        self.signals.settingsProblems.connect(self.reportSettingsProblems)
         self.qtsettings = QtCore.QSettings("RVM", "RVM")
         self.projectSettings = ProjectSettings()
         self.logging_level = logging_level
@@ -43,12 +56,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.initLogging()
         self.initUI()
         self.initMenus()
+        self.initAutoSave()
+        self.initThumbnails()
+        self.initDeviceWatcher()
 
     def initSettings(self):
         latest_project_location = self.qtsettings.value("latest_project_location")
         if latest_project_location is not None:
             try:
-                self.projectSettings.load(latest_project_location)
+                if self.projectSettings.load(latest_project_location):
+                    self.validateSettingsInBackground()
                 self.updateStatus(
                     f"Loaded the latest project settings for {self.projectSettings.project_name}"
                 )
@@ -68,9 +85,50 @@ class MainWindow(QtWidgets.QMainWindow):
             format="%(asctime)s - %(levelname)s: %(message)s",
             datefmt="%m/%d/%Y %I:%M:%S %p",
         )
-        # TODO: spawn a thread to check for new devices instead of doing it here
         self.initDevices()
 
+    def initAutoSave(self):
+        """start saving the project in the background when it changes"""
+        self.autoSaveLabel = QtWidgets.QLabel("Not auto saved")
+        self.statusBar.addPermanentWidget(self.autoSaveLabel)
+        self.autoSaveThread = QtCore.QThread()
+        self.autoSaveWorker = autoSaver(lambda: self.projectSettings)
+        self.autoSaveWorker.moveToThread(self.autoSaveThread)
+        self.autoSaveThread.started.connect(self.autoSaveWorker.run)
+        self.autoSaveWorker.signals.finished.connect(self.autoSaveThread.quit)
+        self.autoSaveWorker.signals.saved.connect(self.autoSaved)
+        self.autoSaveWorker.signals.error.connect(self.updateStatus)
+        self.autoSaveThread.start()
+
+    def autoSaved(self, revision: int):
+        self.autoSaveLabel.setText(
+            f"Saved r{revision} at {datetime.datetime.now().strftime('%H:%M:%S')}"
+        )
+
+    def requestSave(self):
+        """ask the auto saver to save the project as soon as possible"""
+        if hasattr(self, "autoSaveWorker"):
+            self.autoSaveWorker.requestSave()
+
+    def validateSettingsInBackground(self):
+        """validate the project settings without blocking the gui, problems are reported by reportSettingsProblems"""
+        # the callback runs in the validation thread, emitting queues it to the gui thread
+        self.projectSettings.validateInBackground(self.signals.settingsProblems.emit)
+
+    def reportSettingsProblems(self, problems: list):
+        if len(problems) == 0:
+            log.debug("Background validation of the project settings passed")
+            return
+        for problem in problems:
+            log.warning(f"SETTINGS PROBLEM: {problem}")
+        self.updateStatus(f"Found {len(problems)} problems in the project settings")
+        self.messageBox(
+            "Project Settings",
+            f"Found {len(problems)} problems in the project settings:\n\n"
+            + "\n".join(problems[:10]),
+            "Warning",
+        )
+
     def initLogging(self):
         self.log = logging.getLogger()
         logFormatter = logging.Formatter(
@@ -127,7 +185,87 @@ class MainWindow(QtWidgets.QMainWindow):
         self.statusBar.showMessage(message, timeout)
 
     def initDevices(self):
-        self.videoDevices = self.getVideoDevices()
+        """show the video devices found last time at once and look for the current ones in the background"""
+        if not hasattr(self, "deviceCache"):
+            self.deviceCache = DeviceCache()
+        cached = self.deviceCache.devices()
+        # nothing is removed from the boxes until the devices were actually enumerated
+        self.videoDevices = dict(
+            cached if cached is not None else self.projectSettings.video_devices
+        )
+        self.refreshAllWidgets(self)
+        self.scanDevices()
+
+    def scanDevices(self, force: bool = False):
+        """enumerate the video devices in the background, unless the cached list is still fresh or force is True. see devicesFound"""
+        if getattr(self, "deviceThread", None) is not None:
+            return
+        self.deviceThread = QtCore.QThread()
+        self.deviceWorker = deviceScanner(self.deviceCache, force)
+        self.deviceWorker.moveToThread(self.deviceThread)
+        self.deviceThread.started.connect(self.deviceWorker.run)
+        self.deviceWorker.signals.finished.connect(self.deviceThread.quit)
+        self.deviceWorker.signals.finished.connect(self.deviceWorker.deleteLater)
+        self.deviceThread.finished.connect(self.deviceThread.deleteLater)
+        self.deviceThread.finished.connect(self.devicesScanned)
+        self.deviceWorker.signals.error.connect(self.updateStatus)
+        self.deviceWorker.signals.found.connect(self.devicesFound)
+        self.deviceThread.start()
+
+    def devicesScanned(self):
+        self.deviceThread = None
+        self.deviceWorker = None
+
+    def refreshVideoDevices(self):
+        self.updateStatus("Looking for video devices...")
+        self.scanDevices(force=True)
+
+    def initDeviceWatcher(self):
+        """update the boxes and cameras as video devices are plugged in and removed, see deviceAdded and deviceRemoved"""
+        self.deviceWatcherThread = QtCore.QThread()
+        self.deviceWatcherWorker = deviceWatcher(self.videoDevices, self.deviceCache)
+        self.deviceWatcherWorker.moveToThread(self.deviceWatcherThread)
+        self.deviceWatcherThread.started.connect(self.deviceWatcherWorker.run)
+        self.deviceWatcherWorker.signals.finished.connect(self.deviceWatcherThread.quit)
+        self.deviceWatcherWorker.signals.error.connect(self.updateStatus)
+        self.deviceWatcherWorker.signals.removed.connect(self.deviceRemoved)
+        self.deviceWatcherWorker.signals.added.connect(self.deviceAdded)
+        self.deviceWatcherThread.start()
+
+    def deviceRemoved(self, key: str, name: str):
+        """a video device was unplugged, the boxes keep it so they get it back when it is plugged in again"""
+        if key not in self.videoDevices:
+            return
+        # an idle device kept open for the next trial is gone
+        sharedDevicePool().close(device_index(self.videoDevices, key))
+        del self.videoDevices[key]
+        self.projectSettings.video_devices = dict(self.videoDevices)
+        self.updateStatus(f"Camera unplugged: {name}")
+        self.updateDeviceWidgets(key, f"Camera unplugged: {name}")
+
+    def deviceAdded(self, key: str, name: str):
+        self.videoDevices[key] = name
+        self.projectSettings.video_devices = dict(self.videoDevices)
+        self.updateStatus(f"Camera plugged in: {name}")
+        self.updateDeviceWidgets(key, f"Camera plugged in: {name}")
+
+    def updateDeviceWidgets(self, key: str, message: str):
+        """update the widgets showing the boxes and cameras of a video device, and nothing else"""
+        for dockWidget in self.findChildren(BoxManagerDockWidget):
+            dockWidget.updateDeviceItems(key)
+        for dockWidget in self.findChildren(CameraWindowDockWidget):
+            trial = dockWidget.cameraWindow.trial
+            if trial is not None and trial.box.camera == key:
+                dockWidget.cameraWindow.cam.updateStatus(message)
+
+    def devicesFound(self, devices: dict, cached: bool):
+        if not cached:
+            self.updateStatus(f"Found {len(devices)} video devices")
+        if devices == self.videoDevices and devices == dict(
+            self.projectSettings.video_devices
+        ):
+            return
+        self.videoDevices = dict(devices)
         to_del = []
         for key, val in self.projectSettings.video_devices.items():
             # if the key is not in the new devices, remove it from the project settings and Box
@@ -156,8 +294,151 @@ class MainWindow(QtWidgets.QMainWindow):
         self.menuBar.addMenu(self.ioMenu)
         # to the IO menu, add a refresh video devices action
         self.refreshVideoDevicesAction = QtGui.QAction("Refresh Video Devices", self)
-        self.refreshVideoDevicesAction.triggered.connect(self.initDevices)
+        self.refreshVideoDevicesAction.triggered.connect(self.refreshVideoDevices)
         self.ioMenu.addAction(self.refreshVideoDevicesAction)
+        # to the IO menu, add an import medpc folder action
+        self.importMedPCAction = QtGui.QAction("Import MedPC Folder", self)
+        self.importMedPCAction.triggered.connect(self.importMedPCFolder)
+        self.ioMenu.addAction(self.importMedPCAction)
+
+        # to the IO menu, add a generate thumbnails action
+        self.thumbnailsAction = QtGui.QAction("Generate Video Thumbnails", self)
+        self.thumbnailsAction.triggered.connect(self.generateTrialThumbnails)
+        self.ioMenu.addAction(self.thumbnailsAction)
+        # to the IO menu, add a make review proxies action
+        self.proxiesAction = QtGui.QAction("Make Review Proxies", self)
+        self.proxiesAction.triggered.connect(self.makeTrialProxies)
+        self.ioMenu.addAction(self.proxiesAction)
+
+    def initThumbnails(self):
+        """thumbnails are generated in the background, pausing while a camera records"""
+        self.thumbnailJobs = []
+        self.thumbnailYieldTimer = QtCore.QTimer(self)
+        self.thumbnailYieldTimer.timeout.connect(self.yieldThumbnails)
+        self.thumbnailYieldTimer.start(1000)
+
+    def isRecording(self) -> bool:
+        return any(
+            cw.cam is not None and cw.cam.recording
+            for cw in self.findChildren(CameraWindow)
+        )
+
+    def yieldThumbnails(self):
+        if len(self.thumbnailJobs) == 0:
+            return
+        recording = self.isRecording()
+        for thread, worker in self.thumbnailJobs:
+            worker.setYield(recording)
+
+    def startThumbnails(self, paths: list) -> thumbnailer:
+        """generate the thumbnails of videos in the background, returns the worker to connect to its signals"""
+        thread = QtCore.QThread()
+        worker = thumbnailer(paths)
+        worker.setYield(self.isRecording())
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.signals.finished.connect(thread.quit)
+        worker.signals.error.connect(self.updateStatus)
+        job = (thread, worker)
+        self.thumbnailJobs.append(job)
+        thread.finished.connect(lambda: self.thumbnailJobs.remove(job))
+        thread.start()
+        return worker
+
+    def generateTrialThumbnails(self):
+        paths = [
+            str(trial.video_location)
+            for trial in self.projectSettings.trials
+            if trial.video_location is not None and os.path.isfile(trial.video_location)
+        ]
+        if len(paths) == 0:
+            self.updateStatus("No trial videos to make thumbnails of")
+            return
+        worker = self.startThumbnails(paths)
+        worker.signals.done.connect(
+            lambda path: self.updateStatus(f"Made the thumbnails of {path}")
+        )
+        self.updateStatus(f"Making thumbnails of {len(paths)} trial videos")
+
+    def makeTrialProxies(self):
+        """transcode small proxies of the finished trials that have none or a stale one, in a background process pool"""
+        jobs = [
+            (
+                trial.uid,
+                str(trial.video_location),
+                proxyPath(self.projectSettings.project_location, trial.uid),
+            )
+            for trial in self.projectSettings.trials
+            if trial.state in ("Finished", "Stopped")
+            and trial.video_location is not None
+            and os.path.isfile(trial.video_location)
+            and (trial.proxy is None or not trial.proxy.isCurrent(trial.video_location))
+        ]
+        if len(jobs) == 0:
+            self.updateStatus("All finished trials have current proxies")
+            return
+        self.proxiesAction.setEnabled(False)
+        self.proxyThread = QtCore.QThread()
+        self.proxyWorker = proxyMaker(jobs)
+        self.proxyWorker.moveToThread(self.proxyThread)
+        self.proxyThread.started.connect(self.proxyWorker.run)
+        self.proxyWorker.signals.finished.connect(self.proxyThread.quit)
+        self.proxyWorker.signals.error.connect(self.updateStatus)
+        self.proxyWorker.signals.progress.connect(
+            lambda done, total: self.updateStatus(f"Making proxies {done}/{total}")
+        )
+        self.proxyWorker.signals.made.connect(self.proxyMade)
+        self.proxyThread.finished.connect(lambda: self.proxiesAction.setEnabled(True))
+        self.proxyThread.start()
+        self.updateStatus(f"Making proxies of {len(jobs)} trials")
+
+    def proxyMade(self, uid: str, proxy: dict):
+        for trial in self.projectSettings.trials:
+            if trial.uid == uid:
+                trial.proxy = ProxyBase(**proxy)
+                self.requestSave()
+                return
+
+    def importMedPCFolder(self):
+        """import the new and changed MedPC files in a folder into their trials, parsing in the background"""
+        dir_path = QtWidgets.QFileDialog.getExistingDirectory(
+            self, "Select MedPC Folder"
+        )
+        if not dir_path:
+            return
+        self.batchImporter = BatchImporter(self.projectSettings)
+        files = self.batchImporter.scan(dir_path)
+        if len(files) == 0:
+            self.updateStatus("No new MedPC files to import")
+            return
+        self.importMedPCAction.setEnabled(False)
+        self.batchImportThread = QtCore.QThread()
+        self.batchImportWorker = batchImportWorker(self.batchImporter, files)
+        self.batchImportWorker.moveToThread(self.batchImportThread)
+        self.batchImportThread.started.connect(self.batchImportWorker.run)
+        self.batchImportWorker.signals.finished.connect(self.batchImportThread.quit)
+        self.batchImportWorker.signals.progress.connect(
+            lambda done, total: self.updateStatus(
+                f"Importing MedPC files {done}/{total}"
+            )
+        )
+        self.batchImportWorker.signals.parsed.connect(self.medPCImported)
+        self.batchImportThread.finished.connect(
+            lambda: self.importMedPCAction.setEnabled(True)
+        )
+        self.batchImportThread.start()
+
+    def medPCImported(self, results: list):
+        summary = self.batchImporter.apply(results)
+        for record in summary["unmatched"]:
+            log.warning(
+                f"No trial for MedPC subject {record.subject} in box {record.box} at {record.start_time} ({record.file})"
+            )
+        self.updateStatus(
+            f"Imported {summary['files']} MedPC files, matched {summary['matched']} of {summary['records']} records to trials"
+        )
+        self.refreshAllWidgets(self)
+        self.requestSave()
 
     def getCameraWindowGrid(self):
         """
@@ -223,10 +504,6 @@ class MainWindow(QtWidgets.QMainWindow):
             # add the dock widget to the main window
             self.addDockWidget(QtCore.Qt.DockWidgetArea.RightDockWidgetArea, dockWidget)
 
-    def getVideoDevices(self) -> dict:
-        check_ffmpeg()
-        return get_devices()["video"]
-
     def initUI(self):
         # create toolbar
         self.toolbar = QtWidgets.QToolBar()
@@ -524,7 +801,8 @@ class MainWindow(QtWidgets.QMainWindow):
             self.updateStatus("No project selected")
             return
         try:
-            self.projectSettings.load(dir)
+            if self.projectSettings.load(dir):
+                self.validateSettingsInBackground()
             self.loadProject(self.projectSettings)
         except Exception as e:
             # pop up a error message
@@ -604,7 +882,11 @@ class MainWindow(QtWidgets.QMainWindow):
         self.projectSettings.window_size = (self.size().width(), self.size().height())
 
         # save the settings to a json file
+        revision = currentRevision()
         self.projectSettings.save()
+        if hasattr(self, "autoSaveWorker"):
+            self.autoSaveWorker.markSaved(revision)
+            self.autoSaved(revision)
         self.qtsettings.setValue(
             "latest_project_location", self.projectSettings.project_location
         )
@@ -619,6 +901,24 @@ class MainWindow(QtWidgets.QMainWindow):
                     event.ignore()
                     return
         self.saveSettings()
+        for thread, worker in list(self.thumbnailJobs):
+            worker.stop()
+            thread.quit()
+            thread.wait()
+        if getattr(self, "proxyThread", None) is not None:
+            self.proxyWorker.stop()
+            self.proxyThread.quit()
+            self.proxyThread.wait()
+        if getattr(self, "deviceThread", None) is not None:
+            self.deviceThread.quit()
+            self.deviceThread.wait()
+        if getattr(self, "deviceWatcherThread", None) is not None:
+            self.deviceWatcherWorker.stop()
+            self.deviceWatcherThread.quit()
+            self.deviceWatcherThread.wait()
+        self.autoSaveWorker.close()
+        self.autoSaveThread.quit()
+        self.autoSaveThread.wait()
         event.accept()
 
 
@@ -722,6 +1022,14 @@ class ProjectSettingsDialog(QtWidgets.QDialog):
         )
         self.selectProjectDirectoryButton.clicked.connect(self.selectProjectDirectory)
 
+        # how old finished trials get before they are moved to the archive
+        self.archiveAfterLabel = QtWidgets.QLabel("Archive finished trials after")
+        self.archiveAfterSpinBox = QtWidgets.QSpinBox()
+        self.archiveAfterSpinBox.setRange(0, 3650)
+        self.archiveAfterSpinBox.setSuffix(" days")
+        self.archiveAfterSpinBox.setSpecialValueText("Never")
+        self.archiveAfterSpinBox.setValue(self.projectSettings.archive_after_days)
+
         # button for creating the project
         self.saveProjectSettingsButton = QtWidgets.QPushButton("Save Project Settings")
         self.saveProjectSettingsButton.clicked.connect(self.saveProjectSettings)
@@ -731,7 +1039,9 @@ class ProjectSettingsDialog(QtWidgets.QDialog):
         self.layout.addWidget(self.projectNameLabel, 0, 0, 1, 2)
         self.layout.addWidget(self.projectDirectoryLabel, 1, 0)
         self.layout.addWidget(self.selectProjectDirectoryButton, 1, 1)
-        self.layout.addWidget(self.saveProjectSettingsButton, 2, 1, 1, 1)
+        self.layout.addWidget(self.archiveAfterLabel, 2, 0)
+        self.layout.addWidget(self.archiveAfterSpinBox, 2, 1)
+        self.layout.addWidget(self.saveProjectSettingsButton, 3, 1, 1, 1)
 
         # set the layout
         self.setLayout(self.layout)
@@ -749,6 +1059,7 @@ class ProjectSettingsDialog(QtWidgets.QDialog):
         # create a new project
         self.projectSettings.project_name = projectName
         self.projectSettings.project_location = projectDirectory
+        self.projectSettings.archive_after_days = self.archiveAfterSpinBox.value()
         # emit the signal
         self.signals.projectSettingsSignal.emit(self.projectSettings)
         # close the window
@@ -175,6 +175,7 @@ class AnimalManagerDockWidget(QtWidgets.QDockWidget):
     def addAnimal(self, animal: AnimalBase):
         # add the animal to the project settings
         self.projectSettings.animals.append(animal)
+        self.projectSettings.markChanged("animals")
         # add the animal to the tree widget
         self.addAnimals()
         self.parent.refreshAllWidgets(self)
@@ -213,6 +214,7 @@ class AnimalManagerDockWidget(QtWidgets.QDockWidget):
             )
         # remove the animal from the project settings
         self.projectSettings.animals.remove(animal)
+        self.projectSettings.markChanged("animals")
         # remove the animal from the tree widget
         self.treeWidget.takeTopLevelItem(self.treeWidget.indexOfTopLevelItem(item))
 
@@ -258,6 +260,7 @@ class AnimalManagerDockWidget(QtWidgets.QDockWidget):
                 continue
             # remove the animal from the project settings
             self.projectSettings.animals.remove(animal)
+            self.projectSettings.markChanged("animals")
             # remove the animal from the tree widget
             self.treeWidget.takeTopLevelItem(self.treeWidget.indexOfTopLevelItem(item))
 
@@ -6,6 +6,7 @@ import os
 from PyQt6 import QtCore, QtGui, QtWidgets
 
 from RVM.bases import Box, BoxBase, ProjectSettings, Protocol
+from RVM.devices import device_index
 from RVM.widgets.camWin import CameraPreviewWindow
 
 
@@ -146,6 +147,7 @@ class BoxManagerDockWidget(QtWidgets.QDockWidget):
             The box to add to the project settings
         """
         self.projectSettings.boxes.append(box)
+        self.projectSettings.markChanged("boxes")
         self.updateBoxList()
         self.parent.refreshAllWidgets(self)
         self.signals.boxCreated.emit(box)
@@ -193,7 +195,7 @@ class BoxManagerDockWidget(QtWidgets.QDockWidget):
                 parent=self.parent, mainWin=self.parent
             )
             self.cameraPreviewWindow.createCamera(
-                camNum=list(self.parent.videoDevices.keys()).index(box.camera),
+                camNum=device_index(self.parent.videoDevices, box.camera),
                 camName=f"Box {box.uid} Camera",
                 fps=30,
                 prevFPS=30,
@@ -249,6 +251,7 @@ class BoxManagerDockWidget(QtWidgets.QDockWidget):
             return
         # remove the box from the project settings
         self.projectSettings.boxes.remove(box)
+        self.projectSettings.markChanged("boxes")
         # update the box list
         self.updateBoxList()
         self.parent.updateStatus("Deleted box {}".format(box.uid))
@@ -341,6 +344,27 @@ class BoxManagerDockWidget(QtWidgets.QDockWidget):
         """
         self.updateBoxList()
 
+    def updateDeviceItems(self, key: str):
+        """
+        Update the camera of the boxes using a video device, after it was plugged in or removed
+
+        Parameters
+        ----------
+        key : str
+            The camera key
+        """
+        name = self.getCameraNameFromKey(key)
+        # this is not an edit of the box, don't let updateBoxFromItem see it
+        self.treeWidget.blockSignals(True)
+        try:
+            for i in range(self.treeWidget.topLevelItemCount()):
+                item = self.treeWidget.topLevelItem(i)
+                box = self.projectSettings.getBoxFromId(item.text(0))
+                if box is not None and box.camera == key:
+                    item.setText(1, name if name else "Unplugged")
+        finally:
+            self.treeWidget.blockSignals(False)
+
     def getCameraNameFromKey(self, key: str) -> str:
         """
         Get the camera name from the camera key
@@ -485,8 +509,13 @@ class BoxDialog(QtWidgets.QDialog):
         )
         try:
             self.cameraPreviewWindow.createCamera(
-                camNum=list(self.mainWin.videoDevices.values()).index(
-                    self.cameraComboBox.currentText()
+                camNum=device_index(
+                    self.mainWin.videoDevices,
+                    next(
+                        key
+                        for key, value in self.mainWin.videoDevices.items()
+                        if value == self.cameraComboBox.currentText()
+                    ),
                 ),
                 camName=self.cameraComboBox.currentText(),
                 fps=30,
@@ -1,5 +1,6 @@
 import logging
 import os
+import threading
 from typing import TYPE_CHECKING
 
 from PyQt6 import QtCore, QtGui, QtWidgets
@@ -307,9 +308,9 @@ class CameraWindow(QtWidgets.QMainWindow):
         self.previewButton.setEnabled(False)
         self.recordButton.setEnabled(True)
 
-    def startRecording(self):
-        """save the video"""
-        self.cam.startRecording()
+    def startRecording(self, gate: threading.Event = None):
+        """save the video, once ``gate`` is set if one is given (see ``Camera.startRecording``)"""
+        self.cam.startRecording(gate)
         self.recordButton.setEnabled(False)
         self.stopButton.setEnabled(True)
 
@@ -319,6 +320,8 @@ class CameraWindow(QtWidgets.QMainWindow):
         self.cam.stopRecording()
         self.recordButton.setEnabled(True)
         self.stopButton.setEnabled(False)
+        # don't risk losing the end of the trial
+        self.mainWin.requestSave()
 
     def resizeWindow(self):
         """resize the dock widget to the size of the video"""
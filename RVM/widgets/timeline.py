@@ -0,0 +1,110 @@
+# a scrubbable strip of video thumbnails
+import logging
+
+import numpy as np
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+from RVM.camera.thumbnails import ThumbnailCache
+
+log = logging.getLogger()
+
+
+class TimelineStripSignals(QtCore.QObject):
+    seekRequested = QtCore.pyqtSignal(float)
+    # the mouse was released after clicking or dragging, at this time
+    seekFinished = QtCore.pyqtSignal(float)
+
+
+class TimelineStrip(QtWidgets.QWidget):
+    """Shows the thumbnails of a video side by side across its width, clicking or dragging seeks to that time.
+
+    ``seekRequested`` is emitted continuously while dragging and ``seekFinished`` once the mouse is released, so a player can scrub through a cheap source and only settle on the exact frame at the end.
+
+    The thumbnails are read from the memory mapped cache only as they are drawn. Call ``reload`` as generation progresses to show more of them.
+    """
+
+    def __init__(self, parent=None):
+        super(TimelineStrip, self).__init__(parent)
+        self.signals = TimelineStripSignals()
+        self.cache = None
+        self.path = None
+        self.duration = 0.0
+        self.position = 0.0
+        self._images = {}
+        self.setMinimumHeight(48)
+        self.setSizePolicy(
+            QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Fixed
+        )
+        self.setMouseTracking(False)
+
+    def sizeHint(self):
+        return QtCore.QSize(640, 72)
+
+    def setVideo(self, path, duration: float):
+        self.path = str(path)
+        self.duration = duration
+        self.reload()
+
+    def reload(self):
+        """Reopen the thumbnails of the video, e.g. after more were generated"""
+        if self.path is None:
+            return
+        self.cache = ThumbnailCache.load(self.path)
+        self._images.clear()
+        self.update()
+
+    def setPosition(self, seconds: float):
+        self.position = seconds
+        self.update()
+
+    def _image(self, i: int) -> QtGui.QImage:
+        image = self._images.get(i)
+        if image is None:
+            thumb = np.ascontiguousarray(self.cache.thumbs[i])
+            image = QtGui.QImage(
+                thumb.data,
+                thumb.shape[1],
+                thumb.shape[0],
+                thumb.strides[0],
+                QtGui.QImage.Format.Format_BGR888,
+            ).copy()
+            self._images[i] = image
+        return image
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QColor(30, 30, 30))
+        width, height = self.width(), self.height()
+        if self.cache is not None and self.cache.done > 0 and self.duration > 0:
+            thumb_h, thumb_w = self.cache.thumbs.shape[1:3]
+            slot = max(1, int(thumb_w * height / thumb_h))
+            # draw the thumbnail nearest the time at the middle of each slot
+            for x in range(0, width, slot):
+                seconds = (x + slot / 2) / width * self.duration
+                i = min(int(seconds / self.cache.interval), len(self.cache) - 1)
+                if i >= self.cache.done:
+                    continue
+                painter.drawImage(QtCore.QRect(x, 0, slot, height), self._image(i))
+        if self.duration > 0:
+            x = int(self.position / self.duration * width)
+            painter.setPen(QtGui.QPen(QtGui.QColor(255, 60, 60), 2))
+            painter.drawLine(x, 0, x, height)
+        painter.end()
+
+    def _seek(self, x: float):
+        if self.duration <= 0:
+            return
+        seconds = min(max(x / max(self.width(), 1), 0.0), 1.0) * self.duration
+        self.setPosition(seconds)
+        self.signals.seekRequested.emit(seconds)
+
+    def mousePressEvent(self, event):
+        self._seek(event.position().x())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & QtCore.Qt.MouseButton.LeftButton:
+            self._seek(event.position().x())
+
+    def mouseReleaseEvent(self, event):
+        if self.duration > 0:
+            self.signals.seekFinished.emit(self.position)
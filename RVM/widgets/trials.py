@@ -3,13 +3,17 @@
 import datetime
 import logging
 import os
+import threading
 from typing import TYPE_CHECKING
 
 from PyQt6 import QtCore, QtGui, QtWidgets
 
-from RVM.bases import Animal, Box, ProjectSettings, Trial, TrialBase
-from RVM.widgets.camWin import (CameraPreviewWindow, CameraWindow,
-                                CameraWindowDockWidget)
+from RVM.bases import Animal, Box, FreezingBase, ProjectSettings, Trial, TrialBase
+from RVM.camera.camera import cameraOpener
+from RVM.data.alignment import alignTrial
+from RVM.data.batchAnalysis import BatchAnalyzer, batchAnalysisWorker
+from RVM.devices import device_index
+from RVM.widgets.camWin import CameraPreviewWindow, CameraWindow, CameraWindowDockWidget
 
 if TYPE_CHECKING:
     from RVM.mainWindow import MainWindow
@@ -22,7 +26,10 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
     stateColors = {
         "Good": QtGui.QColor(11, 212, 125),
         "Bad": QtGui.QColor(212, 99, 99),
+        "Archived": QtGui.QColor(128, 128, 128),
     }
+    # item data role used to flag trials that come from the (read-only) archive
+    archivedRole = QtCore.Qt.ItemDataRole.UserRole + 1
 
     def __init__(
         self, projectSettings: ProjectSettings, mainWin: "MainWindow", parent=None
@@ -132,8 +139,11 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         )
         self.treeWidget.customContextMenuRequested.connect(self.showContextMenu)
         self.treeWidget.itemDoubleClicked.connect(self.editTrial)
+        # counts of the trials per state, from the trial index
+        self.summaryLabel = QtWidgets.QLabel()
         self.layout.addWidget(self.buttonWidget)
         self.layout.addWidget(self.treeWidget)
+        self.layout.addWidget(self.summaryLabel)
 
         self.updateTreeWidget()
 
@@ -142,6 +152,8 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
             return
         if self.treeWidget.itemAt(pos) is not self.treeWidget.currentItem():
             return
+        if self.isArchived(self.treeWidget.currentItem()):
+            return
         self.contextMenu = QtWidgets.QMenu()
         self.editAction = QtGui.QAction("Edit", self)
         self.editAction.triggered.connect(
@@ -161,6 +173,12 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         self.contextMenu.addAction(self.previewAction)
         self.contextMenu.addAction(self.deleteAction)
         self.contextMenu.addAction(self.duplicateAction)
+        self.alignAction = QtGui.QAction("Align Events", self)
+        self.alignAction.triggered.connect(self.alignTrials)
+        self.contextMenu.addAction(self.alignAction)
+        self.freezingAction = QtGui.QAction("Analyze Freezing", self)
+        self.freezingAction.triggered.connect(self.analyzeFreezing)
+        self.contextMenu.addAction(self.freezingAction)
 
         if self.treeWidget.currentItem().text(3) != "Waiting":
             # disable preview if the trial is not running
@@ -181,24 +199,40 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
             self.trialFilters["State"] = ["Running", "Waiting"]
         self.updateTreeWidget()
 
-    def filteringCriteria(self, trial: Trial):
-        """Checks if a trial passes the filtering criteria"""
-        if self.trialFilters["State"] and trial.state not in self.trialFilters["State"]:
-            return True
-        return False
-
     def updateTreeWidget(self):
         self.treeWidget.clear()
-        for trial in self.projectSettings.trials:
-            if self.filteringCriteria(trial):
-                continue
+        index = self.projectSettings.trialIndex
+        mask = index.filter(states=self.trialFilters["State"] or None)
+        for trial in index.trials(mask):
             try:
                 self.addTrialToTreeWidget(trial)
             except Exception as e:
                 print(e)
                 continue
-
-    def addTrialToTreeWidget(self, trial: Trial):
+        if self.showAllCheckBox.isChecked():
+            # the archive is only loaded when someone asks to see it
+            for trial in self.projectSettings.archivedTrials():
+                try:
+                    self.addTrialToTreeWidget(trial, archived=True)
+                except Exception as e:
+                    print(e)
+                    continue
+        self.updateSummary()
+
+    def updateSummary(self):
+        index = self.projectSettings.trialIndex
+        counts = index.groupBy("state")
+        durations = index.groupBy("state", index.duration, "mean")
+        text = "   ".join(f"{state}: {count}" for state, count in counts.items())
+        if "Finished" in durations:
+            minutes = durations["Finished"] / 60
+            text += f"   |   Mean Finished Duration: {minutes:.1f} min"
+        self.summaryLabel.setText(text)
+
+    def isArchived(self, item: QtWidgets.QTreeWidgetItem) -> bool:
+        return bool(item.data(0, TrialManagerDockWidget.archivedRole))
+
+    def addTrialToTreeWidget(self, trial: Trial, archived: bool = False):
         trialItem = QtWidgets.QTreeWidgetItem(self.treeWidget)
         trialItem.setText(0, trial.uid)
         trialItem.setText(1, trial.animal.uid)
@@ -214,6 +248,13 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         trialItem.setText(4, str(trial.start_time))
         trialItem.setText(5, str(trial.end_time))
         trialItem.setText(6, trial.notes)
+        if archived:
+            trialItem.setData(0, TrialManagerDockWidget.archivedRole, True)
+            trialItem.setToolTip(0, "Archived trials are read-only")
+            for i in range(trialItem.columnCount()):
+                trialItem.setForeground(
+                    i, TrialManagerDockWidget.stateColors["Archived"]
+                )
 
     def searchTreeWidget(self, text: str):
         for i in range(self.treeWidget.topLevelItemCount()):
@@ -227,6 +268,7 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
 
     def addTrial(self, trial: Trial):
         self.projectSettings.trials.append(trial)
+        self.projectSettings.markChanged("trials")
         self.addTrialToTreeWidget(trial)
 
     def updateTrial(self, trial: Trial):
@@ -261,6 +303,9 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         self.trialDialog.exec()
 
     def editTrial(self, trialItem: QtWidgets.QTreeWidgetItem):
+        if self.isArchived(trialItem):
+            self.mainWin.updateStatus(f"Trial {trialItem.text(0)} is archived")
+            return
         trial = self.projectSettings.getTrialFromId(trialItem.text(0))
         self.trialDialog = TrialEditDialog(
             self.projectSettings, mainWin=self.mainWin, parent=self
@@ -272,7 +317,9 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
     def duplicateTrial(self, *args, **kwargs):
         # get selected trials
         for trialItem in self.treeWidget.selectedItems():
-            trial = self.projectSettings.getTrialFromId(trialItem.text(0))
+            trial = self.projectSettings.getTrialFromId(
+                trialItem.text(0), archived=self.isArchived(trialItem)
+            )
             # new trial with same parameters
             newTrial = Trial(
                 animal=trial.animal,
@@ -283,7 +330,72 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
             )
             self.addTrial(newTrial)
 
+    def alignTrials(self, *args, **kwargs):
+        """Find the video frames of the imported events of the selected trials"""
+        aligned = 0
+        for trialItem in self.treeWidget.selectedItems():
+            trial = self.projectSettings.getTrialFromId(trialItem.text(0))
+            try:
+                alignTrial(trial)
+                aligned += 1
+            except ValueError as e:
+                log.warning(f"Could not align trial {trial.uid}: {e}")
+        self.mainWin.updateStatus(
+            f"Aligned {aligned} of {len(self.treeWidget.selectedItems())} trials"
+        )
+
+    def analyzeFreezing(self, *args, **kwargs):
+        """Measure the freezing in the videos of the selected trials in the background, unchanged videos are read from the analysis cache"""
+        if getattr(self, "freezingThread", None) is not None:
+            self.mainWin.updateStatus("Freezing is already being analyzed")
+            return
+        jobs = []
+        for trialItem in self.treeWidget.selectedItems():
+            trial = self.projectSettings.getTrialFromId(trialItem.text(0))
+            if trial.video_location is None or not os.path.isfile(trial.video_location):
+                log.warning(f"Trial {trial.uid} has no video to analyze")
+                continue
+            windows = trial.alignment.windows if trial.alignment is not None else None
+            jobs.append((trial.uid, str(trial.video_location), windows))
+        if len(jobs) == 0:
+            return
+        self.freezingThread = QtCore.QThread()
+        self.freezingWorker = batchAnalysisWorker(
+            BatchAnalyzer(self.projectSettings), jobs, "freezing"
+        )
+        self.freezingWorker.moveToThread(self.freezingThread)
+        self.freezingThread.started.connect(self.freezingWorker.run)
+        self.freezingWorker.signals.finished.connect(self.freezingThread.quit)
+        self.freezingWorker.signals.error.connect(self.mainWin.updateStatus)
+        self.freezingWorker.signals.progress.connect(
+            lambda done, total: self.mainWin.updateStatus(
+                f"Analyzing freezing: {done / max(total, 1):.0%}"
+            )
+        )
+        self.freezingWorker.signals.analyzed.connect(self.freezingAnalyzed)
+        self.freezingThread.finished.connect(self.freezingFinished)
+        self.freezingThread.start()
+
+    def freezingAnalyzed(self, uid: str, result: dict):
+        trial = self.projectSettings.getTrialFromId(uid)
+        if trial is None:
+            return
+        trial.freezing = FreezingBase(**result)
+        self.mainWin.updateStatus(
+            f"Trial {uid} froze {trial.freezing.freezing:.0%} of the time in {len(trial.freezing.bouts)} bouts"
+        )
+        self.mainWin.requestSave()
+
+    def freezingFinished(self):
+        self.freezingThread = None
+        self.freezingWorker = None
+
     def deleteDeterminer(self):
+        if any(self.isArchived(item) for item in self.treeWidget.selectedItems()):
+            self.mainWin.messageBox(
+                "Error", "Archived trials can not be deleted", "Warning"
+            )
+            return
         if len(self.treeWidget.selectedItems()) == 1:
             self.deleteTrial(self.treeWidget.currentItem())
         elif len(self.treeWidget.selectedItems()) > 1:
@@ -299,6 +411,7 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
                 self.projectSettings.trials.remove(
                     self.projectSettings.getTrialFromId(item.text(0))
                 )
+                self.projectSettings.markChanged("trials")
             self.updateTreeWidget()
 
     def deleteTrial(self, item, *args, **kwargs):
@@ -316,6 +429,7 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         )
         if confim:
             self.projectSettings.trials.remove(trial)
+            self.projectSettings.markChanged("trials")
             self.updateTreeWidget()
             self.mainWin.updateStatus("Trial {} deleted".format(trial.uid))
 
@@ -335,9 +449,7 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
                     parent=self.mainWin, mainWin=self.mainWin
                 )
                 self.cameraPreviewWindow.createCamera(
-                    camNum=list(self.mainWin.videoDevices.keys()).index(
-                        trial.box.camera
-                    ),
+                    camNum=device_index(self.mainWin.videoDevices, trial.box.camera),
                     camName=self.mainWin.videoDevices[trial.box.camera],
                     fps=30,
                     prevFPS=30,
@@ -376,15 +488,18 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         return str(os.path.join(video_dir, file_name))
 
     def runTrials(self, trials_to_run: list[TrialBase]):
+        """Open the cameras of the trials all at once in the background, then start the trials together, see ``startOpenedTrials``"""
+        if getattr(self, "openThread", None) is not None:
+            self.mainWin.updateStatus("Cameras are already being opened")
+            return
+        self.pendingTrials = []
         for trial in trials_to_run:
             # create a new camera window
             trial.video_location = self.getVideoPath(trial)
             try:
                 cameraWindow = CameraWindow(
                     parent=self.mainWin,
-                    camNum=list(self.mainWin.videoDevices.keys()).index(
-                        trial.box.camera
-                    ),
+                    camNum=device_index(self.mainWin.videoDevices, trial.box.camera),
                     mainWin=self.mainWin,
                     trial=trial,
                 )
@@ -395,20 +510,13 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
                     continue
 
                 cameraWindow.show()
-
-                dw.cameraWindow.startRecording()
-                dw.cameraWindow.startPreview()
-                trial.start_time = datetime.datetime.now()
-                trial.state = "Running"
-                self.updateTrial(trial)
-
-                self.mainWin.updateStatus(f"Running Trial {trial.uid}")
+                self.pendingTrials.append((trial, dw))
 
             except Exception as e:
                 # get traceback
                 import traceback
 
-                log.debug(f"{traceback.format_exc()}\m\t{e}")
+                log.debug(f"{traceback.format_exc()}\n\t{e}")
                 self.mainWin.messageBox(
                     "Error",
                     f"Could not run trial {trial.uid}",
@@ -417,6 +525,94 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
 
         self.runDialog.close()
         self.runDialog = None
+        if not self.pendingTrials:
+            return
+
+        self.mainWin.updateStatus(f"Opening {len(self.pendingTrials)} cameras...")
+        self.openThread = QtCore.QThread()
+        self.openWorker = cameraOpener(
+            [dw.cameraWindow.cam for _, dw in self.pendingTrials]
+        )
+        self.openWorker.moveToThread(self.openThread)
+        self.openThread.started.connect(self.openWorker.run)
+        self.openWorker.signals.finished.connect(self.openThread.quit)
+        self.openWorker.signals.finished.connect(self.openWorker.deleteLater)
+        self.openThread.finished.connect(self.openThread.deleteLater)
+        self.openWorker.signals.opened.connect(
+            lambda name, seconds, ok: self.mainWin.updateStatus(
+                f"Opened {name} in {seconds:.2f} s"
+                if ok
+                else f"Could not open {name} ({seconds:.2f} s)"
+            )
+        )
+        self.openWorker.signals.finished.connect(self.startOpenedTrials)
+        self.openThread.start()
+
+    def startOpenedTrials(self, latencies: dict):
+        """Start recording every trial whose camera opened, all at the same moment
+
+        The writer and reader threads of every recording are set up first, then a single event releases all of the recordings at once and its time is the start time of every trial.
+
+        Parameters
+        ----------
+        latencies : dict
+            camera name -> seconds it took to open, None if it failed
+        """
+        self.openThread = None
+        self.openWorker = None
+        pending, self.pendingTrials = self.pendingTrials, []
+        log.info(
+            "Camera open latency: "
+            + ", ".join(
+                f"{name} {'failed' if s is None else f'{s:.2f} s'}"
+                for name, s in latencies.items()
+            )
+        )
+        failed = []
+        started = []
+        gate = threading.Event()
+        setup = QtCore.QElapsedTimer()
+        setup.start()
+        for trial, dw in pending:
+            if not dw.cameraWindow.cam.deviceOpen:
+                failed.append(trial)
+                continue
+            try:
+                dw.cameraWindow.startRecording(gate)
+                started.append((trial, dw))
+            except Exception as e:
+                import traceback
+
+                log.debug(f"{traceback.format_exc()}\n\t{e}")
+                failed.append(trial)
+        setupTime = setup.elapsed()
+        # every recording keeps the frames from here on
+        start_time = datetime.datetime.now()
+        gate.set()
+        for trial, dw in started:
+            trial.start_time = start_time
+            trial.state = "Running"
+        # the previews are not time critical, start them after every recording
+        for trial, dw in started:
+            dw.cameraWindow.startPreview()
+            self.updateTrial(trial)
+        for trial, dw in pending:
+            if trial in failed:
+                dw.close()
+
+        if started:
+            opened = [s for s in latencies.values() if s is not None]
+            self.mainWin.updateStatus(
+                f"Running {len(started)} trials, started together after {setupTime} ms of setup"
+                + (f", slowest camera opened in {max(opened):.2f} s" if opened else "")
+            )
+        if failed:
+            self.mainWin.messageBox(
+                "Error",
+                "Could not run trials " + ", ".join(str(t.uid) for t in failed),
+                "Critical",
+            )
+        self.mainWin.requestSave()
 
     def stopTrials(self):
         for trial in self.projectSettings.trials:
@@ -428,6 +624,7 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
             dockWidget.cameraWindow.stopRecording()
             dockWidget.close()
 
+        self.mainWin.requestSave()
         self.mainWin.updateStatus("Stopped Trials")
 
     def openRunDialog(self):
@@ -435,7 +632,7 @@ class TrialManagerDockWidget(QtWidgets.QDockWidget):
         selectedTrials = []
         for item in self.treeWidget.selectedItems():
             trial = self.projectSettings.getTrialFromId(item.text(0))
-            if trial.state == "Waiting":
+            if trial is not None and trial.state == "Waiting":
                 selectedTrials.append(trial)
 
         # create the run dialog
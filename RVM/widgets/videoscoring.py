@@ -10,18 +10,39 @@ TODO: create a mutex that will hold the cv2 capture and helper methods (i.e. a m
 """
 
 import datetime
+import logging
+import math
 import os
+import time
+from collections import deque
 
 import cv2
 import numpy as np
 from PyQt6 import QtCore, QtGui, QtWidgets
-from PyQt6.QtCore import (QMutex, QObject, Qt, QThread, QTimer, pyqtSignal,
-                          pyqtSlot)
+from PyQt6.QtCore import QMutex, QObject, Qt, QThread, QTimer, pyqtSignal, pyqtSlot
 from PyQt6.QtGui import QAction, QIcon, QImage, QPixmap
-from PyQt6.QtWidgets import (QApplication, QLabel, QMainWindow, QMenuBar,
-                             QStatusBar, QToolBar, QVBoxLayout, QWidget)
+from PyQt6.QtWidgets import (
+    QApplication,
+    QLabel,
+    QMainWindow,
+    QMenuBar,
+    QStatusBar,
+    QToolBar,
+    QVBoxLayout,
+    QWidget,
+)
 
-from RVM.camera.camThreads import previewer, vidAnalysis, vidReader
+from RVM.camera.camThreads import vidAnalysis
+from RVM.camera.frameCache import PrefetchReader
+from RVM.camera.frameIndex import FrameIndex, IndexedCapture, frameIndexer
+from RVM.widgets.timeline import TimelineStrip
+
+log = logging.getLogger()
+
+# playback speeds, as multiples of the native frame rate
+SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+# faster playback shows every nth frame instead of more frames per second
+MAX_DISPLAY_FPS = 60
 
 
 class videoPlayerSignals(QObject):
@@ -35,13 +56,17 @@ class videoPlayer(QObject):
         super(videoPlayer, self).__init__()
         self.signals = videoPlayerSignals()
         self.vc = vc
+        # decodes ahead of playback and keeps recently shown frames
+        self.reader = PrefetchReader(vc)
+        # a low resolution copy of the video with the same frames, for scrubbing
+        self.proxyReader = None
         self.mutex = QMutex()
         self.running = False
         self.paused = False
         self.frame = None
         self.frameRate = fps
         self.frameCount = 0
-        self.frameCountMax = int(self.vc.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frameCountMax = len(self.reader) - 1
         self.frameCountMin = 0
         self.frameCountStep = 1
         self.frameCountStepMax = 100
@@ -52,41 +77,104 @@ class videoPlayer(QObject):
         self.dnow = self.startTime
         self.lastFrame = []
         self.cont = True
-        self.run()
+        # playback is paced by a monotonic clock: the frame to show is computed
+        # from the time since the clock was started, timers only wake the loop
+        self.clockStart = time.perf_counter()
+        self.clockFrame = 0
+        self.lastTick = -1
+        self.displayTimes = deque(maxlen=120)
+        self.setSpeed(1.0)
 
     @pyqtSlot()
     def run(self) -> None:
         """Run this function when this thread is started. Collect a frame and return to the gui"""
 
         self.timer = QTimer()
+        self.timer.setSingleShot(True)
         self.timer.timeout.connect(self.loop)
         self.timer.setTimerType(Qt.TimerType.PreciseTimer)
-        self.timer.start(self.mspf)
+        self.resetClock()
+        self.timer.start(0)
         self.timerRunning = True
 
+    def setSpeed(self, speed: float):
+        """Play at a multiple of the native frame rate, between 0.25x and 32x
+
+        At most MAX_DISPLAY_FPS frames are shown per second, at higher rates only every ``stride``th frame is shown and the reader skips the others without decoding them where the codec allows.
+        """
+        self.speed = min(max(speed, SPEEDS[0]), SPEEDS[-1])
+        self.stride = max(1, math.ceil(self.frameRate * self.speed / MAX_DISPLAY_FPS))
+        self.displayFPS = self.frameRate * self.speed / self.stride
+        self.reader.stride = self.stride
+        self.displayTimes.clear()
+        self.resetClock()
+
+    def faster(self):
+        self.setSpeed(next((s for s in SPEEDS if s > self.speed), SPEEDS[-1]))
+
+    def slower(self):
+        self.setSpeed(next((s for s in reversed(SPEEDS) if s < self.speed), SPEEDS[0]))
+
+    def togglePause(self):
+        self.paused = not self.paused
+        self.resetClock()
+
+    def resetClock(self):
+        """Restart the playback clock from the current frame"""
+        self.clockStart = time.perf_counter()
+        self.clockFrame = self.frameCount
+        self.lastTick = -1
+
     def loop(self):
         """run this on each loop iteration"""
         self.lastTime = self.dnow
         self.dnow = datetime.datetime.now()
         if self.paused:
+            self.timer.start(50)
             return
-        frame = self.readFrame()  # read the frame
-        # emit the frame
-        if frame is not None:
-            self.sendFrame(frame)
-        else:
-            print("no frame")
+        now = time.perf_counter()
+        tick = int((now - self.clockStart) * self.displayFPS)
+        if tick != self.lastTick:
+            self.lastTick = tick
+            self.frameCount = min(
+                self.clockFrame + tick * self.stride, self.frameCountMax
+            )
+            frame = self.readFrame()  # read the frame
+            # emit the frame
+            if frame is not None:
+                self.sendFrame(frame)
+                self.displayTimes.append(time.perf_counter())
+            else:
+                print("no frame")
+            if self.frameCount >= self.frameCountMax:
+                self.paused = True
+        # sleep until the next frame is due
+        deadline = self.clockStart + (self.lastTick + 1) / self.displayFPS
+        self.timer.start(max(0, math.ceil((deadline - time.perf_counter()) * 1000)))
+
+    def playbackStats(self) -> dict:
+        """The achieved display rate and decode cost at the current speed, with the reader statistics"""
+        times = self.displayTimes
+        achieved = 0.0
+        if len(times) > 1 and times[-1] > times[0]:
+            achieved = (len(times) - 1) / (times[-1] - times[0])
+        stats = self.reader.stats()
+        stats.update(
+            speed=self.speed,
+            stride=self.stride,
+            target_fps=self.displayFPS,
+            display_fps=achieved,
+        )
+        return stats
 
     @pyqtSlot()
     def readFrame(self):
         """get a frame from the camera"""
         try:
-            # lock the mutex
-            self.mutex.lock()
-            # read the frame
-            frame = self.vc.read()[1]
-            # increment the frame count
-            self.frameCount = self.frameCount + self.frameCountStep
+            # the frame comes from the cache, or waits for the reader to decode it
+            frame = self.reader.frame(self.frameCount)
+            if frame is None:
+                raise ValueError(f"could not read frame {self.frameCount}")
         except Exception as e:
             if len(str(e)) > 0:
                 print(f"Error collecting frame: {e}", True)
@@ -112,10 +200,44 @@ class videoPlayer(QObject):
             and self.frameCount <= self.frameCountMax
         ), "frame count out of bounds"
 
-        self.vc.set(cv2.CAP_PROP_POS_FRAMES, self.frameCount)
         frame = self.readFrame()
         if frame is not None:
             self.sendFrame(frame)
+        self.resetClock()
+
+    def seekTo(self, frameCount: int):
+        """seek to an absolute frame"""
+        self.seek(frameCount - self.frameCount)
+
+    def setProxy(self, path):
+        """scrub through a proxy of the video, ignored if its frames do not match the video"""
+        capture = IndexedCapture(path, FrameIndex.loadOrBuild(path))
+        # container frame counts can be off by a frame until the video is indexed
+        if abs(len(capture) - len(self.reader)) > 1:
+            log.warning(
+                f"Not using proxy {path}, it has {len(capture)} frames and the video {len(self.reader)}"
+            )
+            capture.release()
+            return
+        if self.proxyReader is not None:
+            self.proxyReader.close()
+        self.proxyReader = PrefetchReader(capture, read_ahead=10)
+
+    def scrubTo(self, frameCount: int):
+        """show a frame from the proxy while scrubbing, the original frame is read by ``seekTo`` once scrubbing ends"""
+        if self.proxyReader is None:
+            self.seekTo(frameCount)
+            return
+        self.frameCount = max(self.frameCountMin, min(frameCount, self.frameCountMax))
+        frame = self.proxyReader.frame(self.frameCount)
+        if frame is not None:
+            self.sendFrame(frame)
+        self.resetClock()
+
+    def setIndex(self, index):
+        """start seeking with a frame index"""
+        self.reader.setIndex(index)
+        self.frameCountMax = len(index) - 1
 
     def sendFrame(self, frame):
         """send the frame to the gui"""
@@ -127,7 +249,9 @@ class videoPlayer(QObject):
             self.timer.stop()
         self.running = False
         self.timerRunning = False
-        self.vc.release()
+        self.reader.close()
+        if self.proxyReader is not None:
+            self.proxyReader.close()
 
 
 class VideoScoringWidget(QtWidgets.QMainWindow):
@@ -154,14 +278,17 @@ class VideoScoringWidget(QtWidgets.QMainWindow):
         self.centralWidget.setLayout(QtWidgets.QVBoxLayout())
         self.centralWidget.layout().addWidget(self.prevWindow)
 
-        self.cap = cv2.VideoCapture(
+        self.videoPath = (
             r"H:\D-E mice Recording Backup\FiPho-230208\d91\FiPho-230208_d91_Cam1.avi"
         )
-        self.playerWorker = videoPlayer(self.cap, fps=self.cap.get(cv2.CAP_PROP_FPS))
+        self.cap = IndexedCapture(self.videoPath)
+        # read these before the player's reader thread starts using the capture
         self.resize(
             int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
             int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
         )
+        self.playerWorker = videoPlayer(self.cap, fps=self.cap.get(cv2.CAP_PROP_FPS))
+        self.indexVideo()
         # play button
         self.played = False
         self.playButton = QtWidgets.QPushButton("Play")
@@ -169,14 +296,85 @@ class VideoScoringWidget(QtWidgets.QMainWindow):
         self.playButton.clicked.connect(self.playVideo)
         self.centralWidget.layout().addWidget(self.playButton)
 
+        # an overview of the video to scrub through
+        self.timeline = TimelineStrip()
+        self.timeline.setVideo(
+            self.videoPath,
+            self.playerWorker.frameCountMax / self.playerWorker.frameRate,
+        )
+        # drag through the proxy, if there is one, and land on the original frame
+        self.timeline.signals.seekRequested.connect(
+            lambda seconds: self.playerWorker.scrubTo(
+                int(seconds * self.playerWorker.frameRate)
+            )
+        )
+        self.timeline.signals.seekFinished.connect(
+            lambda seconds: self.playerWorker.seekTo(
+                int(seconds * self.playerWorker.frameRate)
+            )
+        )
+        self.loadProxy()
+        self.centralWidget.layout().addWidget(self.timeline)
+        if self.mainWin is not None:
+            job = self.mainWin.startThumbnails([self.videoPath])
+            job.signals.progress.connect(lambda *args: self.timeline.reload())
+
+        # playback cache statistics
+        self.statsLabel = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.statsLabel)
+        self.statsTimer = QTimer(self)
+        self.statsTimer.timeout.connect(self.updateStats)
+        self.statsTimer.start(1000)
+
         self.show()
 
+    def loadProxy(self):
+        """scrub through the proxy of the video's trial if it is current"""
+        if self.mainWin is None or self.mainWin.projectSettings is None:
+            return
+        for trial in self.mainWin.projectSettings.trials:
+            if (
+                trial.video_location is not None
+                and os.path.normpath(trial.video_location)
+                == os.path.normpath(self.videoPath)
+                and trial.proxy is not None
+                and trial.proxy.isCurrent(self.videoPath)
+            ):
+                try:
+                    self.playerWorker.setProxy(str(trial.proxy.location))
+                except Exception as e:
+                    self.mainWin.updateStatus(f"Could not open the proxy: {e}")
+                return
+
+    def updateStats(self):
+        stats = self.playerWorker.playbackStats()
+        self.statsLabel.setText(
+            f"{stats['speed']:g}x at {stats['display_fps']:.0f}/{stats['target_fps']:.0f} fps | Decode {stats['decode_ms']:.1f} ms | Cache hits {stats['hit_rate']:.0%} | Stalls {stats['stalls']} ({stats['stall_time']:.1f} s) | Cached {stats['cached_bytes'] / 1e6:.0f} MB"
+        )
+
+    def indexVideo(self):
+        """load or build the frame index of the video in the background, the player seeks with it once it is ready"""
+        self.indexerThread = QThread()
+        self.indexerWorker = frameIndexer([self.videoPath])
+        self.indexerWorker.moveToThread(self.indexerThread)
+        self.indexerThread.started.connect(self.indexerWorker.run)
+        self.indexerWorker.signals.finished.connect(self.indexerThread.quit)
+        self.indexerWorker.signals.indexed.connect(
+            lambda path, index: self.playerWorker.setIndex(index)
+        )
+        if self.mainWin is not None:
+            self.indexerWorker.signals.error.connect(self.mainWin.updateStatus)
+        self.indexerThread.start()
+
     def updatePrevWindow(self, frame: np.ndarray, *args, **kwargs) -> None:
         """Update the display with the new pixmap"""
         image = QImage(
             frame, frame.shape[1], frame.shape[0], QImage.Format.Format_RGB888
         ).rgbSwapped()
         self.prevWindow.setPixmap(QPixmap.fromImage(image))
+        self.timeline.setPosition(
+            self.playerWorker.frameCount / self.playerWorker.frameRate
+        )
 
     def playVideo(self):
         """play the video"""
@@ -192,7 +390,11 @@ class VideoScoringWidget(QtWidgets.QMainWindow):
     # override the key press event
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key.Key_Space:
-            self.playerWorker.paused = not self.playerWorker.paused
+            self.playerWorker.togglePause()
+        elif event.key() == QtCore.Qt.Key.Key_Up:
+            self.playerWorker.faster()
+        elif event.key() == QtCore.Qt.Key.Key_Down:
+            self.playerWorker.slower()
         elif event.key() == QtCore.Qt.Key.Key_Left:
             self.playerWorker.seek(-10)
         elif event.key() == QtCore.Qt.Key.Key_Right:
@@ -206,6 +408,10 @@ class VideoScoringWidget(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         """close the camera when the window is closed"""
+        self.statsTimer.stop()
+        self.indexerWorker.stop()
+        self.indexerThread.quit()
+        self.indexerThread.wait()
         self.playerWorker.stop()
         if self.playerThread is not None and self.playerThread.isRunning():
             self.playerThread.quit()
@@ -0,0 +1,100 @@
+# aligning all events at once against looking up one event at a time, run with pytest or for bigger numbers
+# with python -m benchmarks.test_alignment [events ...]
+import bisect
+import sys
+import time
+
+import numpy as np
+
+from RVM.bases.base import AlignmentBase
+from RVM.data.alignment import FrameClock, alignEvents, toVideoTime
+
+FPS = 30.0
+RESOLUTION = 0.01
+
+
+def makeClock(seconds: float, seed: int = 0) -> FrameClock:
+    """A clock with jittered frame timestamps, like a camera that doesn't keep its rate"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * FPS)
+    timestamps = np.arange(n) / FPS + rng.uniform(0, 0.2 / FPS, n)
+    return FrameClock(timestamps=timestamps)
+
+
+def makeEvents(n: int, seconds: float, seed: int = 0) -> dict:
+    """``n`` MedPC timestamps in ticks split over three events, some past the end of the video"""
+    rng = np.random.default_rng(seed)
+    ticks = np.sort(rng.integers(0, int(1.1 * seconds / RESOLUTION), n))
+    return {name: ticks[i::3] for i, name in enumerate(["CS+", "CS-", "Shock"])}
+
+
+def loopAlign(events: dict, clock: FrameClock, offset: float, pre: float, post: float):
+    """One event at a time with bisect, then a validated model"""
+    timestamps = clock.timestamps.tolist()
+    end = timestamps[-1] + 1.0 / clock.fps
+    frames = {}
+    windows = {}
+    for name, ticks in events.items():
+        frames[name] = []
+        windows[name] = []
+        for tick in ticks.tolist():
+            t = offset + tick * RESOLUTION
+            frame = bisect.bisect_right(timestamps, t) - 1
+            outside = frame < 0 or t >= end or frame >= clock.n_frames
+            frames[name].append(-1 if outside else frame)
+            first = bisect.bisect_left(timestamps, t - pre)
+            last = bisect.bisect_left(timestamps, t + post)
+            windows[name].append(
+                [min(first, clock.n_frames), min(last, clock.n_frames)]
+            )
+    return AlignmentBase(
+        resolution=RESOLUTION,
+        offset=offset,
+        drift=0.0,
+        fps=clock.fps,
+        pre=pre,
+        post=post,
+        frames=frames,
+        windows=windows,
+    )
+
+
+def compare(n: int) -> tuple:
+    """Align ``n`` events both ways and check they agree, returns (loop ms, vectorized ms)"""
+    seconds = 3600.0
+    clock = makeClock(seconds)
+    events = makeEvents(n, seconds)
+    kwargs = dict(offset=-2.5, pre=5.0, post=10.0)
+    start = time.perf_counter()
+    looped = loopAlign(events, clock, **kwargs)
+    loopTime = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    aligned = alignEvents(events, clock, resolution=RESOLUTION, **kwargs)
+    alignTime = (time.perf_counter() - start) * 1000
+    assert aligned.frames == looped.frames
+    assert aligned.windows == looped.windows
+    return loopTime, alignTime
+
+
+def report(n: int, loop: float, vectorized: float):
+    print(
+        f"\n{n} events: one at a time {loop:.0f} ms, all at once {vectorized:.0f} ms ({loop / vectorized:.1f}x)"
+    )
+
+
+def test_alignment():
+    n = 30000
+    loop, vectorized = compare(n)
+    report(n, loop, vectorized)
+    assert vectorized < loop
+
+
+def test_constantRate():
+    clock = FrameClock(fps=FPS, n_frames=300)
+    times = toVideoTime(np.array([0, 100, 940, 960]), RESOLUTION, offset=0.5)
+    assert clock.frames(times).tolist() == [15, 45, 297, -1]
+
+
+if __name__ == "__main__":
+    for n in map(int, sys.argv[1:] or [1000000]):
+        report(n, *compare(n))
@@ -0,0 +1,94 @@
+# changing the camera flags and polling the latest frame while the reader is blocked in a read, against taking
+# the device lock, which every flag change used to need. Run with pytest or with
+# python -m benchmarks.test_cameraFlags [seconds]
+import sys
+import time
+
+import numpy as np
+from PyQt6.QtCore import QCoreApplication, Qt, QThread
+
+from RVM.camera.camera import VideoCapture
+from RVM.camera.camThreads import vidReader
+
+# seconds a read blocks, like a camera waiting for its next frame at 30 fps
+READ_TIME = 0.03
+
+
+class FakeDevice:
+    """A device whose reads block for ``read_time`` and return a new image every time"""
+
+    def __init__(self, read_time: float = READ_TIME):
+        self.read_time = read_time
+        self.reads = 0
+
+    def read(self):
+        time.sleep(self.read_time)
+        self.reads += 1
+        return True, np.full((48, 64, 3), self.reads % 256, dtype=np.uint8)
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        pass
+
+
+def measure(seconds: float = 2.0, read_time: float = READ_TIME) -> dict:
+    """Run a reader on a fake device and time the calls the gui makes while it reads, returns name -> latencies in ms"""
+    # the reader's timer needs an application, kept alive until the reader stopped
+    app = QCoreApplication.instance() or QCoreApplication([])
+    vc = VideoCapture(0, "benchmark", fps=30, prevFPS=15, recFPS=30)
+    vc.camDevice = FakeDevice(read_time)
+    vc.connected = True
+    vc.setFlags(previewing=True)
+    thread = QThread()
+    reader = vidReader(vc)
+    reader.moveToThread(thread)
+    thread.started.connect(reader.run)
+    # nothing runs an event loop here, quit from the reader thread
+    reader.signals.finished.connect(thread.quit, Qt.ConnectionType.DirectConnection)
+    thread.start()
+    rng = np.random.default_rng(0)
+    timings = {"setFlags": [], "latest frame": [], "device lock": []}
+    time.sleep(0.2)
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        vc.setFlags(writing=False)
+        timings["setFlags"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        vc.frame
+        timings["latest frame"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        vc.lock()
+        vc.unlock()
+        timings["device lock"].append(time.perf_counter() - start)
+        # land anywhere in the frame period
+        time.sleep(rng.uniform(0, vc.mspf / 1000))
+    stop = time.perf_counter()
+    vc.setFlags(previewing=False)
+    assert thread.wait(2000), "the reader did not stop"
+    timings["stop reader"] = [time.perf_counter() - stop]
+    assert vc.bus.published > 0 and vc.frame is not None
+    return {name: np.array(values) * 1000 for name, values in timings.items()}
+
+
+def report(timings: dict):
+    print()
+    for name, values in timings.items():
+        print(f"  {name:13} mean {values.mean():7.3f} ms   max {values.max():7.3f} ms")
+
+
+def test_flagsDontWaitForReads():
+    timings = measure()
+    report(timings)
+    reads = READ_TIME * 1000
+    assert timings["setFlags"].max() < reads / 10
+    assert timings["latest frame"].max() < reads / 10
+    # the reader holds the lock for most of every frame period
+    assert timings["device lock"].mean() > timings["setFlags"].max()
+    assert timings["stop reader"][0] < 4 * reads
+
+
+if __name__ == "__main__":
+    report(measure(float(sys.argv[1]) if len(sys.argv) > 1 else 10.0))
@@ -0,0 +1,124 @@
+# seeking with the frame index against seeking with CAP_PROP_POS_FRAMES, run with pytest or on real videos
+# with python -m benchmarks.test_frameIndex [video ...]
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from RVM.camera.frameIndex import FrameIndex, IndexedCapture
+
+SEEKS = 40
+# the frame number is drawn in binary along the top, a black or white block per bit
+BLOCK = 32
+BITS = 12
+
+
+def writeVideo(path: str, fourcc: str, frames: int = 600, size=(640, 480)):
+    """A video whose frames show their own number, see ``frameNumber``"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), 30, size)
+    rng = np.random.default_rng(0)
+    # noise so the frames compress like camera images rather than flat colors
+    noise = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    for frame in range(frames):
+        image = np.roll(noise, frame * 3, axis=1)
+        for bit in range(BITS):
+            image[:BLOCK, bit * BLOCK : (bit + 1) * BLOCK] = 255 * (frame >> bit & 1)
+        writer.write(image)
+    writer.release()
+
+
+def frameNumber(image: np.ndarray) -> int:
+    """The number drawn into a frame by ``writeVideo``"""
+    # the middle of the blocks, away from the noise bleeding in at the edges
+    middle = image[BLOCK // 4 : 3 * BLOCK // 4, : BITS * BLOCK]
+    bits = middle.reshape(middle.shape[0], BITS, BLOCK, -1)[
+        :, :, BLOCK // 4 : 3 * BLOCK // 4
+    ]
+    return sum(
+        1 << bit for bit, value in enumerate(bits.mean(axis=(0, 2, 3))) if value > 127
+    )
+
+
+def seekLatencies(path: str, index: FrameIndex, targets: np.ndarray, check: bool):
+    """Seek to and read every target, returns the latencies in ms"""
+    cap = IndexedCapture(path, index)
+    latencies = []
+    try:
+        for frame in targets.tolist():
+            start = time.perf_counter()
+            cap.seek(frame)
+            ok, image = cap.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert ok
+            if check:
+                assert frameNumber(image) == frame
+    finally:
+        cap.release()
+    return np.array(latencies)
+
+
+def compare(path: str, check: bool = True) -> dict:
+    """Median seek and read latencies in ms, (POS_FRAMES, indexed) for random seeks and +-10 frame steps"""
+    index = FrameIndex.loadOrBuild(path, save=False)
+    rng = np.random.default_rng(1)
+    n = len(index)
+    targets = {
+        "random": rng.integers(0, n, SEEKS),
+        "steps": np.clip(np.cumsum(rng.choice([-10, 10], SEEKS)) + n // 2, 0, n - 1),
+    }
+    return {
+        name: tuple(
+            float(np.median(seekLatencies(path, use, frames, check)))
+            for use in (None, index)
+        )
+        for name, frames in targets.items()
+    }
+
+
+def report(name: str, results: dict):
+    print(f"\n{name}")
+    for kind, (pos, indexed) in results.items():
+        print(f"  {kind:7} POS_FRAMES {pos:7.1f} ms   indexed {indexed:7.1f} ms")
+
+
+def test_mjpg(tmp_path):
+    path = str(tmp_path / "mjpg.avi")
+    writeVideo(path, "MJPG")
+    results = compare(path)
+    report("MJPG 640x480", results)
+    assert FrameIndex.loadOrBuild(path, save=False).standalone
+    assert results["random"][1] < results["random"][0]
+
+
+def test_mpeg4(tmp_path):
+    path = str(tmp_path / "mp4v.mp4")
+    writeVideo(path, "mp4v")
+    results = compare(path)
+    # every seek landed on the right frame, the gain depends on the length of the
+    # groups of pictures, which opencv writes short (12 frames) for MPEG-4
+    report("MPEG-4 640x480", results)
+
+
+def test_indexSavedAndInvalidated(tmp_path):
+    path = str(tmp_path / "mjpg.avi")
+    writeVideo(path, "MJPG", frames=30)
+    FrameIndex.loadOrBuild(path)
+    assert FrameIndex.load(path) is not None
+    writeVideo(path, "MJPG", frames=40)
+    assert FrameIndex.load(path) is None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            # real videos don't show their frame numbers
+            report(path, compare(path, check=False))
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for fourcc, name in (("MJPG", "mjpg.avi"), ("mp4v", "mp4v.mp4")):
+                path = os.path.join(tmp_dir, name)
+                writeVideo(path, fourcc, frames=1200, size=(1280, 720))
+                report(f"{fourcc} 1280x720", compare(path))
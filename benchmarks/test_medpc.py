@@ -0,0 +1,108 @@
+# the numpy MedPC array parser against the old per cell parser, run with pytest or for bigger numbers with
+# python -m benchmarks.test_medpc [values ...]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from RVM.data.loader import Loader
+from RVM.data.medpc import readArray, splitEvents
+
+# CS+, CS-, Shock and some codes that are not read
+CODES = [6, 13, 19, 1, 2, 25]
+
+
+def writeSession(path: str, n: int, seed: int = 0):
+    """Write a MedPC file with ``n`` events in the C array, 5 to a row like MedPC does"""
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(rng.integers(0, 4 * 3600 * 100, n))
+    values = [float(f"{t}.{c}") for t, c in zip(timestamps, rng.choice(CODES, n))]
+    lines = [
+        "File: benchmark",
+        "",
+        "Start Date: 03/01/23",
+        "End Date: 03/01/23",
+        "Subject: 12",
+        "Box: 3",
+        "Start Time: 10:00:00",
+        "End Time: 14:00:00",
+        "MSN: FearCond",
+        "A:      12.000",
+        "C:",
+    ]
+    for row in range(0, n, 5):
+        cells = "".join(f"{v:13.3f}" for v in values[row : row + 5])
+        lines.append(f"{row:6d}:{cells}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def oldOutDf(path: str, tmp_dir: str) -> pd.DataFrame:
+    """What Loader.loadShockTxt did before: the array through a temp csv and iterrows"""
+    with open(path, "r") as f:
+        lines = f.readlines()
+    start = next(i for i, line in enumerate(lines) if line.__contains__("C:\n"))
+    temp = os.path.join(tmp_dir, "temp.txt")
+    with open(temp, "w") as f:
+        f.writelines(lines[start + 1 :])
+    df = pd.read_csv(temp, sep=r"\s+", header=None)
+    df = df.drop(df.columns[0], axis=1)
+    columns = {"6": [], "13": [], "19": []}
+    for row in df.iterrows():
+        for col in row[1]:
+            ts, ts_type = str(col).split(".")
+            if ts_type in columns:
+                columns[ts_type].append(ts)
+    max_len = max(len(c) for c in columns.values())
+    outdf = pd.DataFrame()
+    for name, code in (("CS+", "6"), ("CS-", "13"), ("Shock", "19")):
+        outdf[f"{name} TS's"] = columns[code] + [None] * (max_len - len(columns[code]))
+    return outdf
+
+
+def compare(n: int, tmp_dir: str) -> tuple:
+    """Parse a session with ``n`` values both ways and check they agree, returns (old ms, new ms)"""
+    path = os.path.join(tmp_dir, "session.txt")
+    writeSession(path, n)
+    start = time.perf_counter()
+    old = oldOutDf(path, tmp_dir)
+    oldTime = (time.perf_counter() - start) * 1000
+    loader = Loader()
+    start = time.perf_counter()
+    loader.loadShockTxt(path)
+    newTime = (time.perf_counter() - start) * 1000
+    assert loader.outdf.equals(old)
+    for name, column in loader.events.items():
+        assert loader.events[name].dtype == np.int64
+        expected = old[f"{name} TS's"].dropna().astype(np.int64).to_numpy()
+        assert np.array_equal(column, expected)
+    return oldTime, newTime
+
+
+def report(n: int, old: float, new: float):
+    print(f"\n{n} values: old {old:.0f} ms, new {new:.0f} ms ({old / new:.1f}x)")
+
+
+def test_medpc(tmp_path):
+    n = 20000
+    old, new = compare(n, str(tmp_path))
+    report(n, old, new)
+    assert new < old
+
+
+def test_codesAsWritten():
+    values = readArray(["     0:        5.600        7.060       8.190       9.130\n"])
+    events = splitEvents(values)
+    # "06" is not the CS+ code "6"
+    assert events["CS+"].tolist() == [5]
+    assert events["Shock"].tolist() == [8]
+    assert events["CS-"].tolist() == [9]
+
+
+if __name__ == "__main__":
+    for n in map(int, sys.argv[1:] or [200000]):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report(n, *compare(n, tmp_dir))
@@ -0,0 +1,141 @@
+# the trial index against looping over the trial objects, run with pytest or for bigger numbers with
+# python -m benchmarks.test_trialIndex [trials ...]
+import datetime
+import sys
+import timeit
+from collections import defaultdict
+
+import numpy as np
+
+from RVM.bases import Animal, Box, ProjectSettings, Trial
+
+STATES = ["Waiting", "Running", "Finished"]
+
+
+def makeProject(n: int, animals: int = 40, boxes: int = 16) -> ProjectSettings:
+    """A project with ``n`` trials spread over the animals, boxes, states and about 4 months"""
+    animalList = [Animal(uid=f"a{i}") for i in range(animals)]
+    boxList = [Box(uid=f"b{i}", camera="cam") for i in range(boxes)]
+    first = datetime.datetime(2023, 1, 1)
+    trials = []
+    for i in range(n):
+        start = first + datetime.timedelta(minutes=7 * i % 175000)
+        trials.append(
+            Trial(
+                uid=f"t{i}",
+                animal=animalList[i % animals],
+                box=boxList[i % boxes],
+                state=STATES[i % len(STATES)],
+                start_time=start,
+                end_time=start + datetime.timedelta(seconds=600 + i % 1200),
+            )
+        )
+    return ProjectSettings(animals=animalList, boxes=boxList, trials=trials)
+
+
+def scanFilter(trials, states, start, end):
+    """What the trial manager did before the index"""
+    return [
+        trial
+        for trial in trials
+        if trial.state in states
+        and trial.start_time is not None
+        and start <= trial.start_time < end
+    ]
+
+
+def scanMeanDuration(trials):
+    total = defaultdict(float)
+    count = defaultdict(int)
+    for trial in trials:
+        if trial.start_time is None or trial.end_time is None:
+            continue
+        total[trial.box.uid] += (trial.end_time - trial.start_time).total_seconds()
+        count[trial.box.uid] += 1
+    return {box: total[box] / count[box] for box in total}
+
+
+def scanPerAnimalWeek(trials):
+    counts = defaultdict(int)
+    for trial in trials:
+        day = trial.start_time.date()
+        monday = day - datetime.timedelta(days=day.weekday())
+        counts[(trial.animal.uid, monday)] += 1
+    return dict(counts)
+
+
+def best(fn, number: int = 5) -> float:
+    """The fastest of ``number`` runs in ms"""
+    return min(timeit.repeat(fn, number=1, repeat=number)) * 1000
+
+
+def compare(n: int) -> dict:
+    """Check the index gives the same answers as the scans and time both, returns name -> (scan ms, index ms)"""
+    projectSettings = makeProject(n)
+    trials = projectSettings.trials
+    index = projectSettings.trialIndex
+    start = datetime.datetime(2023, 2, 1)
+    end = datetime.datetime(2023, 3, 1)
+
+    def indexFilter():
+        return index.trials(index.filter(states=["Finished"], start=start, end=end))
+
+    assert indexFilter() == scanFilter(trials, ["Finished"], start, end)
+    means = index.groupBy("box", index.duration, "mean")
+    expected = scanMeanDuration(trials)
+    assert means.keys() == expected.keys()
+    assert np.allclose([means[k] for k in expected], list(expected.values()))
+    assert index.groupBy(["animal", "week"]) == scanPerAnimalWeek(trials)
+
+    return {
+        "filter": (
+            best(lambda: scanFilter(trials, ["Finished"], start, end)),
+            best(indexFilter),
+        ),
+        "mean duration by box": (
+            best(lambda: scanMeanDuration(trials)),
+            best(lambda: index.groupBy("box", index.duration, "mean")),
+        ),
+        "trials per animal per week": (
+            best(lambda: scanPerAnimalWeek(trials)),
+            best(lambda: index.groupBy(["animal", "week"])),
+        ),
+        "update, nothing changed": (
+            None,
+            best(lambda: projectSettings.trialIndex),
+        ),
+    }
+
+
+def report(n: int, results: dict):
+    print(f"\n{n} trials")
+    for name, (scan, indexed) in results.items():
+        scan = f"{scan:8.2f} ms" if scan is not None else f"{'-':>8}   "
+        print(f"  {name:28} scan {scan}   index {indexed:8.2f} ms")
+
+
+def test_trialIndex():
+    n = 5000
+    results = compare(n)
+    report(n, results)
+    # the index also returns the trial objects, so the filter gains less than the summaries
+    assert results["mean duration by box"][1] < results["mean duration by box"][0]
+    assert (
+        results["trials per animal per week"][1]
+        < results["trials per animal per week"][0]
+    )
+
+
+def test_editUpdatesRow():
+    projectSettings = makeProject(100)
+    projectSettings.trialIndex
+    projectSettings.trials[10].state = "Running"
+    index = projectSettings.trialIndex
+    assert index.trials(index.filter(states=["Running"])) == [
+        trial for trial in projectSettings.trials if trial.state == "Running"
+    ]
+
+
+if __name__ == "__main__":
+    for n in map(int, sys.argv[1:] or [50000]):
+        report(n, compare(n))
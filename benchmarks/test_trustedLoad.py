@@ -0,0 +1,61 @@
+# loading a project written by RVM without validation against the validated load, run with pytest or for
+# bigger numbers with python -m benchmarks.test_trustedLoad [trials ...]
+import sys
+import tempfile
+import time
+
+from RVM.bases import ProjectSettings, currentRevision
+from benchmarks.test_trialIndex import makeProject
+
+
+def timeLoad(dir_path: str, trusted: bool, repeat: int = 3):
+    """The fastest load of ``repeat`` in ms, and the settings it loaded"""
+    times = []
+    for _ in range(repeat):
+        projectSettings = ProjectSettings()
+        start = time.perf_counter()
+        fast = projectSettings.load(dir_path, check=False, trusted=trusted)
+        times.append((time.perf_counter() - start) * 1000)
+        assert fast == trusted
+    return min(times), projectSettings
+
+
+def compare(n: int, dir_path: str) -> tuple:
+    """Save a project with ``n`` trials, load it both ways and check they agree, returns (validated ms, trusted ms)"""
+    projectSettings = makeProject(n)
+    projectSettings.project_name = "benchmark"
+    projectSettings.save(dir_path)
+    validatedTime, validated = timeLoad(dir_path, trusted=False)
+    revision = currentRevision()
+    trustedTime, trusted = timeLoad(dir_path, trusted=True)
+    # a load is not a change, it must not trigger an auto save
+    assert currentRevision() == revision
+    assert trusted.json() == validated.json()
+    assert trusted.findProblems() == []
+    return validatedTime, trustedTime
+
+
+def report(n: int, validated: float, trusted: float):
+    print(
+        f"\n{n} trials: validated {validated:.0f} ms, trusted {trusted:.0f} ms ({validated / trusted:.1f}x)"
+    )
+
+
+def test_trustedLoad(tmp_path):
+    n = 5000
+    validated, trusted = compare(n, str(tmp_path))
+    report(n, validated, trusted)
+    assert trusted < validated
+
+
+def test_editedFileIsValidated(tmp_path):
+    makeProject(10).save(tmp_path)
+    settings = tmp_path / "settings.json"
+    settings.write_text(settings.read_text().replace('"a1"', '"a 1"'))
+    assert not ProjectSettings().load(tmp_path, check=False)
+
+
+if __name__ == "__main__":
+    for n in map(int, sys.argv[1:] or [50000]):
+        with tempfile.TemporaryDirectory() as dir_path:
+            report(n, *compare(n, dir_path))